@@ -0,0 +1,342 @@
+import asyncio
+import os
+import re
+import uuid
+from datetime import datetime
+from urllib.parse import urlparse, parse_qs
+
+import anyio
+import httpx
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from scripts.settings import settings
+from scripts.booru_client import AsyncBooruClient, HostLimiters, default_cache
+from scripts.gelbooru_scraper import GelbooruScraper, GELBOORU_API_URL
+from scripts.author_counters import image_added_update, initial_counters
+from scripts.author_search import search_keys, tags_query
+from scripts.data_paths import data_url
+from scripts.thumbnails import prewarm
+
+# Imports posts by URL or ID as a background job: Danbooru metadata is fetched in
+# batches with `id:` searches, files are streamed to disk concurrently under a per-host
+# rate limit, and every item's state is recorded in import_jobs for progress reporting.
+# HTTP goes through the shared booru client (retries, keep-alive, response cache).
+
+TASK_ID = "importer"
+
+# Danbooru caps a page at 200 posts; keep the id: list comfortably below URL limits
+DANBOORU_BATCH_SIZE = 100
+
+# Gelbooru post IDs are offset so they can't collide with Danbooru IDs
+GELBOORU_ID_OFFSET = 1000000000
+
+SKIPPED_EXTENSIONS = ["mp4", "webm", "gif", "zip", "swf"]
+
+class ImportFailed(ValueError):
+    pass
+
+def parse_import_item(text):
+    """Post URL, "danbooru:<id>", "gelbooru:<id>" or a bare Danbooru ID -> (source, post_id)"""
+    text = text.strip()
+    match = re.fullmatch(r"(?:(danbooru|gelbooru):)?(\d+)", text)
+    if match:
+        return match.group(1) or "danbooru", int(match.group(2))
+    if "danbooru.donmai.us/posts/" in text:
+        post_id = text.split("/posts/")[-1].split("?")[0].split("#")[0]
+        if post_id.isdigit():
+            return "danbooru", int(post_id)
+    elif "gelbooru.com" in text:
+        post_id = parse_qs(urlparse(text).query).get("id", [""])[0]
+        if post_id.isdigit():
+            return "gelbooru", int(post_id)
+        raise ImportFailed("Could not parse ID from Gelbooru URL")
+    raise ImportFailed("Only Danbooru and Gelbooru URLs supported")
+
+def safe_dir_name(name):
+    """Folder name for an artist under settings.IMAGES_DIR (same rule as the scraper)"""
+    return "".join(c for c in name if c.isalnum() or c in (' ', '.', '_')).strip().replace(" ", "_")
+
+class BulkImporter:
+    def __init__(self, db, response_cache, concurrency=4, rate=2.0, timeout=30.0):
+        self.db = db
+        self.response_cache = response_cache
+        self.concurrency = concurrency
+        self.rate = rate
+        self.timeout = timeout
+        # Kept across jobs so a host that throttled us stays slowed down
+        self.limiters = HostLimiters(rate, rate, rate)
+        self.jobs = {}
+
+    async def get_json(self, client, url, params=None):
+        return await client.get_json(url, params=params)
+
+    # --- Metadata ---
+
+    async def fetch_danbooru(self, client, post_ids):
+        """{post_id: post} for the IDs that exist, one request per batch. Raises
+        ImportFailed with Danbooru's message when it answers with an error object."""
+        posts = {}
+        for i in range(0, len(post_ids), DANBOORU_BATCH_SIZE):
+            batch = post_ids[i:i + DANBOORU_BATCH_SIZE]
+            data = await self.get_json(client, f"{settings.DANBOORU_API_URL}/posts.json", params={
+                "tags": "id:" + ",".join(str(post_id) for post_id in batch),
+                "limit": len(batch)
+            })
+            if isinstance(data, dict):
+                # e.g. {"success": false, "message": "..."} for a timed-out search
+                raise ImportFailed(f"Danbooru error: {data.get('message') or data.get('error') or data}")
+            posts.update({post["id"]: post for post in data or [] if isinstance(post, dict) and "id" in post})
+        return posts
+
+    async def fetch_gelbooru(self, client, post_id):
+        data = await self.get_json(client, GELBOORU_API_URL, params={
+            "page": "dapi", "s": "post", "q": "index", "json": 1, "id": post_id
+        })
+        posts = data.get("post", []) if isinstance(data, dict) else data
+        if isinstance(posts, dict):
+            return posts
+        return posts[0] if posts else None
+
+    # --- Storage ---
+
+    async def resolve_author(self, artist_name):
+        artist = await self.db.authors.find_one({"name": artist_name})
+        if artist:
+            return artist["_id"]
+        artist_id = abs(hash(artist_name)) % 10000000
+        try:
+            await self.db.authors.update_one(
+                {"name": artist_name},
+                {
+                    "$set": {"_id": artist_id, "name": artist_name, "search_keys": search_keys(artist_name), "imported": True},
+                    "$setOnInsert": initial_counters()
+                },
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Another item of the job inserted this author first
+            artist = await self.db.authors.find_one({"name": artist_name})
+            if not artist:
+                raise
+            return artist["_id"]
+        return artist_id
+
+    async def gelbooru_artist(self, post):
+        # Gelbooru posts don't carry tag types; match the tags against known artists
+        tags = post.get("tags", "").split(" ")
+        potential_artists = await self.db.authors.find(tags_query(tags), {"name": 1}).to_list(length=1)
+        return potential_artists[0]["name"] if potential_artists else "Gelbooru_Import"
+
+    async def download(self, client, file_url, file_path):
+        """Stream to a temporary file and move it into place once complete"""
+        tmp_path = file_path + ".part"
+        try:
+            resp = await client.send(file_url, stream=True)
+            try:
+                resp.raise_for_status()
+                async with await anyio.open_file(tmp_path, "wb") as f:
+                    async for chunk in resp.aiter_bytes(256 * 1024):
+                        await f.write(chunk)
+            finally:
+                await resp.aclose()
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    async def store(self, client, source, post_id, post):
+        """Download one post and upsert it; returns the item result"""
+        if source == "danbooru":
+            artist_name = (post.get("tag_string_artist") or "unknown").split(" ")[0]
+            file_url = post.get("file_url")
+            ext = post.get("file_ext", "jpg")
+            filename = f"{post_id}.{ext}"
+        else:
+            artist_name = await self.gelbooru_artist(post)
+            file_url = post.get("file_url")
+            ext = file_url.split(".")[-1] if file_url else ""
+            filename = f"gelbooru_{post_id}.{ext}"
+
+        if not file_url:
+            raise ImportFailed("No file URL found in post")
+        if ext.lower() in SKIPPED_EXTENSIONS:
+            raise ImportFailed(f"Unsupported file type: {ext}")
+
+        artist_id = await self.resolve_author(artist_name)
+        artist_dir = os.path.join(settings.IMAGES_DIR, safe_dir_name(artist_name))
+        os.makedirs(artist_dir, exist_ok=True)
+        file_path = os.path.join(artist_dir, filename)
+
+        if not os.path.exists(file_path):
+            await self.download(client, file_url, file_path)
+        await asyncio.get_running_loop().run_in_executor(None, prewarm, file_path)
+
+        if source == "danbooru":
+            image_data = {
+                "_id": post_id,
+                "author_id": artist_id,
+                "author_name": artist_name,
+                "tags": post.get("tag_string"),
+                "file_url": file_url,
+                "width": post.get("image_width"),
+                "height": post.get("image_height"),
+                "created_at": post.get("created_at"),
+                "fetched_at": datetime.now(),
+                "source": "danbooru"
+            }
+        else:
+            image_data = GelbooruScraper().map_post_to_image_data(post, artist_id, artist_name)
+        image_data["local_path"] = file_path
+        image_data["url"] = data_url(file_path)
+
+        result = await self.db.images.update_one({"_id": image_data["_id"]}, {"$set": image_data}, upsert=True)
+        if result.upserted_id is not None:
+            await self.db.authors.update_one({"_id": artist_id}, image_added_update())
+        return {"status": "imported", "image_id": image_data["_id"], "author_id": artist_id}
+
+    # --- Jobs ---
+
+    async def import_one(self, text):
+        """Import a single URL/ID inline; raises ImportFailed or httpx.HTTPError"""
+        source, post_id = parse_import_item(text)
+        async with self.client() as client:
+            if source == "danbooru":
+                post = (await self.fetch_danbooru(client, [post_id])).get(post_id)
+            else:
+                post = await self.fetch_gelbooru(client, post_id)
+            if not post:
+                raise ImportFailed(f"Post not found on {source.capitalize()}")
+            result = await self.store(client, source, post_id, post)
+        await self.response_cache.bump("images", "authors")
+        return result
+
+    def client(self):
+        return AsyncBooruClient(
+            cache=default_cache(),
+            limiter_for=self.limiters,
+            max_connections=self.concurrency * 2,
+            timeout=self.timeout
+        )
+
+    async def start(self, inputs, skip_existing=True):
+        """Record the job and run it in the background; returns the job id"""
+        job_id = uuid.uuid4().hex[:12]
+        items = []
+        for text in inputs:
+            item = {"input": text, "status": "pending"}
+            try:
+                item["source"], item["post_id"] = parse_import_item(text)
+            except ImportFailed as e:
+                item.update(status="failed", detail=str(e))
+            items.append(item)
+
+        await self.db.import_jobs.insert_one({
+            "_id": job_id,
+            "status": "running",
+            "total": len(items),
+            "done": sum(1 for item in items if item["status"] == "failed"),
+            "failed": sum(1 for item in items if item["status"] == "failed"),
+            "items": items,
+            "created_at": datetime.now()
+        })
+        self.jobs[job_id] = asyncio.create_task(self.run(job_id, items, skip_existing))
+        return job_id
+
+    async def set_item(self, job_id, index, failed=False, **fields):
+        update = {"$set": {f"items.{index}.{key}": value for key, value in fields.items()}, "$inc": {"done": 1}}
+        if failed:
+            update["$inc"]["failed"] = 1
+        await self.db.import_jobs.update_one({"_id": job_id}, update)
+
+    async def update_status(self, status, done, total, message):
+        await self.db.system_status.update_one(
+            {"_id": TASK_ID},
+            {"$set": {
+                "status": status,
+                "progress": int(done / total * 100) if total else 100,
+                "current": done,
+                "total": total,
+                "message": message,
+                "updated_at": datetime.now()
+            }},
+            upsert=True
+        )
+
+    async def cancelled(self):
+        status = await self.db.system_status.find_one({"_id": TASK_ID}, {"control": 1})
+        return bool(status) and status.get("control") == "cancel"
+
+    async def run(self, job_id, items, skip_existing):
+        total = len(items)
+        done = sum(1 for item in items if item["status"] == "failed")
+        await self.db.system_status.update_one({"_id": TASK_ID}, {"$set": {"control": "running"}}, upsert=True)
+        await self.update_status("running", done, total, f"Importing {total} posts...")
+
+        pending = [i for i, item in enumerate(items) if item["status"] == "pending"]
+        try:
+            if skip_existing:
+                ids = [self.image_id(items[i]) for i in pending]
+                existing = set(await self.db.images.distinct("_id", {"_id": {"$in": ids}}))
+                for i in [i for i in pending if self.image_id(items[i]) in existing]:
+                    await self.set_item(job_id, i, status="exists", image_id=self.image_id(items[i]))
+                    done += 1
+                pending = [i for i in pending if self.image_id(items[i]) not in existing]
+                if existing:
+                    await self.update_status("running", done, total, f"Skipped {len(existing)} existing posts ({done}/{total})")
+
+            semaphore = asyncio.Semaphore(self.concurrency)
+            counts = {"imported": 0, "failed": 0}
+
+            async with self.client() as client:
+                danbooru_ids = [items[i]["post_id"] for i in pending if items[i]["source"] == "danbooru"]
+                lookup_error = None
+                try:
+                    danbooru_posts = await self.fetch_danbooru(client, danbooru_ids) if danbooru_ids else {}
+                except (httpx.HTTPError, ValueError) as e:
+                    lookup_error = f"Danbooru metadata lookup failed: {str(e) or type(e).__name__}"
+                    print(lookup_error)
+                    danbooru_posts = {}
+                    await self.db.import_jobs.update_one({"_id": job_id}, {"$set": {"error": lookup_error}})
+
+                async def import_item(i):
+                    nonlocal done
+                    item = items[i]
+                    async with semaphore:
+                        if await self.cancelled():
+                            return
+                        try:
+                            if item["source"] == "danbooru":
+                                post = danbooru_posts.get(item["post_id"])
+                            else:
+                                post = await self.fetch_gelbooru(client, item["post_id"])
+                            if not post:
+                                raise ImportFailed(lookup_error if item["source"] == "danbooru" and lookup_error else "Post not found")
+                            result = await self.store(client, item["source"], item["post_id"], post)
+                            await self.set_item(job_id, i, **result)
+                            counts["imported"] += 1
+                        except (ImportFailed, httpx.HTTPError, OSError, ValueError, PyMongoError) as e:
+                            await self.set_item(job_id, i, failed=True, status="failed", detail=str(e) or type(e).__name__)
+                            counts["failed"] += 1
+                        done += 1
+                        await self.update_status("running", done, total, f"Imported {counts['imported']}, failed {counts['failed']} ({done}/{total})")
+
+                await asyncio.gather(*(import_item(i) for i in pending))
+
+            if await self.cancelled():
+                await self.db.import_jobs.update_one({"_id": job_id}, {"$set": {"status": "cancelled"}})
+                await self.update_status("cancelled", done, total, f"Import cancelled ({done}/{total})")
+            else:
+                await self.db.import_jobs.update_one({"_id": job_id}, {"$set": {"status": "complete"}})
+                await self.update_status("idle", total, total, f"Import complete: {counts['imported']} imported, {counts['failed']} failed")
+        except Exception as e:
+            print(f"Import job {job_id} failed: {e}")
+            await self.db.import_jobs.update_one({"_id": job_id}, {"$set": {"status": "error", "error": str(e)}})
+            await self.update_status("error", done, total, f"Error: {e}")
+        finally:
+            await self.response_cache.bump("images", "authors")
+            self.jobs.pop(job_id, None)
+
+    @staticmethod
+    def image_id(item):
+        return item["post_id"] + GELBOORU_ID_OFFSET if item["source"] == "gelbooru" else item["post_id"]
@@ -0,0 +1,168 @@
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Response compression negotiated from Accept-Encoding: brotli when the `brotli`
+# package is installed and the client accepts it, gzip otherwise. Only text-like
+# payloads are compressed (images and Parquet already are), small bodies are left
+# alone, and streamed bodies are flushed per chunk so NDJSON/SSE stay incremental.
+#
+# Every compressible response carries Vary: Accept-Encoding, and a compressed body's
+# ETag is suffixed with its encoding ("<tag>-gzip") so caches never mix variants.
+# If-None-Match tags carrying the negotiated suffix are stripped before the app sees
+# them, and a 304 for such a tag gets the suffix back.
+
+COMPRESSIBLE_TYPES = ["application/json", "application/x-ndjson", "text/", "application/javascript"]
+
+# Server-sent events are tiny and latency sensitive
+SKIP_TYPES = ["text/event-stream"]
+
+class GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level=6):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data, final=False):
+        out = self.compressor.compress(data)
+        return out + self.compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+class BrotliEncoder:
+    name = "br"
+
+    def __init__(self, quality=4):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data, final=False):
+        out = self.compressor.process(data)
+        return out + (self.compressor.finish() if final else self.compressor.flush())
+
+def is_compressible(content_type):
+    return (
+        not any(content_type.startswith(t) for t in SKIP_TYPES)
+        and any(content_type.startswith(t) for t in COMPRESSIBLE_TYPES)
+    )
+
+def encoded_etag(etag, encoding):
+    """'"abc"' -> '"abc-gzip"' (weak tags keep their W/ prefix)"""
+    if not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+def strip_encoded_etags(if_none_match, encoding):
+    """Rewrite If-None-Match for the app: tags of this encoding's variant lose their
+    suffix. Returns (header, set of tags that were stripped)."""
+    suffix = f'-{encoding}"'
+    tags = []
+    stripped = set()
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.endswith(suffix):
+            tag = tag[:-len(suffix)] + '"'
+            stripped.add(tag)
+        tags.append(tag)
+    return ", ".join(tags), stripped
+
+def accepted_encodings(header):
+    """{"gzip", "br", ...} from an Accept-Encoding header, ignoring q=0 entries"""
+    encodings = set()
+    for part in header.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if name and params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            encodings.add(name)
+    return encodings
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size=500, gzip_level=6, brotli_quality=4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def encoder(self, scope):
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        if brotli is not None and "br" in accepted:
+            return BrotliEncoder.name, lambda: BrotliEncoder(self.brotli_quality)
+        if "gzip" in accepted:
+            return GzipEncoder.name, lambda: GzipEncoder(self.gzip_level)
+        return None, None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding, make_encoder = self.encoder(scope)
+        stripped = set()
+        if encoding is not None:
+            request_headers = MutableHeaders(scope=scope)
+            if "if-none-match" in request_headers:
+                request_headers["If-None-Match"], stripped = strip_encoded_etags(request_headers["if-none-match"], encoding)
+
+        start = None
+        encoder = None
+        passthrough = False
+
+        async def send_compressed(message: Message):
+            nonlocal start, encoder, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                headers = MutableHeaders(raw=message["headers"])
+                compressible = is_compressible(headers.get("content-type", ""))
+                if message["status"] == 304:
+                    # Revalidated the compressed variant the client holds
+                    if headers.get("etag") in stripped:
+                        headers["ETag"] = encoded_etag(headers["etag"], encoding)
+                        compressible = True
+                    passthrough = True
+                else:
+                    passthrough = (
+                        make_encoder is None
+                        or not compressible
+                        or "content-encoding" in headers
+                        or "content-range" in headers
+                        or message["status"] == 204
+                    )
+                if compressible:
+                    headers.add_vary_header("Accept-Encoding")
+                if passthrough:
+                    await send(start)
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if encoder is None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                encoder = make_encoder()
+                headers = MutableHeaders(raw=start["headers"])
+                headers["Content-Encoding"] = encoder.name
+                if "etag" in headers:
+                    headers["ETag"] = encoded_etag(headers["etag"], encoder.name)
+                if more_body:
+                    del headers["Content-Length"]
+                    message["body"] = encoder.compress(body)
+                else:
+                    message["body"] = encoder.compress(body, final=True)
+                    headers["Content-Length"] = str(len(message["body"]))
+                await send(start)
+                await send(message)
+                return
+
+            message["body"] = encoder.compress(body, final=not more_body)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,31 @@
+from scripts import danbooru_scraper, image_generator, aggregate_styles
+
+# Pipelines run by the TaskManager: fn(task, db, *args). Each one drives the same
+# entry point as the command-line script, with the Task supplying pause/cancel.
+
+def run_scraper(task, db, argv):
+    danbooru_scraper.run(db, danbooru_scraper.parse_args(argv), task=task)
+
+def run_generator(task, db, argv):
+    image_generator.run(db, image_generator.parse_args(argv), task=task)
+
+def run_style_analysis(task, db):
+    # torch/transformers are only imported when analysis is actually used
+    from scripts import style_analyzer
+    style_analyzer.run(db, task=task)
+
+def run_style_aggregation(task, db):
+    aggregate_styles.aggregate_styles(db, task=task)
+
+def scraper_argv(req):
+    return ["--limit-authors", str(req.limit_authors), "--max-images", str(req.max_images), "--min-posts", str(req.min_posts)]
+
+def generator_argv(req):
+    argv = ["--models", *req.models, "--steps", str(req.steps), "--cfg", str(req.cfg), "--sampler", req.sampler, "--scheduler", req.scheduler]
+    if req.limit > 0:
+        argv += ["--limit", str(req.limit)]
+    if req.prompt:
+        argv += ["--prompt", req.prompt]
+    if req.authors:
+        argv += ["--authors", req.authors]
+    return argv
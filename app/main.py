@@ -1,35 +1,98 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query, BackgroundTasks
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query, BackgroundTasks, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, Response
 from motor.motor_asyncio import AsyncIOMotorClient
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 import os
 import shutil
-import subprocess
-import shlex
 from datetime import datetime
-import requests
+import asyncio
+import json
+import concurrent.futures
+import pymongo
 import sys
 
 # Add parent directory to path to import config
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from config import MONGO_URI, DB_NAME, DATA_DIR, IMAGES_DIR, GENERATED_DIR, SD_API_URL, SD_API_URLS
-from scripts.gelbooru_scraper import GelbooruScraper
-
-# Manual upload directory
-MANUAL_DIR = os.path.join(DATA_DIR, "manual")
-
-# Ensure directories exist
-os.makedirs(MANUAL_DIR, exist_ok=True)
+from scripts.settings import settings, BOOTSTRAP_SETTINGS
+# Registers the MongoDB command listener, so it must come before the clients below
+from scripts.metrics import AUTHORS_QUERY_SECONDS, render_all as render_metrics
+from scripts.author_counters import model_key
+from scripts.db_schema import ensure_schema, unindexed_query_shapes
+from scripts.data_paths import data_url
+from scripts.thumbnails import FORMATS, snap_width, render_thumbnail
+from scripts.author_search import normalize_name, prefix_query
+from scripts.export import export_chunks, ExportError, FORMATS as EXPORT_FORMATS
+from app.static_files import DataFiles, cache_control, etag_matches
+from app.json_response import FastJSONResponse, parse_fields
+from app.compression import CompressionMiddleware
+from app.request_metrics import RequestMetricsMiddleware
+from app.response_cache import ResponseCache
+from app.status_stream import StatusBroadcaster, format_status
+from app.pagination import encode_token, decode_token, field_value, seek_filter, InvalidToken
+from app.sd_proxy import SDProxy, parse_ports, scan_targets, scan_instances
+from app.bulk_import import BulkImporter, ImportFailed
+from app.task_manager import TaskManager, TaskAlreadyRunning
+from app.jobs import run_scraper, run_generator, run_style_analysis, run_style_aggregation, scraper_argv, generator_argv
+from app.uploads import store_stream, extract_archive, generation_doc, insert_upload, insert_archive_entries, UploadError
 
 # Initialize FastAPI
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
+
+# gzip/brotli for JSON, NDJSON and the UI (skips images, SSE and small bodies)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(RequestMetricsMiddleware)
 
 # Database
-client = AsyncIOMotorClient(MONGO_URI)
-db = client[DB_NAME]
+client = AsyncIOMotorClient(settings.MONGO_URI)
+db = client[settings.DB_NAME]
+
+# Pushes task status/counter deltas to every open tab from a single watcher
+status_broadcaster = StatusBroadcaster(db)
+
+# Read endpoints are cached until a writer bumps the data version they depend on
+response_cache = ResponseCache(db)
+
+# Pooled, cached fan-out to every configured SD WebUI instance
+sd_proxy = SDProxy(settings.SD_API_URLS, ttl=settings.SD_LIST_CACHE_TTL)
+
+# URL/ID imports: batched metadata lookups, concurrent rate-limited downloads
+bulk_importer = BulkImporter(
+    db, response_cache,
+    concurrency=settings.IMPORT_CONCURRENCY,
+    rate=settings.IMPORT_RATE_LIMIT
+)
+MAX_BULK_IMPORT = 1000
+
+# Sync handle for helpers shared with the scripts (run in the default executor)
+sync_db = pymongo.MongoClient(settings.MONGO_URI)[settings.DB_NAME]
+
+@app.on_event("startup")
+async def bootstrap_schema():
+    # Index creation and migrations use the sync driver shared with the scripts
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, ensure_schema, sync_db)
+    except Exception as e:
+        print(f"Schema bootstrap failed: {e}")
+
+# Scraper, generator and style pipelines run in-process in a managed worker pool
+task_manager = TaskManager(sync_db, max_workers=settings.JOB_WORKERS)
+
+@app.on_event("startup")
+async def recover_tasks():
+    # Tasks left "running" by a crashed or restarted server are marked interrupted
+    try:
+        interrupted = await asyncio.get_running_loop().run_in_executor(None, task_manager.recover_orphans)
+        for task_id in interrupted:
+            print(f"Task {task_id} was interrupted")
+    except Exception as e:
+        print(f"Task recovery failed: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_tasks():
+    task_manager.shutdown()
 
 # Models
 class Author(BaseModel):
@@ -73,14 +136,33 @@ class ConfigModel(BaseModel):
     style_html_path: Optional[str] = ""
     style_samples_dir: Optional[str] = ""
 
+class BulkImportRequest(BaseModel):
+    items: List[str]
+    skip_existing: bool = True
+
+class ScanRequest(BaseModel):
+    urls: List[str] = []
+    hosts: Optional[List[str]] = None
+    ports: Optional[str] = None
+    connect_timeout: float = Field(0.5, gt=0, le=5.0)
+
 # Routes
 
 @app.get("/api/stats")
-async def get_stats():
-    author_count = await db.authors.count_documents({})
-    image_count = await db.images.count_documents({})
-    gen_count = await db.generations.count_documents({})
-    return {"authors": author_count, "images": image_count, "generations": gen_count}
+async def get_stats(request: Request):
+    async def compute():
+        author_count = await db.authors.count_documents({})
+        image_count = await db.images.count_documents({})
+        gen_count = await db.generations.count_documents({})
+        return {"authors": author_count, "images": image_count, "generations": gen_count}
+    return await response_cache.respond(request, "stats", ["authors", "images", "generations"], compute)
+
+@app.get("/api/schema")
+async def get_schema():
+    from scripts.db_schema import SCHEMA_VERSION
+    meta = await db.schema_meta.find_one({"_id": "schema"}) or {}
+    unindexed = await asyncio.get_running_loop().run_in_executor(None, unindexed_query_shapes, sync_db)
+    return {"version": meta.get("version", 0), "expected_version": SCHEMA_VERSION, "unindexed": unindexed}
 
 @app.post("/api/tasks/{task_id}/{action}")
 async def control_task(task_id: str, action: str):
@@ -89,8 +171,15 @@ async def control_task(task_id: str, action: str):
     
     if action == "dismiss":
         await db.system_status.delete_one({"_id": task_id})
+        if status_broadcaster.subscribers:
+            await status_broadcaster.refresh_tasks()
         return {"status": "dismissed"}
     
+    # Jobs running in this process react immediately; CLI runs poll system_status
+    task = task_manager.get_task(task_id)
+    if task is not None and task.is_active:
+        {"pause": task.pause, "resume": task.resume, "cancel": task.cancel}[action]()
+    
     update = {}
     if action == "pause":
         update = {"control": "pause", "status": "paused"}
@@ -100,6 +189,8 @@ async def control_task(task_id: str, action: str):
         update = {"control": "cancel", "status": "cancelled"}
         
     await db.system_status.update_one({"_id": task_id}, {"$set": update})
+    if status_broadcaster.subscribers:
+        await status_broadcaster.refresh_tasks()
     return {"status": "success"}
 
 @app.get("/api/status")
@@ -107,53 +198,40 @@ async def get_status():
     cursor = db.system_status.find({})
     statuses = await cursor.to_list(length=100)
     
-    result = {}
-    for s in statuses:
-        result[s["_id"]] = {
-            "status": s.get("status", "idle"),
-            "progress": s.get("progress", 0),
-            "message": s.get("message", ""),
-            "current": s.get("current", 0),
-            "total": s.get("total", 0)
-        }
-        
-    return result
+    return {s["_id"]: format_status(s) for s in statuses}
+
+@app.get("/api/status/stream")
+async def stream_status():
+    """Server-sent events: a `snapshot` event with all tasks and counters, then `delta` events"""
+    return StreamingResponse(
+        status_broadcaster.events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition: this process plus metrics pushed by command-line scripts"""
+    body = await asyncio.get_running_loop().run_in_executor(None, render_metrics)
+    return Response(content=body, media_type="text/plain; version=0.0.4")
 
 @app.get("/api/config")
 async def get_config():
-    """Get current configuration settings"""
-    from config import SD_API_URLS
-    
-    # Try to load from MongoDB first
-    config_doc = await db.app_config.find_one({"_id": "settings"})
-    
-    if config_doc:
-        return {
-            "mongo_uri": config_doc.get("mongo_uri", MONGO_URI),
-            "db_name": config_doc.get("db_name", DB_NAME),
-            "data_dir": config_doc.get("data_dir", DATA_DIR),
-            "sd_api_urls": config_doc.get("sd_api_urls", SD_API_URLS),
-            "style_html_path": config_doc.get("style_html_path", ""),
-            "style_samples_dir": config_doc.get("style_samples_dir", "")
-        }
-    else:
-        # Return defaults from config.py
-        return {
-            "mongo_uri": MONGO_URI,
-            "db_name": DB_NAME,
-            "data_dir": DATA_DIR,
-            "sd_api_urls": SD_API_URLS,
-            "style_html_path": "",
-            "style_samples_dir": ""
-        }
+    """Get current configuration settings (config.py, env and saved overrides merged)"""
+    return {
+        "mongo_uri": settings.MONGO_URI,
+        "db_name": settings.DB_NAME,
+        "data_dir": settings.DATA_DIR,
+        "sd_api_urls": settings.SD_API_URLS,
+        "style_html_path": settings.STYLE_HTML_PATH or "",
+        "style_samples_dir": settings.STYLE_SAMPLES_DIR or ""
+    }
 
 @app.post("/api/config")
 async def update_config(config: ConfigModel):
     """Update configuration settings"""
     config_data = {
         "_id": "settings",
-        "mongo_uri": config.mongo_uri,
-        "db_name": config.db_name,
         "data_dir": config.data_dir,
         "sd_api_urls": config.sd_api_urls,
         "style_html_path": config.style_html_path,
@@ -167,34 +245,57 @@ async def update_config(config: ConfigModel):
         upsert=True
     )
     
-    return {"status": "success", "message": "Configuration saved. Restart the app to apply changes."}
+    # Running components pick the new values up through their settings listeners
+    changed = settings.update(config_data)
+    if config.mongo_uri != settings.MONGO_URI or config.db_name != settings.DB_NAME:
+        names = " / ".join(f"{name} (DANBOORU_RANKER_{name})" for name in BOOTSTRAP_SETTINGS)
+        return {"status": "success", "message": f"Configuration saved. The database connection is not stored in the database; set {names} in config.py or the environment and restart.", "changed": sorted(changed)}
+    return {"status": "success", "message": "Configuration saved and applied.", "changed": sorted(changed)}
+
+@settings.subscribe
+def apply_sd_urls(changed):
+    if "SD_API_URLS" in changed:
+        sd_proxy.set_urls(changed["SD_API_URLS"])
+
+# Created up front: /data is mounted on DATA_DIR, and a directory that only exists in the
+# env or DB settings layers (not created by config.py) would fail the mount
+DATA_DIRS = ["DATA_DIR", "IMAGES_DIR", "GENERATED_DIR", "MANUAL_DIR", "THUMBS_DIR"]
+
+@settings.subscribe
+def apply_data_dir(changed):
+    for name in DATA_DIRS:
+        if name in changed:
+            os.makedirs(changed[name], exist_ok=True)
+    if "DATA_DIR" in changed:
+        data_files.set_directory(changed["DATA_DIR"])
 
 @app.post("/api/config/scan-sd")
-async def scan_sd_instances():
-    """Scan for running Stable Diffusion WebUI instances"""
-    found_urls = []
+async def scan_sd_instances(scan: Optional[ScanRequest] = None, stream: bool = False):
+    """Scan for running Stable Diffusion WebUI instances.
     
-    for port in range(7860, 7870):  # Check ports 7860-7869
-        url = f"http://127.0.0.1:{port}"
-        try:
-            response = requests.get(f"{url}/sdapi/v1/sd-models", timeout=3)
-            if response.status_code == 200:
-                models = response.json()
-                found_urls.append({
-                    "url": url,
-                    "model_count": len(models),
-                    "status": "online"
-                })
-            else:
-                found_urls.append({
-                    "url": url,
-                    "model_count": 0,
-                    "status": "error",
-                    "detail": f"HTTP {response.status_code} (Check --api)"
-                })
-        except Exception as e:
-            pass
+    Probes the given URLs plus every host/port combination concurrently. With
+    `stream=true` each instance is sent as an NDJSON line as soon as it answers.
+    """
+    scan = scan or ScanRequest()
+    hosts = scan.hosts if scan.hosts is not None else settings.SD_SCAN_HOSTS
+    try:
+        ports = parse_ports(scan.ports or settings.SD_SCAN_PORTS)
+        # Validated here, before a streamed response has started
+        scan_targets(scan.urls, hosts, ports)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    results = scan_instances(scan.urls, hosts, ports, connect_timeout=scan.connect_timeout)
+    
+    if stream:
+        async def lines():
+            found_count = 0
+            async for instance in results:
+                found_count += 1
+                yield json.dumps({"type": "instance", **instance}) + "\n"
+            yield json.dumps({"type": "done", "found_count": found_count}) + "\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
     
+    found_urls = [instance async for instance in results]
     return {"instances": found_urls, "found_count": len(found_urls)}
 
 @app.post("/api/config/reset")
@@ -204,10 +305,11 @@ async def reset_configuration():
     """
     try:
         # Drop Database (using the existing client and imported constants)
-        await client.drop_database(DB_NAME)
+        await client.drop_database(settings.DB_NAME)
+        await response_cache.reset()
         
         # Clear Directories
-        for dir_path in [IMAGES_DIR, GENERATED_DIR]:
+        for dir_path in [settings.IMAGES_DIR, settings.GENERATED_DIR, settings.THUMBS_DIR]:
             if os.path.exists(dir_path):
                 shutil.rmtree(dir_path)
                 os.makedirs(dir_path, exist_ok=True)
@@ -231,92 +333,268 @@ async def validate_style_paths(html_path: str = Form(...), samples_dir: str = Fo
     }
 
 @app.get("/api/categories")
-async def get_categories():
-    categories = await db.authors.distinct("style_category")
-    return [c for c in categories if c]
+async def get_categories(request: Request):
+    async def compute():
+        categories = await db.authors.distinct("style_category")
+        return [c for c in categories if c]
+    return await response_cache.respond(request, "categories", ["authors", "styles"], compute)
+
+AUTHOR_SORT_FIELDS = ["name", "_id", "image_count", "gen_count", "style_category"]
+
+# Selectable with `fields=`; search_keys is internal and never returned
+AUTHOR_FIELDS = ["name", "other_names", "urls", "style_category", "style_score", "image_count", "gen_count", "gen_counts", "updated_at"]
 
 @app.get("/api/authors")
-async def get_authors(page: int = 1, limit: int = 50, search: str = "", category: str = "", sort_by: str = "name", order: str = "asc"):
-    skip = (page - 1) * limit
-    query = {}
-    if search:
-        query["name"] = {"$regex": search, "$options": "i"}
+async def get_authors(request: Request, limit: int = 50, search: str = "", category: str = "", sort_by: str = "name", order: str = "asc", model: str = "", cursor: str = "", fields: str = ""):
+    """Keyset-paginated author list. Pass the `next`/`prev` token of a response as `cursor`
+    to fetch the adjacent page; deep pages cost the same as the first one.
+    `fields` (comma separated) limits the returned author fields; `id` is always included."""
+    try:
+        field_list = parse_fields(fields, AUTHOR_FIELDS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    key = "authors?" + "&".join(f"{k}={v}" for k, v in [
+        ("limit", limit), ("search", search), ("category", category), ("sort_by", sort_by),
+        ("order", order), ("model", model), ("cursor", cursor), ("fields", ",".join(field_list))
+    ])
+    async def compute():
+        with AUTHORS_QUERY_SECONDS.time(sort_by=sort_by if sort_by in AUTHOR_SORT_FIELDS else "invalid"):
+            return await list_authors(limit, search, category, sort_by, order, model, cursor, field_list)
+    return await response_cache.respond(request, key, ["authors"], compute)
+
+def author_projection(field_list, sort_field):
+    if not field_list:
+        return {"search_keys": 0}
+    projection = {field: 1 for field in field_list}
+    # Page tokens are built from the sort key, so it is always fetched
+    if sort_field.split(".")[0] not in projection:
+        projection[sort_field] = 1
+    return projection
+
+async def list_authors(limit, search, category, sort_by, order, model, cursor, field_list=None):
+    limit = max(1, min(limit, 200))
+    query = prefix_query(search) if search else {}
     if category:
         query["style_category"] = category
     
-    direction = 1 if order == "asc" else -1
+    if sort_by not in AUTHOR_SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Invalid sort field: {sort_by}")
+    if order not in ["asc", "desc"]:
+        raise HTTPException(status_code=400, detail=f"Invalid order: {order}")
     
-    if sort_by in ["name", "_id"]:
-        total = await db.authors.count_documents(query)
-        cursor = db.authors.find(query).sort(sort_by, direction).skip(skip).limit(limit)
-        authors = await cursor.to_list(length=limit)
-    else:
-        cursor = db.authors.find(query)
-        all_authors = await cursor.to_list(length=10000)
-        
-        for a in all_authors:
-            a["id"] = a["_id"]
-            a["image_count"] = await db.images.count_documents({"author_id": a["_id"]})
-            a["gen_count"] = await db.generations.count_documents({"author_id": a["_id"]})
-            
-        all_authors.sort(key=lambda x: x.get(sort_by, 0), reverse=(order == "desc"))
-        total = len(all_authors)
-        authors = all_authors[skip:skip+limit]
-
-    if sort_by in ["name", "_id"]:
-         for a in authors:
-            a["id"] = a["_id"]
-            a["image_count"] = await db.images.count_documents({"author_id": a["_id"]})
-            a["gen_count"] = await db.generations.count_documents({"author_id": a["_id"]})
+    # Counters are materialized on the author documents, so every sort is a single query
+    sort_field = sort_by
+    if sort_by == "gen_count" and model:
+        sort_field = f"gen_counts.{model_key(model)}"
+    unique = sort_field in ["name", "_id"]
+    
+    direction = "next"
+    ascending = order == "asc"
+    seek_query = query
+    if cursor:
+        try:
+            token = decode_token(cursor, sort_field, order)
+        except InvalidToken as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        direction = token["d"]
+        # Walking backwards from the first row of the current page
+        if direction == "prev":
+            ascending = not ascending
+        seek = seek_filter(sort_field, token["v"], token["id"], ascending, unique)
+        seek_query = {"$and": [query, seek]} if query else seek
+    
+    sort_dir = 1 if ascending else -1
+    sort_spec = [(sort_field, sort_dir)]
+    if not unique:
+        sort_spec.append(("_id", sort_dir))
+    
+    projection = author_projection(field_list, sort_field)
+    authors = await db.authors.find(seek_query, projection).sort(sort_spec).limit(limit + 1).to_list(length=limit + 1)
+    has_more = len(authors) > limit
+    authors = authors[:limit]
+    if direction == "prev":
+        authors.reverse()
+    
+    def edge_token(doc, token_direction):
+        return encode_token(sort_field, order, field_value(doc, sort_field), doc["_id"], token_direction)
+    
+    next_token = prev_token = None
+    if authors:
+        if direction == "next":
+            next_token = edge_token(authors[-1], "next") if has_more else None
+            prev_token = edge_token(authors[0], "prev") if cursor else None
+        else:
+            next_token = edge_token(authors[-1], "next")
+            prev_token = edge_token(authors[0], "prev") if has_more else None
+    
+    # Display defaults only after the tokens, which must carry the raw (possibly null) values
+    for a in authors:
+        a["id"] = a["_id"]
+        a.setdefault("image_count", 0)
+        a.setdefault("gen_count", 0)
+    
+    if field_list:
+        # Drop anything fetched only for the page tokens
+        keep = set(field_list) | {"id", "_id"}
+        authors = [{name: value for name, value in a.items() if name in keep} for a in authors]
+    
+    result = {"items": authors, "next": next_token, "prev": prev_token}
+    # The total is only needed once per listing, so continuation pages skip the count
+    if not cursor:
+        result["total"] = await db.authors.count_documents(query) if query else await db.authors.estimated_document_count()
+    return result
 
-    return {
-        "items": authors,
-        "total": total,
-        "page": page,
-        "pages": (total + limit - 1) // limit
-    }
+@app.get("/api/authors/suggest")
+async def suggest_authors(q: str = "", limit: int = 10):
+    """Typeahead over author names and aliases (prefix match on the search_keys index)"""
+    query = prefix_query(q)
+    if not query:
+        return []
+    limit = max(1, min(limit, 50))
+    cursor = db.authors.find(query, {"name": 1, "search_keys": 1, "image_count": 1}).limit(limit)
+    authors = await cursor.to_list(length=limit)
+    
+    key = normalize_name(q)
+    return [{
+        "id": a["_id"],
+        "name": a["name"],
+        "matched": next((k for k in a.get("search_keys", []) if k.startswith(key)), a["name"]),
+        "image_count": a.get("image_count", 0)
+    } for a in authors]
+
+GENERATION_FIELDS = {"_id": 0, "model": 1, "prompt": 1, "steps": 1, "cfg": 1, "scheduler": 1, "url": 1, "local_path": 1}
+
+# Selectable with `fields=`; leaving out `generations` skips the lookup entirely
+IMAGE_FIELDS = ["author_id", "file_url", "tags", "local_path", "generations"]
 
 @app.get("/api/images/{author_id}")
-async def get_images(author_id: int):
-    cursor = db.images.find({"author_id": author_id})
-    images = await cursor.to_list(length=100)
+async def get_images(author_id: int, cursor: Optional[int] = None, limit: int = 20, model: str = "", fields: str = ""):
+    """Images of an author with their generations, keyset-paginated on image _id.
+    `model` is an optional comma separated list of model names to restrict generations to.
+    `fields` (comma separated) limits the returned image fields; `id` is always included."""
+    try:
+        field_list = parse_fields(fields, IMAGE_FIELDS) or IMAGE_FIELDS
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    limit = max(1, min(limit, 100))
+    match = {"author_id": author_id}
+    if cursor is not None:
+        match["_id"] = {"$gt": cursor}
+    
+    gen_match = {"$expr": {"$eq": ["$original_image_id", "$$image_id"]}}
+    models = [m.strip() for m in model.split(",") if m.strip()]
+    if models:
+        gen_match["model"] = {"$in": models}
+    
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"_id": 1}},
+        {"$limit": limit + 1}
+    ]
+    if "generations" in field_list:
+        pipeline.append({"$lookup": {
+            "from": "generations",
+            "let": {"image_id": "$_id"},
+            "pipeline": [
+                {"$match": gen_match},
+                {"$sort": {"model": 1}},
+                {"$project": GENERATION_FIELDS}
+            ],
+            "as": "generations"
+        }})
+    projection = {field: 1 for field in field_list}
+    if "local_path" in field_list:
+        projection["url"] = 1
+    pipeline.append({"$project": projection})
+    images = await db.images.aggregate(pipeline).to_list(length=limit + 1)
+    
+    next_cursor = None
+    if len(images) > limit:
+        images = images[:limit]
+        next_cursor = images[-1]["_id"]
     
     results = []
     for img in images:
-        gens_cursor = db.generations.find({"original_image_id": img["_id"]})
-        gens = await gens_cursor.to_list(length=100)
-        
-        # Calculate relative path for original image
-        try:
-            rel_path = os.path.relpath(img['local_path'], DATA_DIR).replace("\\", "/")
-            img_url = f"/data/{rel_path}"
-        except Exception:
-            # Fallback
-            img_url = f"/data/images/{os.path.basename(img['local_path'])}"
-
-        img_data = {
+        item = {
             "id": img["_id"],
-            "author_id": img["author_id"],
-            "file_url": img["file_url"],
+            "author_id": img.get("author_id"),
+            "file_url": img.get("file_url"),
             "tags": img.get("tags", ""),
-            "local_path": img_url,
-            "generations": []
-        }
-        
-        for g in gens:
-            rel_path = os.path.relpath(g["local_path"], DATA_DIR).replace("\\", "/")
-            
-            img_data["generations"].append({
-                "model": g["model"],
-                "prompt": g["prompt"],
+            # `url` is stored at write time; older documents fall back to computing it
+            "local_path": img.get("url") or data_url(img.get("local_path")),
+            "generations": [{
+                "model": g.get("model"),
+                "prompt": g.get("prompt"),
                 "steps": g.get("steps"),
                 "cfg": g.get("cfg"),
-                "local_path": f"/data/{rel_path}"
-            })
-            
-        results.append(img_data)
-        
-    return results
+                "scheduler": g.get("scheduler"),
+                "local_path": g.get("url") or data_url(g.get("local_path"))
+            } for g in img.get("generations", [])]
+        }
+        results.append({name: value for name, value in item.items() if name == "id" or name in field_list})
+    
+    author = await db.authors.find_one({"_id": author_id}, {"image_count": 1})
+    
+    # Returned directly so the payload skips FastAPI's jsonable_encoder pass
+    return FastJSONResponse({
+        "items": results,
+        "next_cursor": next_cursor,
+        "total": author.get("image_count", 0) if author else 0
+    })
+
+# Thumbnail rendering is CPU bound; keep it off the event loop and out of the GIL
+thumb_pool = None
+
+def get_thumb_pool():
+    global thumb_pool
+    if thumb_pool is None:
+        thumb_pool = concurrent.futures.ProcessPoolExecutor(max_workers=max(1, min(4, (os.cpu_count() or 2) - 1)))
+    return thumb_pool
+
+def resolve_data_path(url_path):
+    """Map a /data URL (as returned by the API) to a file inside DATA_DIR"""
+    rel_path = url_path[len("/data/"):] if url_path.startswith("/data/") else url_path.lstrip("/")
+    root = os.path.realpath(settings.DATA_DIR)
+    full_path = os.path.realpath(os.path.join(root, rel_path))
+    if os.path.commonpath([root, full_path]) != root or not os.path.isfile(full_path):
+        raise HTTPException(status_code=404, detail="File not found")
+    return full_path
+
+@app.get("/api/thumb")
+async def get_thumbnail(request: Request, path: str = Query(...), w: int = 320, fmt: str = "webp"):
+    """Cached WebP/JPEG derivative of an original or generation at a fixed width.
+    Thumbnails of generations (overwritten on regeneration) are revalidated by ETag."""
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {fmt}")
+    source_path = resolve_data_path(path)
+    width = snap_width(w)
+    
+    try:
+        thumb_path = await asyncio.get_running_loop().run_in_executor(get_thumb_pool(), render_thumbnail, source_path, width, fmt, settings.THUMBS_DIR)
+    except Exception as e:
+        # Undecodable source or Pillow missing: fall back to the original
+        print(f"Thumbnail failed for {source_path}: {e}")
+        return FileResponse(source_path)
+    
+    # The thumb file name hashes the source path, mtime, width and format
+    headers = {
+        "Cache-Control": cache_control(source_path, mutable_data_dirs()),
+        "ETag": f'"{os.path.splitext(os.path.basename(thumb_path))[0]}"'
+    }
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(thumb_path, media_type=FORMATS[fmt][1], headers=headers)
+
+@app.on_event("shutdown")
+async def shutdown_thumb_pool():
+    if thumb_pool is not None:
+        thumb_pool.shutdown(wait=False)
+
+def manual_dir():
+    """Manual upload directory (follows DATA_DIR)"""
+    path = settings.MANUAL_DIR
+    os.makedirs(path, exist_ok=True)
+    return path
 
 @app.post("/api/upload")
 async def upload_image(
@@ -328,276 +606,161 @@ async def upload_image(
     steps: int = Form(None),
     cfg: float = Form(None)
 ):
-    filename = f"manual_{int(datetime.now().timestamp())}_{file.filename}"
-    file_path = os.path.join(MANUAL_DIR, filename)
+    # Copy + sha256 in one pass, off the event loop; identical bytes map to one file
+    content_hash, file_path = await asyncio.get_running_loop().run_in_executor(
+        None, store_stream, file.file, file.filename, manual_dir()
+    )
     
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-        
-    gen_data = {
-        "original_image_id": original_image_id,
-        "author_id": author_id,
-        "model": model,
-        "prompt": prompt,
-        "steps": steps,
-        "cfg": cfg,
-        "local_path": file_path,
-        "created_at": datetime.now(),
-        "is_manual": True
-    }
+    meta = {"original_image_id": original_image_id, "author_id": author_id, "model": model, "prompt": prompt, "steps": steps, "cfg": cfg}
+    generation_id, created = await insert_upload(db, generation_doc(meta, content_hash, file_path))
+    if created:
+        await response_cache.bump("generations", "authors")
+    return {"status": "success" if created else "duplicate", "path": file_path, "generation_id": str(generation_id)}
+
+@app.post("/api/upload/archive")
+async def upload_archive(file: UploadFile = File(...), manifest: str = Form(None)):
+    """Ingest a zip/tar of generations described by a manifest (form field or
+    manifest.json/.csv inside the archive) mapping file names to original_image_id/model"""
+    manifest_name = "manifest.csv" if manifest and not manifest.lstrip().startswith(("{", "[")) else "manifest.json"
+    try:
+        entries, errors = await asyncio.get_running_loop().run_in_executor(
+            None, extract_archive, file.file, file.filename, manual_dir(), manifest, manifest_name
+        )
+    except (UploadError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    await db.generations.insert_one(gen_data)
-    return {"status": "success", "path": file_path}
+    inserted, duplicates, insert_errors = await insert_archive_entries(db, entries)
+    if inserted:
+        await response_cache.bump("generations", "authors")
+    return {
+        "status": "success",
+        "inserted": len(inserted),
+        "duplicates": duplicates,
+        "errors": errors + insert_errors
+    }
 
 @app.post("/api/import")
 async def import_url(url: str = Query(...)):
     try:
-        if "danbooru.donmai.us/posts/" in url:
-            post_id = url.split("/posts/")[-1].split("?")[0]
-            api_url = f"https://danbooru.donmai.us/posts/{post_id}.json"
-            
-            resp = requests.get(api_url, headers={"User-Agent": "DanbooruRanker/1.0"})
-            resp.raise_for_status()
-            data = resp.json()
-            
-            artist_name = data.get("tag_string_artist", "unknown").split(" ")[0]
-            
-            artist = await db.authors.find_one({"name": artist_name})
-            if not artist:
-                artist_id = abs(hash(artist_name)) % 10000000
-                await db.authors.update_one(
-                    {"name": artist_name},
-                    {"$set": {"_id": artist_id, "name": artist_name, "imported": True}},
-                    upsert=True
-                )
-            else:
-                artist_id = artist["_id"]
-            
-            file_url = data.get("file_url")
-            if not file_url:
-                raise HTTPException(status_code=400, detail="No file URL found in post")
-                
-            ext = data.get("file_ext", "jpg")
-            filename = f"{post_id}.{ext}"
-            
-            # Sanitize artist name for folder
-            safe_artist_name = "".join(c for c in artist_name if c.isalnum() or c in (' ', '.', '_')).strip().replace(" ", "_")
-            artist_dir = os.path.join(IMAGES_DIR, safe_artist_name)
-            os.makedirs(artist_dir, exist_ok=True)
-            
-            file_path = os.path.join(artist_dir, filename)
-            
-            with open(file_path, "wb") as f:
-                f.write(requests.get(file_url).content)
-                
-            image_data = {
-                "_id": int(post_id),
-                "author_id": artist_id,
-                "author_name": artist_name,
-                "tags": data.get("tag_string"),
-                "file_url": file_url,
-                "local_path": file_path,
-                "width": data.get("image_width"),
-                "height": data.get("image_height"),
-                "created_at": data.get("created_at"),
-                "fetched_at": datetime.now(),
-                "source": "danbooru"
-            }
-            
-            await db.images.update_one(
-                {"_id": int(post_id)},
-                {"$set": image_data},
-                upsert=True
-            )
-            
-            return {"status": "success", "image_id": post_id, "author_id": artist_id}
-            
-        elif "gelbooru.com" in url and "id=" in url:
-            # Parse ID from URL
-            try:
-                from urllib.parse import urlparse, parse_qs
-                parsed = urlparse(url)
-                qs = parse_qs(parsed.query)
-                post_id = qs.get("id", [None])[0]
-            except:
-                post_id = None
-                
-            if not post_id:
-                raise HTTPException(status_code=400, detail="Could not parse ID from Gelbooru URL")
-                
-            scraper = GelbooruScraper()
-            post = scraper.fetch_post(post_id)
-            
-            if not post:
-                raise HTTPException(status_code=404, detail="Post not found on Gelbooru")
-                
-            # Extract artist
-            tags = post.get("tags", "").split(" ")
-            # Gelbooru doesn't explicitly separate artist tags in the post object usually, 
-            # but we can try to guess or just use "unknown" if we can't query tag types easily without more API calls.
-            # For now, let's just use "imported_gelbooru" or try to find it if we had a tag type cache.
-            # OR, we can just use the first tag? No.
-            # Let's check if we can get artist from tags if we know them.
-            # Actually, without querying tag types, it's hard to know which tag is the artist.
-            # Let's use a placeholder or require user input? 
-            # For now, let's use "unknown_gelbooru" or similar, OR we can try to find a tag that looks like an artist?
-            # Better: Fetch tag details? No, too slow.
-            # Let's use "gelbooru_import" as artist for now, or maybe the user doesn't care?
-            # Wait, the user wants to rank likeness. We NEED the artist name.
-            # Gelbooru API doesn't give tag types in post response?
-            # Let's assume the user is importing for a specific artist? No, this is a general import.
-            # Let's try to fetch tag details for the tags? That's a lot of tags.
-            # Alternative: Just use "Gelbooru Import" as artist name?
-            # The user said "it should accept danbooru and gelbooru images or artists".
-            # If I import an image, I want it assigned to an artist.
-            # Let's try to get the artist from the tags string if possible?
-            # Actually, let's just use "Gelbooru Import" for now and maybe let user move it?
-            # OR, we can fetch the post page HTML and parse it? No.
-            # Let's look at the tags. Maybe we can just use the first tag?
-            # Let's use "Gelbooru_Import" as the artist name for now to be safe.
-            artist_name = "Gelbooru_Import"
-            
-            # Check if we can find an existing artist in our DB that matches one of the tags?
-            # This is a good heuristic.
-            potential_artists = await db.authors.find({"name": {"$in": tags}}).to_list(length=1)
-            if potential_artists:
-                artist_name = potential_artists[0]["name"]
-            
-            artist = await db.authors.find_one({"name": artist_name})
-            if not artist:
-                artist_id = abs(hash(artist_name)) % 10000000
-                await db.authors.update_one(
-                    {"name": artist_name},
-                    {"$set": {"_id": artist_id, "name": artist_name, "imported": True}},
-                    upsert=True
-                )
-            else:
-                artist_id = artist["_id"]
-                
-            # Map to our schema
-            image_data = scraper.map_post_to_image_data(post, artist_id, artist_name)
-            
-            # Download
-            file_url = image_data["file_url"]
-            if not file_url:
-                raise HTTPException(status_code=400, detail="No file URL in Gelbooru post")
-                
-            ext = file_url.split(".")[-1]
-            filename = f"gelbooru_{post_id}.{ext}"
-            
-            safe_artist_name = "".join(c for c in artist_name if c.isalnum() or c in (' ', '.', '_')).strip().replace(" ", "_")
-            artist_dir = os.path.join(IMAGES_DIR, safe_artist_name)
-            os.makedirs(artist_dir, exist_ok=True)
-            
-            file_path = os.path.join(artist_dir, filename)
-            
-            with open(file_path, "wb") as f:
-                f.write(requests.get(file_url).content)
-                
-            image_data["local_path"] = file_path
-            
-            await db.images.update_one(
-                {"_id": image_data["_id"]},
-                {"$set": image_data},
-                upsert=True
-            )
-            
-            return {"status": "success", "image_id": image_data["_id"], "author_id": artist_id}
-
-        else:
-            raise HTTPException(status_code=400, detail="Only Danbooru and Gelbooru URLs supported")
-            
+        return await bulk_importer.import_one(url)
+    except ImportFailed as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/import/bulk")
+async def import_bulk(req: BulkImportRequest):
+    """Import many Danbooru/Gelbooru URLs or post IDs as a background job"""
+    inputs = [text.strip() for text in req.items if text.strip()]
+    if not inputs:
+        raise HTTPException(status_code=400, detail="No URLs or IDs given")
+    if len(inputs) > MAX_BULK_IMPORT:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_IMPORT} items per import")
+    job_id = await bulk_importer.start(inputs, skip_existing=req.skip_existing)
+    return {"status": "started", "job_id": job_id, "total": len(inputs)}
+
+@app.get("/api/import/jobs/{job_id}")
+async def get_import_job(job_id: str):
+    """Per-item progress of a bulk import"""
+    job = await db.import_jobs.find_one({"_id": job_id})
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    job["job_id"] = job.pop("_id")
+    return job
+
 # --- Script Triggering ---
 
+def start_job(task_id, name, fn, *args, params=None):
+    try:
+        task_manager.start(task_id, name, fn, *args, params=params)
+    except TaskAlreadyRunning as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
 @app.post("/api/scraper/start")
 async def start_scraper(req: ScraperRequest):
-    # Set initial status
-    await db.system_status.update_one(
-        {"_id": "scraper"},
-        {"$set": {"status": "starting", "control": "running", "progress": 0, "message": "Starting scraper...", "updated_at": datetime.now()}},
-        upsert=True
-    )
-    
-    # Run scraper as detached process
-    # Run scraper as detached process
-    cmd = f"python g:/python/danbooru_ranker/scripts/danbooru_scraper.py --limit-authors {req.limit_authors} --max-images {req.max_images} --min-posts {req.min_posts}"
-    subprocess.Popen(shlex.split(cmd))
-    
+    start_job("scraper", "Scraper", run_scraper, scraper_argv(req), params=req.dict())
     return {"status": "Scraper started"}
 
 @app.post("/api/generator/start")
 async def start_generator(req: GeneratorRequest):
-    # Set initial status
-    await db.system_status.update_one(
-        {"_id": "generator"},
-        {"$set": {"status": "starting", "control": "running", "progress": 0, "message": "Starting generator...", "updated_at": datetime.now()}},
-        upsert=True
-    )
-    
-    # Run generator as detached process passing all models
-    models_str = " ".join([f'"{m}"' for m in req.models])
-    cmd = f'python g:/python/danbooru_ranker/scripts/image_generator.py --models {models_str} --steps {req.steps} --cfg {req.cfg} --sampler "{req.sampler}"'
-    if req.limit > 0:
-        cmd += f" --limit {req.limit}"
-    if req.prompt:
-        cmd += f' --prompt "{req.prompt}"'
-    if req.authors:
-        cmd += f' --authors "{req.authors}"'
-    
-    subprocess.Popen(shlex.split(cmd))
-    
+    start_job("generator", "Generator", run_generator, generator_argv(req), params=req.dict())
     return {"status": "Generator started", "models": req.models}
 
 @app.post("/api/style/analyze")
 async def start_style_analysis():
-    await db.system_status.update_one(
-        {"_id": "style_analyzer"},
-        {"$set": {"status": "starting", "progress": 0, "message": "Starting style analysis...", "updated_at": datetime.now()}},
-        upsert=True
-    )
-    cmd = "python g:/python/danbooru_ranker/scripts/style_analyzer.py"
-    subprocess.Popen(shlex.split(cmd))
+    start_job("style_analyzer", "Style analysis", run_style_analysis)
     return {"status": "started"}
 
 @app.post("/api/style/aggregate")
 async def start_style_aggregation():
-    await db.system_status.update_one(
-        {"_id": "aggregator"},
-        {"$set": {"status": "starting", "progress": 0, "message": "Starting aggregation...", "updated_at": datetime.now()}},
-        upsert=True
-    )
-    cmd = "python g:/python/danbooru_ranker/scripts/aggregate_styles.py"
-    subprocess.Popen(shlex.split(cmd))
+    start_job("aggregator", "Aggregation", run_style_aggregation)
     return {"status": "started"}
 
+# --- Export ---
+@app.get("/api/export/{collection}")
+async def export_collection(
+    collection: str,
+    format: str = "ndjson",
+    category: str = "",
+    model: str = "",
+    since: str = "",
+    until: str = "",
+    source: str = ""
+):
+    """Stream authors/images/generations as NDJSON or Parquet, read with a batched cursor"""
+    filters = {"category": category, "model": model, "since": since, "until": until, "source": source}
+    try:
+        # Validation (and the author lookup for category filters) touches the DB
+        chunks = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: export_chunks(sync_db, collection, format, **filters)
+        )
+    except ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Sync generator: Starlette pulls it from the threadpool, one batch at a time
+    filename = f"{collection}-{datetime.now():%Y%m%d-%H%M%S}.{format}"
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "X-Accel-Buffering": "no"}
+    )
+
 # --- SD Proxy ---
 @app.get("/api/sd/models")
-def get_sd_models():
-    try:
-        resp = requests.get(f"{SD_API_URL}/sdapi/v1/sd-models")
-        return resp.json()
-    except:
-        return []
+async def get_sd_models():
+    return await sd_proxy.get_list("models")
 
 @app.get("/api/sd/samplers")
-def get_sd_samplers():
-    try:
-        resp = requests.get(f"{SD_API_URL}/sdapi/v1/samplers")
-        return resp.json()
-    except:
-        return []
+async def get_sd_samplers():
+    return await sd_proxy.get_list("samplers")
 
 @app.get("/api/sd/schedulers")
-def get_sd_schedulers():
-    try:
-        resp = requests.get(f"{SD_API_URL}/sdapi/v1/schedulers")
-        return resp.json()
-    except:
-        return []
+async def get_sd_schedulers():
+    return await sd_proxy.get_list("schedulers")
+
+@app.get("/api/sd/instances")
+async def get_sd_instances():
+    """Reachability of each instance as of its last proxied request"""
+    return [{"url": url, **sd_proxy.health.get(url, {"status": "unknown"})} for url in sd_proxy.urls]
+
+@app.on_event("shutdown")
+async def shutdown_sd_proxy():
+    await sd_proxy.close()
 
 # Static Files
-app.mount("/data", StaticFiles(directory=DATA_DIR), name="data")
-app.mount("/", StaticFiles(directory=r"g:\python\danbooru_ranker\app\static", html=True), name="static")
+# Optional front-proxy offloading for /data ("nginx" -> X-Accel-Redirect, "apache" -> X-Sendfile)
+def mutable_data_dirs():
+    """Files here are rewritten in place (regenerated images), so they aren't immutable"""
+    return [settings.GENERATED_DIR]
+
+for name in DATA_DIRS:
+    os.makedirs(getattr(settings, name), exist_ok=True)
+
+data_files = DataFiles(
+    directory=settings.DATA_DIR,
+    offload=settings.DATA_OFFLOAD,
+    offload_prefix=settings.DATA_OFFLOAD_PREFIX,
+    mutable_dirs=mutable_data_dirs
+)
+app.mount("/data", data_files, name="data")
+app.mount("/", StaticFiles(directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), "static"), html=True), name="static")
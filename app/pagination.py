@@ -0,0 +1,53 @@
+import base64
+import json
+
+# Keyset (seek) pagination helpers.
+# A page token records the sort and the (value, _id) of the row at the page edge, so the
+# next page is a range query on the sort index instead of a skip over every earlier row.
+
+class InvalidToken(ValueError):
+    pass
+
+def encode_token(sort_field, order, value, last_id, direction):
+    payload = {"s": sort_field, "o": order, "v": value, "id": last_id, "d": direction}
+    return base64.urlsafe_b64encode(json.dumps(payload, default=str).encode()).decode().rstrip("=")
+
+def decode_token(token, sort_field, order):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise InvalidToken("Malformed page token")
+    if payload.get("s") != sort_field or payload.get("o") != order or payload.get("d") not in ["next", "prev"]:
+        raise InvalidToken("Page token does not match the requested sort")
+    return payload
+
+def field_value(doc, dotted):
+    value = doc
+    for part in dotted.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+def seek_filter(sort_field, value, last_id, ascending, unique=False):
+    """Filter selecting rows strictly after (value, last_id) when walking the index in the given direction.
+    Missing/null values sort first in MongoDB, so they get explicit clauses."""
+    op = "$gt" if ascending else "$lt"
+    if sort_field == "_id":
+        return {"_id": {op: last_id}}
+    if unique and value is not None:
+        return {sort_field: {op: value}}
+
+    if ascending:
+        if value is None:
+            return {"$or": [{sort_field: None, "_id": {"$gt": last_id}}, {sort_field: {"$ne": None}}]}
+        return {"$or": [{sort_field: {"$gt": value}}, {sort_field: value, "_id": {"$gt": last_id}}]}
+
+    if value is None:
+        return {sort_field: None, "_id": {"$lt": last_id}}
+    return {"$or": [
+        {sort_field: {"$lt": value}},
+        {sort_field: value, "_id": {"$lt": last_id}},
+        {sort_field: None}
+    ]}
@@ -0,0 +1,39 @@
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from scripts.metrics import HTTP_REQUEST_SECONDS
+
+# Request latency per route template (/api/images/{author_id}, not the raw path, so
+# the label set stays bounded). Static mounts are grouped under their prefix.
+
+class RequestMetricsMiddleware:
+    def __init__(self, app: ASGIApp, skip=("/metrics",)):
+        self.app = app
+        self.skip = skip
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] in self.skip:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            if route is not None:
+                label = route.path
+            elif scope["path"].startswith("/data/"):
+                label = "/data"
+            else:
+                label = "static"
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=scope["method"], route=label, status=status)
@@ -0,0 +1,88 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+from fastapi import Request
+from pymongo import ReturnDocument
+from starlette.responses import Response
+
+from scripts.data_version import VERSIONS_ID, bump_update, epoch_versions
+from app.json_response import dumps
+from scripts.metrics import RESPONSE_CACHE_REQUESTS
+
+# In-process cache for read endpoints. Entries are keyed by endpoint + parameters and
+# tagged with the data versions they depend on: a version bump makes the tag stale,
+# TTL bounds the age of anything else, and LRU bounds memory.
+
+class ResponseCache:
+    def __init__(self, db, max_entries=256, ttl=300.0, version_ttl=1.0):
+        self.db = db
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version_ttl = version_ttl
+        self.entries = OrderedDict()
+        self._versions = {}
+        self._versions_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    async def versions(self):
+        # Scripts bump versions out of process; re-read them at most every version_ttl seconds
+        now = time.monotonic()
+        if now - self._versions_at > self.version_ttl:
+            doc = await self.db.data_versions.find_one({"_id": VERSIONS_ID}) or {}
+            doc.pop("_id", None)
+            self._versions = doc
+            self._versions_at = now
+        return self._versions
+
+    async def bump(self, *scopes):
+        """Record an in-process write; visible to this process immediately"""
+        doc = await self.db.data_versions.find_one_and_update(
+            {"_id": VERSIONS_ID}, bump_update(*scopes), upsert=True, return_document=ReturnDocument.AFTER
+        )
+        doc.pop("_id", None)
+        self._versions = doc
+        self._versions_at = time.monotonic()
+
+    async def reset(self):
+        """After a factory reset: jump to fresh versions so no pre-reset ETag can match"""
+        versions = epoch_versions()
+        await self.db.data_versions.update_one({"_id": VERSIONS_ID}, {"$set": versions}, upsert=True)
+        self._versions = dict(versions)
+        self._versions_at = time.monotonic()
+        self.entries.clear()
+
+    def _tag(self, key, scopes, versions):
+        stamp = key + "|" + ",".join(f"{s}={versions.get(s, 0)}" for s in scopes)
+        return '"' + hashlib.sha1(stamp.encode("utf-8")).hexdigest() + '"'
+
+    def _store(self, key, tag, body):
+        self.entries[key] = (tag, time.monotonic(), body)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def respond(self, request: Request, key, scopes, compute):
+        """Serve `compute()` through the cache with a version-derived ETag (304 on match)"""
+        versions = await self.versions()
+        tag = self._tag(key, scopes, versions)
+        headers = {"ETag": tag, "Cache-Control": "no-cache"}
+
+        if request.headers.get("if-none-match") == tag:
+            RESPONSE_CACHE_REQUESTS.inc(result="not_modified")
+            return Response(status_code=304, headers=headers)
+
+        entry = self.entries.get(key)
+        if entry and entry[0] == tag and time.monotonic() - entry[1] < self.ttl:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            RESPONSE_CACHE_REQUESTS.inc(result="hit")
+            body = entry[2]
+        else:
+            self.misses += 1
+            RESPONSE_CACHE_REQUESTS.inc(result="miss")
+            body = dumps(await compute())
+            self._store(key, tag, body)
+
+        return Response(content=body, media_type="application/json", headers=headers)
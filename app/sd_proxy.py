@@ -0,0 +1,183 @@
+import asyncio
+import time
+
+import httpx
+
+# Read-only proxy for the SD WebUI option lists. One keep-alive client per instance,
+# concurrent fan-out to every configured instance, and a short TTL cache of the merged
+# result so a WebUI that is busy loading a checkpoint doesn't stall page loads.
+
+# Endpoint -> field that identifies the same entry across instances
+SD_LISTS = {
+    "models": ("/sdapi/v1/sd-models", "title"),
+    "samplers": ("/sdapi/v1/samplers", "name"),
+    "schedulers": ("/sdapi/v1/schedulers", "name"),
+}
+
+def merge_lists(results, key):
+    """Union of per-instance lists, first-seen order, each entry tagged with the
+    instances that have it"""
+    merged = {}
+    for url, items in results.items():
+        for item in items or []:
+            entry = merged.setdefault(item.get(key), dict(item, instances=[]))
+            entry["instances"].append(url)
+    return list(merged.values())
+
+class SDProxy:
+    def __init__(self, urls, ttl=60.0, timeout=5.0, connect_timeout=2.0, max_connections=4):
+        self.urls = [url.rstrip("/") for url in urls]
+        self.ttl = ttl
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.clients = {}
+        self.cache = {}
+        self.health = {}
+        self._locks = {}
+
+    def client(self, url):
+        if url not in self.clients:
+            self.clients[url] = httpx.AsyncClient(base_url=url, timeout=self.timeout, limits=self.limits)
+        return self.clients[url]
+
+    async def _get(self, url, path):
+        try:
+            resp = await self.client(url).get(path)
+            resp.raise_for_status()
+            self.health[url] = {"status": "online", "checked_at": time.time()}
+            return resp.json()
+        except (httpx.HTTPError, ValueError) as e:
+            self.health[url] = {"status": "offline", "error": str(e) or type(e).__name__, "checked_at": time.time()}
+            return None
+
+    async def fetch_all(self, path):
+        """GET `path` from every instance concurrently; {url: json or None}"""
+        results = await asyncio.gather(*(self._get(url, path) for url in self.urls))
+        return dict(zip(self.urls, results))
+
+    async def get_list(self, kind):
+        cached = self.cache.get(kind)
+        if cached and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+
+        # Concurrent page loads share one fan-out instead of each hitting every instance
+        lock = self._locks.setdefault(kind, asyncio.Lock())
+        async with lock:
+            cached = self.cache.get(kind)
+            if cached and time.monotonic() - cached[0] < self.ttl:
+                return cached[1]
+            path, key = SD_LISTS[kind]
+            results = await self.fetch_all(path)
+            merged = merge_lists(results, key)
+            if any(items is not None for items in results.values()):
+                self.cache[kind] = (time.monotonic(), merged)
+            elif cached:
+                # Every instance is down: keep serving the last good list
+                return cached[1]
+            return merged
+
+    def invalidate(self):
+        self.cache.clear()
+
+    def set_urls(self, urls):
+        """Switch to a new instance list; clients of removed instances are closed"""
+        self.urls = [url.rstrip("/") for url in urls]
+        removed = [self.clients.pop(url) for url in list(self.clients) if url not in self.urls]
+        for url in list(self.health):
+            if url not in self.urls:
+                del self.health[url]
+        self.invalidate()
+        if removed:
+            loop = asyncio.get_running_loop()
+            for client in removed:
+                loop.create_task(client.aclose())
+
+    async def close(self):
+        for client in self.clients.values():
+            await client.aclose()
+        self.clients = {}
+
+# Upper bounds for one scan request, so a single call can't fan out into thousands of probes
+MAX_SCAN_PORTS = 100
+MAX_SCAN_TARGETS = 256
+
+def parse_ports(spec):
+    """"7860-7869,8000" -> [7860, ..., 7869, 8000]; raises ValueError for bad or too many ports"""
+    ports = []
+    for part in str(spec).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        try:
+            first, last = int(start), int(end or start)
+        except ValueError:
+            raise ValueError(f"Invalid port range: {part}")
+        if not (0 < first <= last <= 65535):
+            raise ValueError(f"Invalid port range: {part}")
+        if len(ports) + last - first + 1 > MAX_SCAN_PORTS:
+            raise ValueError(f"At most {MAX_SCAN_PORTS} ports per scan")
+        ports.extend(range(first, last + 1))
+    return ports
+
+def scan_targets(urls=(), hosts=(), ports=()):
+    """Explicit URLs first, then every host:port combination, without duplicates.
+    Raises ValueError beyond MAX_SCAN_TARGETS."""
+    targets = [url.strip().rstrip("/") for url in urls if url.strip()]
+    if len(targets) + len(hosts) * len(ports) > MAX_SCAN_TARGETS:
+        raise ValueError(f"At most {MAX_SCAN_TARGETS} scan targets (URLs + hosts x ports)")
+    targets += [f"http://{host}:{port}" for host in hosts for port in ports]
+    return list(dict.fromkeys(targets))
+
+async def probe_instance(client, url, explicit=False):
+    """Model count, loaded checkpoint and queue state of one WebUI. None if nothing
+    listens there (unless the URL was given explicitly)"""
+    try:
+        resp = await client.get(f"{url}/sdapi/v1/sd-models")
+    except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+        return {"url": url, "model_count": 0, "status": "offline", "detail": str(e) or "Connection failed"} if explicit else None
+    except httpx.HTTPError as e:
+        return {"url": url, "model_count": 0, "status": "error", "detail": str(e) or type(e).__name__}
+
+    if resp.status_code != 200:
+        return {"url": url, "model_count": 0, "status": "error", "detail": f"HTTP {resp.status_code} (Check --api)"}
+
+    try:
+        result = {"url": url, "model_count": len(resp.json()), "status": "online"}
+    except ValueError:
+        return {"url": url, "model_count": 0, "status": "error", "detail": "Not an SD WebUI API"}
+    options, progress = await asyncio.gather(
+        client.get(f"{url}/sdapi/v1/options"),
+        client.get(f"{url}/sdapi/v1/progress", params={"skip_current_image": "true"}),
+        return_exceptions=True
+    )
+    try:
+        if isinstance(options, httpx.Response) and options.status_code == 200:
+            result["checkpoint"] = options.json().get("sd_model_checkpoint")
+        if isinstance(progress, httpx.Response) and progress.status_code == 200:
+            body = progress.json()
+            state = body.get("state", {})
+            result["queue"] = {
+                "busy": bool(state.get("job_count")) or (body.get("progress") or 0) > 0,
+                "job_count": state.get("job_count", 0),
+                "job": state.get("job", "")
+            }
+    except ValueError:
+        pass
+    return result
+
+async def scan_instances(urls=(), hosts=(), ports=(), connect_timeout=0.5, timeout=5.0, concurrency=32):
+    """Probe all targets concurrently, yielding each instance as soon as it answers"""
+    explicit = set(scan_targets(urls))
+    targets = scan_targets(urls, hosts, ports)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=httpx.Timeout(timeout, connect=connect_timeout)) as client:
+        async def bounded(url):
+            async with semaphore:
+                return await probe_instance(client, url, explicit=url in explicit)
+
+        for next_result in asyncio.as_completed([bounded(url) for url in targets]):
+            result = await next_result
+            if result is not None:
+                yield result
@@ -0,0 +1,160 @@
+import os
+import stat
+from email.utils import formatdate
+from mimetypes import guess_type
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Receive, Scope, Send
+
+# Originals (and hash-named uploads) are written once and never modified in place, so
+# they can be cached forever. Generations live at a fixed {model}/{image_id}.png and
+# are overwritten when regenerated: browsers must revalidate those (strong ETag -> 304).
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+def is_within(path, directories):
+    path = os.path.abspath(path)
+    for directory in directories:
+        directory = os.path.abspath(directory)
+        if path == directory or path.startswith(directory + os.sep):
+            return True
+    return False
+
+def cache_control(path, mutable_dirs=()):
+    return REVALIDATE_CACHE_CONTROL if is_within(path, mutable_dirs) else IMMUTABLE_CACHE_CONTROL
+
+def etag_matches(if_none_match, etag):
+    if if_none_match is None:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+# Header used to hand the transfer to a front proxy ("nginx" or "apache")
+OFFLOAD_HEADERS = {"nginx": "X-Accel-Redirect", "apache": "X-Sendfile"}
+
+def strong_etag(stat_result):
+    return f'"{stat_result.st_ino:x}-{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+def parse_range(range_header, size):
+    """Parse a single `bytes=` range. Returns (start, end) inclusive, None to serve the
+    whole file (absent or multi-range header), or raises ValueError if unsatisfiable."""
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start_text, _, end_text = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text == "":
+            # Suffix range: last N bytes
+            length = int(end_text)
+            if length <= 0:
+                raise ValueError("Empty suffix range")
+            return max(0, size - length), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+class FileRangeResponse(Response):
+    chunk_size = 256 * 1024
+
+    def __init__(self, path, start, end, headers, media_type, method=None):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.status_code = 206
+        self.media_type = media_type
+        self.background = None
+        self.send_header_only = method is not None and method.upper() == "HEAD"
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        count = self.end - self.start + 1
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            # Server supports sendfile(2) through the ASGI zero-copy extension
+            with open(self.path, "rb") as file:
+                await send({"type": "http.response.zerocopysend", "file": file, "offset": self.start, "count": count})
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            remaining = count
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+class DataFiles(StaticFiles):
+    """StaticFiles for the /data mount with immutable caching, strong validators,
+    single-range requests and optional X-Accel-Redirect/X-Sendfile offloading.
+    `mutable_dirs()` returns the directories whose files may be overwritten in place."""
+
+    def __init__(self, *args, offload=None, offload_prefix="/internal-data/", mutable_dirs=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.mutable_dirs = mutable_dirs or (lambda: ())
+        if offload and offload not in OFFLOAD_HEADERS:
+            raise ValueError(f"Unsupported offload mode: {offload}")
+        self.offload = offload
+        self.offload_prefix = offload_prefix.rstrip("/") + "/"
+
+    def set_directory(self, directory):
+        """Serve from a new root (DATA_DIR changed in the settings)"""
+        self.directory = directory
+        self.all_directories = self.get_directories(directory)
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        method = scope["method"]
+        request_headers = Headers(scope=scope)
+        etag = strong_etag(stat_result)
+        media_type = guess_type(str(full_path))[0] or "application/octet-stream"
+        headers = {
+            "etag": etag,
+            "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+            "cache-control": cache_control(full_path, self.mutable_dirs()),
+            "accept-ranges": "bytes",
+        }
+
+        if status_code == 200 and self.is_not_modified(Headers(headers), request_headers):
+            return Response(status_code=304, headers=headers)
+
+        if self.offload and status_code == 200:
+            rel_path = os.path.relpath(full_path, self.directory).replace("\\", "/")
+            headers[OFFLOAD_HEADERS[self.offload].lower()] = (
+                self.offload_prefix + rel_path if self.offload == "nginx" else os.path.abspath(full_path)
+            )
+            return Response(status_code=200, headers=headers, media_type=media_type)
+
+        size = stat_result.st_size
+        if_range = request_headers.get("if-range")
+        if status_code == 200 and stat.S_ISREG(stat_result.st_mode) and (if_range is None or if_range == etag):
+            try:
+                byte_range = parse_range(request_headers.get("range"), size)
+            except ValueError:
+                return Response(status_code=416, headers={**headers, "content-range": f"bytes */{size}"})
+            if byte_range is not None:
+                start, end = byte_range
+                headers["content-range"] = f"bytes {start}-{end}/{size}"
+                headers["content-length"] = str(end - start + 1)
+                return FileRangeResponse(full_path, start, end, headers, media_type, method=method)
+
+        return FileResponse(full_path, status_code=status_code, headers=headers, media_type=media_type, stat_result=stat_result, method=method)
+
+    def is_not_modified(self, response_headers: Headers, request_headers: Headers) -> bool:
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            # ETag takes precedence over If-Modified-Since
+            return etag_matches(if_none_match, response_headers["etag"])
+        return super().is_not_modified(response_headers, request_headers)
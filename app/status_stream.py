@@ -0,0 +1,141 @@
+import asyncio
+import json
+from pymongo.errors import PyMongoError
+
+# Pushes task status and collection counters to browser tabs over server-sent events.
+# A single watcher per process feeds every subscriber: a MongoDB change stream on
+# system_status when the server supports it (replica set), otherwise one shared poll.
+
+def format_status(doc):
+    return {
+        "status": doc.get("status", "idle"),
+        "progress": doc.get("progress", 0),
+        "message": doc.get("message", ""),
+        "current": doc.get("current", 0),
+        "total": doc.get("total", 0),
+        "rate": doc.get("rate"),
+        "eta_seconds": doc.get("eta_seconds")
+    }
+
+def diff(old, new):
+    """Changed/added keys with their new value, removed keys as None"""
+    delta = {k: v for k, v in new.items() if old.get(k) != v}
+    delta.update({k: None for k in old if k not in new})
+    return delta
+
+class StatusBroadcaster:
+    def __init__(self, db, poll_interval=1.0, stats_interval=5.0, queue_size=100):
+        self.db = db
+        self.poll_interval = poll_interval
+        self.stats_interval = stats_interval
+        self.queue_size = queue_size
+        self.tasks = {}
+        self.stats = {}
+        self.subscribers = set()
+        self.mode = None
+        self._watchers = []
+
+    def snapshot(self):
+        return {"tasks": self.tasks, "stats": self.stats}
+
+    async def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(queue)
+        if not self._watchers:
+            self._watchers = [asyncio.create_task(self._watch_tasks()), asyncio.create_task(self._watch_stats())]
+            # Prime the snapshot so the first subscriber starts from current state
+            await self.refresh_tasks()
+            await self.refresh_stats()
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+        if not self.subscribers:
+            # Nobody listening: stop touching Mongo
+            for watcher in self._watchers:
+                watcher.cancel()
+            self._watchers = []
+            self.mode = None
+
+    def _publish(self, event, data):
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                # Slow client: drop its backlog and resync it with a full snapshot
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(("snapshot", self.snapshot()))
+
+    def _apply_tasks(self, tasks):
+        delta = diff(self.tasks, tasks)
+        if delta:
+            self.tasks = tasks
+            self._publish("delta", {"tasks": delta})
+
+    async def refresh_tasks(self):
+        docs = await self.db.system_status.find({}).to_list(length=100)
+        self._apply_tasks({doc["_id"]: format_status(doc) for doc in docs})
+
+    async def refresh_stats(self):
+        stats = {
+            "authors": await self.db.authors.estimated_document_count(),
+            "images": await self.db.images.estimated_document_count(),
+            "generations": await self.db.generations.estimated_document_count()
+        }
+        delta = diff(self.stats, stats)
+        if delta:
+            self.stats = stats
+            self._publish("delta", {"stats": delta})
+
+    async def _watch_tasks(self):
+        try:
+            async with self.db.system_status.watch(full_document="updateLookup") as stream:
+                self.mode = "change_stream"
+                async for change in stream:
+                    task_id = change["documentKey"]["_id"]
+                    tasks = dict(self.tasks)
+                    if change["operationType"] == "delete" or not change.get("fullDocument"):
+                        tasks.pop(task_id, None)
+                    else:
+                        tasks[task_id] = format_status(change["fullDocument"])
+                    self._apply_tasks(tasks)
+        except asyncio.CancelledError:
+            raise
+        except PyMongoError as e:
+            # Standalone servers don't support change streams
+            print(f"Status change stream unavailable, polling instead: {e}")
+
+        self.mode = "poll"
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.refresh_tasks()
+            except PyMongoError as e:
+                print(f"Status poll failed: {e}")
+
+    async def _watch_stats(self):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            try:
+                await self.refresh_stats()
+            except PyMongoError as e:
+                print(f"Stats poll failed: {e}")
+
+    async def events(self, heartbeat=15.0):
+        """Server-sent event stream: one full snapshot, then deltas only"""
+        queue = await self.subscribe()
+        # Anything already queued is contained in the snapshot
+        while not queue.empty():
+            queue.get_nowait()
+        try:
+            yield f"event: snapshot\ndata: {json.dumps(self.snapshot(), default=str)}\n\n"
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+        finally:
+            self.unsubscribe(queue)
@@ -1,7 +1,23 @@
 import asyncio
+import concurrent.futures
+import os
+import socket
+import threading
+import time
+import uuid
 from enum import Enum
-from datetime import datetime
-from typing import Dict, Optional
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from scripts.status_reporter import close_reporter
+
+# In-process job runner. Pipelines (scraper, generator, style analysis, aggregation)
+# run in a shared worker pool instead of a fresh interpreter per run, so imports, config
+# and loaded models are paid for once. Pause/cancel are in-memory events the pipelines
+# check between items; system_status stays the persisted view (with a heartbeat and the
+# owning runner) so a crashed or restarted server never leaves a task stuck "running".
+
+ACTIVE_STATES = ["starting", "running", "paused"]
 
 class TaskState(Enum):
     IDLE = "idle"
@@ -21,9 +37,13 @@ class Task:
         self.current = 0
         self.total = 0
         self.created_at = datetime.now()
-        self._cancel_event = asyncio.Event()
-        self._pause_event = asyncio.Event()
+        self.heartbeat_at = time.monotonic()
+        self.future: Optional[concurrent.futures.Future] = None
+        # threading events: checked from worker threads, set from the event loop
+        self._cancel_event = threading.Event()
+        self._pause_event = threading.Event()
         self._pause_event.set() # Initially not paused
+        self._cancel_callbacks = []
 
     @property
     def is_cancelled(self):
@@ -33,14 +53,35 @@ class Task:
     def is_paused(self):
         return not self._pause_event.is_set()
 
+    @property
+    def is_active(self):
+        return self.future is not None and not self.future.done()
+
     async def wait_if_paused(self):
-        await self._pause_event.wait()
+        while self.is_paused and not self.is_cancelled:
+            await asyncio.sleep(0.2)
+
+    def check(self):
+        """Called by pipelines between items: blocks while paused, then returns
+        "cancel" or "running" (the same values as the scripts' check_control)"""
+        self.heartbeat_at = time.monotonic()
+        while not self._pause_event.wait(timeout=1.0):
+            self.heartbeat_at = time.monotonic()
+        return "cancel" if self.is_cancelled else "running"
+
+    def on_cancel(self, callback):
+        """Run `callback` in a thread when the task is cancelled (e.g. interrupt GPUs)"""
+        self._cancel_callbacks.append(callback)
 
     def cancel(self):
+        already = self.is_cancelled
         self.state = TaskState.CANCELLED
         self._cancel_event.set()
         # Ensure we don't get stuck in pause when cancelling
         self._pause_event.set()
+        if not already:
+            for callback in self._cancel_callbacks:
+                threading.Thread(target=callback, daemon=True).start()
 
     def pause(self):
         if self.state == TaskState.RUNNING:
@@ -57,6 +98,7 @@ class Task:
         self.message = message
         self.current = current
         self.total = total
+        self.heartbeat_at = time.monotonic()
 
     def to_dict(self):
         return {
@@ -70,9 +112,31 @@ class Task:
             "created_at": self.created_at.isoformat()
         }
 
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        # Exists but not ours, or the platform can't tell
+        return True
+    return True
+
+class TaskAlreadyRunning(RuntimeError):
+    pass
+
 class TaskManager:
-    def __init__(self):
+    def __init__(self, db=None, max_workers=4, heartbeat_interval=10.0, stale_after=60.0):
+        # `db` is a sync (pymongo) handle; the runner only touches it from worker threads
+        self.db = db
         self.tasks: Dict[str, Task] = {}
+        self.max_workers = max_workers
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.runner_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._pool = None
+        self._lock = threading.Lock()
+        self._heartbeat = None
 
     def create_task(self, task_id: str, name: str) -> Task:
         task = Task(task_id, name)
@@ -100,5 +164,117 @@ class TaskManager:
     def get_all_tasks(self):
         return {tid: task.to_dict() for tid, task in self.tasks.items()}
 
-# Global instance
-task_manager = TaskManager()
+    # --- Running jobs ---
+
+    def pool(self):
+        if self._pool is None:
+            self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+        return self._pool
+
+    def start(self, task_id: str, name: str, fn: Callable, *args, params=None) -> Task:
+        """Run `fn(task, db, *args)` in the worker pool as `task_id`.
+        Raises TaskAlreadyRunning if that task is still active in this process."""
+        with self._lock:
+            existing = self.get_task(task_id)
+            if existing and existing.is_active:
+                raise TaskAlreadyRunning(f"{name} is already running")
+            task = self.create_task(task_id, name)
+            task.state = TaskState.RUNNING
+            task.future = self.pool().submit(self._run, task, fn, args, params or {})
+        self._ensure_heartbeat()
+        return task
+
+    def _run(self, task, fn, args, params):
+        self._set_status(task.id, {
+            "status": "starting",
+            "control": "running",
+            "progress": 0,
+            "message": f"Starting {task.name.lower()}...",
+            "runner": self.runner_id,
+            "params": params,
+            "heartbeat_at": datetime.now(),
+            "updated_at": datetime.now()
+        })
+        try:
+            fn(task, self.db, *args)
+            # Coalesced progress must land before the final state
+            close_reporter(task.id)
+            if task.is_cancelled:
+                self._set_status(task.id, {"status": "cancelled", "message": "Cancelled"})
+            else:
+                task.state = TaskState.COMPLETED
+        except Exception as e:
+            close_reporter(task.id)
+            print(f"Task {task.id} failed: {e}")
+            task.state = TaskState.ERROR
+            self._set_status(task.id, {"status": "error", "message": f"Error: {e}"})
+        finally:
+            self._set_status(task.id, {"runner": None, "heartbeat_at": datetime.now()})
+
+    def _set_status(self, task_id, fields):
+        if self.db is None:
+            return
+        try:
+            self.db.system_status.update_one({"_id": task_id}, {"$set": fields}, upsert=True)
+        except Exception as e:
+            print(f"Could not record status for {task_id}: {e}")
+
+    # --- Heartbeats and stale jobs ---
+
+    def _ensure_heartbeat(self):
+        if self._heartbeat is None or not self._heartbeat.is_alive():
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+            self._heartbeat.start()
+
+    def _heartbeat_loop(self):
+        while any(task.is_active for task in list(self.tasks.values())):
+            for task in list(self.tasks.values()):
+                if task.is_active:
+                    self._set_status(task.id, {"heartbeat_at": datetime.now(), "runner": self.runner_id})
+            self.recover_stale()
+            time.sleep(self.heartbeat_interval)
+
+    def recover_stale(self):
+        """Mark tasks whose runner stopped heartbeating (crash, restart, killed worker)
+        as interrupted. Returns the affected task ids."""
+        if self.db is None:
+            return []
+        cutoff = datetime.now() - timedelta(seconds=self.stale_after)
+        query = {
+            "status": {"$in": ACTIVE_STATES},
+            "runner": {"$nin": [None, self.runner_id]},
+            "heartbeat_at": {"$lt": cutoff}
+        }
+        stale = [doc["_id"] for doc in self.db.system_status.find(query, {"_id": 1})]
+        for task_id in stale:
+            self.db.system_status.update_one(
+                {"_id": task_id, **query},
+                {"$set": {"status": "error", "message": "Interrupted: the worker running this task stopped", "runner": None, "updated_at": datetime.now()}}
+            )
+        return stale
+
+    def recover_orphans(self):
+        """Startup reconciliation: tasks owned by a dead process on this host are
+        interrupted right away, other runners once their heartbeat goes stale"""
+        if self.db is None:
+            return []
+        host = socket.gethostname()
+        orphaned = []
+        for doc in self.db.system_status.find({"status": {"$in": ACTIVE_STATES}, "runner": {"$nin": [None, self.runner_id]}}, {"runner": 1}):
+            runner_host, _, rest = str(doc["runner"]).partition(":")
+            pid = rest.partition(":")[0]
+            if runner_host == host and pid.isdigit() and not pid_alive(int(pid)):
+                orphaned.append(doc["_id"])
+        for task_id in orphaned:
+            self.db.system_status.update_one(
+                {"_id": task_id},
+                {"$set": {"status": "error", "message": "Interrupted: the server restarted while this task was running", "runner": None, "updated_at": datetime.now()}}
+            )
+        return orphaned + self.recover_stale()
+
+    def shutdown(self):
+        for task in self.tasks.values():
+            if task.is_active:
+                task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
@@ -0,0 +1,220 @@
+import csv
+import glob
+import hashlib
+import io
+import json
+import os
+import tarfile
+import tempfile
+import zipfile
+from datetime import datetime
+
+from pymongo.errors import BulkWriteError
+
+from scripts.author_counters import generation_added_update
+from scripts.data_paths import data_url
+
+# Manual uploads are stored content-addressed (sha256 of the bytes) so identical files
+# share one copy on disk and one generation document. The file work here is blocking
+# and is run in the executor; only the final inserts touch the event loop.
+
+CHUNK_SIZE = 1024 * 1024
+
+IMAGE_EXTENSIONS = [".png", ".jpg", ".jpeg", ".webp"]
+
+MANIFEST_NAMES = ["manifest.json", "manifest.csv"]
+
+# Manifest columns copied onto the generation document
+MANIFEST_FIELDS = {"original_image_id": int, "author_id": int, "model": str, "prompt": str, "steps": int, "cfg": float}
+
+class UploadError(ValueError):
+    pass
+
+def store_stream(fileobj, filename, dest_dir):
+    """Copy `fileobj` into dest_dir while hashing it. Returns (sha256, path); when the
+    same bytes are already stored (under any extension) the existing file is kept and
+    the copy discarded."""
+    ext = os.path.splitext(filename or "")[1].lower() or ".png"
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=dest_dir, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = fileobj.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+        content_hash = digest.hexdigest()
+        # .jpg vs .jpeg (or a renamed file) must not leave a second copy behind
+        stored = sorted(glob.glob(os.path.join(glob.escape(dest_dir), f"manual_{content_hash}.*")))
+        stored = [path for path in stored if not path.endswith(".part")]
+        if stored:
+            os.remove(tmp_path)
+            return content_hash, stored[0]
+        file_path = os.path.join(dest_dir, f"manual_{content_hash}{ext}")
+        os.replace(tmp_path, file_path)
+        return content_hash, file_path
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def parse_manifest(text, name="manifest.json"):
+    """{file name: metadata} from a JSON list/object or a CSV with a `file` column"""
+    if name.endswith(".csv"):
+        rows = list(csv.DictReader(io.StringIO(text)))
+    else:
+        data = json.loads(text)
+        rows = [dict(meta, file=file) for file, meta in data.items()] if isinstance(data, dict) else data
+
+    manifest = {}
+    for row in rows:
+        file = os.path.basename(str(row.get("file") or ""))
+        if not file:
+            raise UploadError("Manifest entry without a file name")
+        meta = {}
+        for field, cast in MANIFEST_FIELDS.items():
+            if row.get(field) not in (None, ""):
+                try:
+                    meta[field] = cast(row[field])
+                except (TypeError, ValueError):
+                    raise UploadError(f"Invalid {field} for {file}: {row[field]}")
+        if "original_image_id" not in meta or "model" not in meta:
+            raise UploadError(f"Manifest entry for {file} needs original_image_id and model")
+        manifest[file] = meta
+    return manifest
+
+def open_archive(fileobj, filename):
+    """ZipFile or TarFile over a seekable upload, plus {name: member} of its regular files"""
+    fileobj.seek(0)
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        archive = zipfile.ZipFile(fileobj)
+        return archive, {info.filename: info for info in archive.infolist() if not info.is_dir()}
+    fileobj.seek(0)
+    try:
+        archive = tarfile.open(fileobj=fileobj, mode="r:*")
+    except tarfile.TarError:
+        raise UploadError(f"{filename} is not a zip or tar archive")
+    return archive, {info.name: info for info in archive.getmembers() if info.isfile()}
+
+def read_member(archive, member):
+    return archive.open(member) if isinstance(archive, zipfile.ZipFile) else archive.extractfile(member)
+
+def extract_archive(fileobj, filename, dest_dir, manifest_text=None, manifest_name="manifest.json"):
+    """Store every image listed in the manifest; returns (entries, errors).
+
+    The manifest comes from the request or, failing that, from manifest.json/.csv at
+    any depth inside the archive. Listed members are streamed straight to dest_dir.
+    """
+    archive, members = open_archive(fileobj, filename)
+    with archive:
+        by_base = {}
+        for name, member in members.items():
+            by_base.setdefault(os.path.basename(name), member)
+
+        if manifest_text:
+            manifest = parse_manifest(manifest_text, manifest_name)
+        else:
+            found = next((base for base in MANIFEST_NAMES if base in by_base), None)
+            if found is None:
+                raise UploadError("No manifest given and none found in the archive")
+            with read_member(archive, by_base[found]) as member:
+                manifest = parse_manifest(member.read().decode("utf-8-sig"), found)
+
+        entries, errors = [], []
+        for file, meta in manifest.items():
+            if file not in by_base:
+                errors.append({"file": file, "detail": "Listed in manifest but not in archive"})
+                continue
+            if os.path.splitext(file)[1].lower() not in IMAGE_EXTENSIONS:
+                errors.append({"file": file, "detail": "Not an image"})
+                continue
+            with read_member(archive, by_base[file]) as member:
+                content_hash, file_path = store_stream(member, file, dest_dir)
+            entries.append({"file": file, "content_hash": content_hash, "local_path": file_path, "meta": meta})
+    return entries, errors
+
+def generation_doc(meta, content_hash, file_path):
+    return {
+        "original_image_id": meta["original_image_id"],
+        "author_id": meta.get("author_id"),
+        "model": meta["model"],
+        "prompt": meta.get("prompt", ""),
+        "steps": meta.get("steps"),
+        "cfg": meta.get("cfg"),
+        "local_path": file_path,
+        "url": data_url(file_path),
+        "content_hash": content_hash,
+        "created_at": datetime.now(),
+        "is_manual": True
+    }
+
+async def insert_upload(db, doc):
+    """Insert one manual generation unless the same content exists; returns (id, created)"""
+    result = await db.generations.update_one({"content_hash": doc["content_hash"]}, {"$setOnInsert": doc}, upsert=True)
+    if result.upserted_id is not None:
+        await db.authors.update_one({"_id": doc["author_id"]}, generation_added_update(doc["model"]))
+        return result.upserted_id, True
+    existing = await db.generations.find_one({"content_hash": doc["content_hash"]}, {"_id": 1, "local_path": 1})
+    if existing.get("local_path") and existing["local_path"] != doc["local_path"] and os.path.exists(existing["local_path"]):
+        # The stored generation has its own copy; drop the one just written
+        try:
+            os.remove(doc["local_path"])
+        except OSError:
+            pass
+    return existing["_id"], False
+
+async def insert_archive_entries(db, entries):
+    """Bulk-insert archive entries, skipping content already stored. Returns
+    (inserted docs, duplicate file names, errors)."""
+    # Same bytes twice in one archive count once
+    unique = {}
+    duplicates = []
+    for entry in entries:
+        if entry["content_hash"] in unique:
+            duplicates.append(entry["file"])
+        else:
+            unique[entry["content_hash"]] = entry
+
+    existing = set(await db.generations.distinct("content_hash", {"content_hash": {"$in": list(unique)}}))
+    duplicates += [entry["file"] for h, entry in unique.items() if h in existing]
+    pending = [entry for h, entry in unique.items() if h not in existing]
+
+    # Fill in author_id from the originals with one query
+    original_ids = list({e["meta"]["original_image_id"] for e in pending if "author_id" not in e["meta"]})
+    authors = {}
+    if original_ids:
+        async for image in db.images.find({"_id": {"$in": original_ids}}, {"author_id": 1}):
+            authors[image["_id"]] = image["author_id"]
+
+    docs, files, errors = [], [], []
+    for entry in pending:
+        meta = dict(entry["meta"])
+        meta.setdefault("author_id", authors.get(meta["original_image_id"]))
+        if meta["author_id"] is None:
+            errors.append({"file": entry["file"], "detail": f"Unknown original_image_id {meta['original_image_id']}"})
+            continue
+        docs.append(generation_doc(meta, entry["content_hash"], entry["local_path"]))
+        files.append(entry["file"])
+
+    if not docs:
+        return [], duplicates, errors
+
+    try:
+        await db.generations.insert_many(docs, ordered=False)
+        inserted = docs
+    except BulkWriteError as e:
+        # A concurrent upload stored some of the same content first
+        failed = {err["index"] for err in e.details.get("writeErrors", [])}
+        inserted = [doc for i, doc in enumerate(docs) if i not in failed]
+        duplicates += [files[i] for i in sorted(failed)]
+
+    counts = {}
+    for doc in inserted:
+        key = (doc["author_id"], doc["model"])
+        counts[key] = counts.get(key, 0) + 1
+    for (author_id, model), count in counts.items():
+        await db.authors.update_one({"_id": author_id}, generation_added_update(model, count))
+    return inserted, duplicates, errors
@@ -22,6 +22,33 @@ SD_API_URLS = [
 ]
 SD_API_URL = SD_API_URLS[0]  # For backward compatibility
 
+# Seconds to cache the merged model/sampler/scheduler lists fetched from the instances
+SD_LIST_CACHE_TTL = 60
+
+# Where "Scan" in the settings looks for WebUI instances (ports: "7860-7869,8000")
+SD_SCAN_HOSTS = ["127.0.0.1"]
+SD_SCAN_PORTS = "7860-7869"
+
+# Scraper: authors/downloads in flight, and starting requests per second for the
+# Danbooru API, the image CDNs and Gelbooru (halved on 429/503, then slowly restored)
+SCRAPER_CONCURRENCY = 4
+DANBOORU_API_RATE = 2.0
+DANBOORU_CDN_RATE = 8.0
+GELBOORU_RATE = 1.0
+
+# Seconds Danbooru/Gelbooru JSON responses are reused from DATA_DIR/http_cache before
+# being revalidated (ETag/Last-Modified); 0 disables the cache
+BOORU_CACHE_TTL = 3600
+# Size cap of that cache in MB (oldest entries are pruned first; 0 = unbounded)
+BOORU_CACHE_MAX_MB = 512
+
+# URL imports: parallel downloads and requests per second per booru host
+IMPORT_CONCURRENCY = 4
+IMPORT_RATE_LIMIT = 2.0
+
+# Scraper/generator/style jobs started from the UI run in this many worker threads
+JOB_WORKERS = 4
+
 # Directory Configuration
 # Base directory for all data
 # IMPORTANT: Change this to your preferred location
@@ -35,6 +62,12 @@ IMAGES_DIR = os.path.join(DATA_DIR, "images")
 # Example: r"h:\danbooru_generated" or r"d:\generated_images"
 GENERATED_DIR = os.path.join(DATA_DIR, "generated")
 
+# Let a front proxy serve files under /data instead of the Python worker
+# "nginx" sends X-Accel-Redirect to DATA_OFFLOAD_PREFIX + relative path (map it with an internal location)
+# "apache" sends X-Sendfile with the absolute path (requires mod_xsendfile)
+DATA_OFFLOAD = None
+DATA_OFFLOAD_PREFIX = "/internal-data/"
+
 # Create directories if they don't exist
 os.makedirs(IMAGES_DIR, exist_ok=True)
 os.makedirs(GENERATED_DIR, exist_ok=True)
@@ -43,39 +76,8 @@ os.makedirs(GENERATED_DIR, exist_ok=True)
 STYLE_HTML_PATH = None
 STYLE_SAMPLES_DIR = None
 
-# Load configuration from MongoDB if available
-try:
-    from pymongo import MongoClient
-    
-    def load_config_from_db():
-        global MONGO_URI, DB_NAME, DATA_DIR, SD_API_URLS, SD_API_URL, STYLE_HTML_PATH, STYLE_SAMPLES_DIR
-        
-        try:
-            client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=2000)
-            db = client[DB_NAME]
-            config = db.app_config.find_one({"_id": "settings"})
-            
-            if config:
-                print("Loading configuration from MongoDB...")
-                if 'mongo_uri' in config: MONGO_URI = config['mongo_uri']
-                if 'db_name' in config: DB_NAME = config['db_name']
-                if 'data_dir' in config: DATA_DIR = config['data_dir']
-                if 'sd_api_urls' in config and config['sd_api_urls']: 
-                    SD_API_URLS = config['sd_api_urls']
-                    SD_API_URL = SD_API_URLS[0]
-                if 'style_html_path' in config: STYLE_HTML_PATH = config['style_html_path']
-                if 'style_samples_dir' in config: STYLE_SAMPLES_DIR = config['style_samples_dir']
-                
-                # Update derived paths
-                global IMAGES_DIR, GENERATED_DIR
-                IMAGES_DIR = os.path.join(DATA_DIR, "images")
-                GENERATED_DIR = os.path.join(DATA_DIR, "generated")
-                
-        except Exception as e:
-            print(f"Failed to load config from DB: {e}")
-
-    # Load config on startup
-    load_config_from_db()
-
-except ImportError:
-    print("pymongo not installed, skipping DB config load")
+# Settings saved from the web UI (app_config in MongoDB) override the values above and
+# are read lazily on first use (scripts/settings.py); most apply without a restart.
+# MONGO_URI and DB_NAME are never taken from the database.
+# Any setting can also be overridden from the environment, e.g.
+#   DANBOORU_RANKER_DATA_DIR=/mnt/data  DANBOORU_RANKER_SD_API_URLS='["http://gpu1:7860"]'
@@ -1,29 +1,27 @@
 
 from pymongo import MongoClient
 from collections import Counter
+import os
+import sys
 
-MONGO_URI = "mongodb://localhost:27017/"
-DB_NAME = "danbooru_ranker"
+# Add parent directory to path to import shared modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from datetime import datetime
+from scripts.db_schema import ensure_schema
+from scripts.data_version import bump
+from scripts.status_reporter import status_reporter
+from scripts.settings import settings
 
 def update_status(db, status, progress=0, message="", current=0, total=0):
-    db.system_status.update_one(
-        {"_id": "aggregator"},
-        {"$set": {
-            "status": status,
-            "progress": progress,
-            "current": current,
-            "total": total,
-            "message": message,
-            "updated_at": datetime.now()
-        }},
-        upsert=True
-    )
+    # Coalesced: written by a background thread at a bounded rate (state changes immediately)
+    status_reporter(db, "aggregator").update(status, progress, message, current, total)
 
-def aggregate_styles():
-    client = MongoClient(MONGO_URI)
-    db = client[DB_NAME]
+def aggregate_styles(db=None, task=None):
+    """Most common image style per author; `task` is the app job runner's Task when run in-process"""
+    if db is None:
+        client = MongoClient(settings.MONGO_URI)
+        db = client[settings.DB_NAME]
+        ensure_schema(db)
     
     print("Aggregating styles for authors...")
     
@@ -35,6 +33,10 @@ def aggregate_styles():
     processed = 0
     
     for author in authors:
+        if task is not None and task.check() == "cancel":
+            print("Aggregation cancelled.")
+            bump(db, "authors", "styles")
+            return
         processed += 1
         progress = int((processed / total_authors) * 100) if total_authors > 0 else 0
         
@@ -67,6 +69,7 @@ def aggregate_styles():
             )
             count += 1
             
+    bump(db, "authors", "styles")
     print(f"Updated {count} authors with style categories.")
     update_status(db, "idle", 100, f"Aggregation complete. Updated {count} authors.", processed, total_authors)
 
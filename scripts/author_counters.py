@@ -0,0 +1,92 @@
+import os
+import sys
+import pymongo
+
+# Add parent directory to path to import config
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Materialized counters stored on each author document:
+#   image_count - number of original images
+#   gen_count   - number of generations (all models)
+#   gen_counts  - {model_key: count} per model
+# They are maintained with $inc by every writer (scraper, generator, upload, import)
+# so /api/authors can sort and page with a single indexed query.
+
+def model_key(model):
+    """Encode a model name so it can be used as a MongoDB field name.
+    Checkpoint titles contain dots (e.g. 'model.safetensors') which Mongo treats as paths."""
+    return (model or "unknown").replace(".", "．").replace("$", "＄")
+
+def model_from_key(key):
+    return key.replace("．", ".").replace("＄", "$")
+
+def initial_counters():
+    """Counters for a newly inserted author, so count sorts never page over missing values"""
+    return {"image_count": 0, "gen_count": 0, "gen_counts": {}}
+
+def image_added_update(count=1):
+    return {"$inc": {"image_count": count}}
+
+def generation_added_update(model, count=1):
+    return {"$inc": {"gen_count": count, f"gen_counts.{model_key(model)}": count}}
+
+def on_image_added(db, author_id, count=1):
+    """Sync (pymongo) helper for scripts"""
+    db.authors.update_one({"_id": author_id}, image_added_update(count))
+
+def on_generation_added(db, author_id, model, count=1):
+    """Sync (pymongo) helper for scripts"""
+    db.authors.update_one({"_id": author_id}, generation_added_update(model, count))
+
+def rebuild_author_counters(db):
+    """Recompute all counters from the images and generations collections.
+    Used to backfill existing databases and to repair drift."""
+    print("Rebuilding author counters...")
+
+    image_counts = {
+        doc["_id"]: doc["count"]
+        for doc in db.images.aggregate([{"$group": {"_id": "$author_id", "count": {"$sum": 1}}}])
+    }
+
+    gen_counts = {}
+    for doc in db.generations.aggregate([
+        {"$group": {"_id": {"author_id": "$author_id", "model": "$model"}, "count": {"$sum": 1}}}
+    ]):
+        per_model = gen_counts.setdefault(doc["_id"]["author_id"], {})
+        key = model_key(doc["_id"].get("model"))
+        per_model[key] = per_model.get(key, 0) + doc["count"]
+
+    ops = []
+    updated = 0
+    for author in db.authors.find({}, {"_id": 1}):
+        author_id = author["_id"]
+        per_model = gen_counts.get(author_id, {})
+        ops.append(pymongo.UpdateOne({"_id": author_id}, {"$set": {
+            "image_count": image_counts.get(author_id, 0),
+            "gen_count": sum(per_model.values()),
+            "gen_counts": per_model
+        }}))
+
+        if len(ops) >= 1000:
+            updated += db.authors.bulk_write(ops, ordered=False).modified_count
+            ops = []
+
+    if ops:
+        updated += db.authors.bulk_write(ops, ordered=False).modified_count
+
+    print(f"Updated counters on {updated} authors.")
+    return updated
+
+def backfill_initial_counters(db):
+    """Set zero counters on authors inserted without them"""
+    updated = 0
+    for field, value in initial_counters().items():
+        updated += db.authors.update_many({field: {"$exists": False}}, {"$set": {field: value}}).modified_count
+    print(f"Initialized missing counters on {updated} author fields.")
+    return updated
+
+if __name__ == "__main__":
+    from scripts.settings import settings
+
+    client = pymongo.MongoClient(settings.MONGO_URI)
+    rebuild_author_counters(client[settings.DB_NAME])
@@ -0,0 +1,42 @@
+import re
+import pymongo
+
+# Authors carry a `search_keys` array (multikey index) holding the normalized name and
+# every alias from other_names. Anchored prefix regexes on it are index range scans,
+# and exact lookups (e.g. matching Gelbooru tags to artists) are plain $in queries.
+
+def normalize_name(name):
+    """Normalize to Danbooru tag form: lowercase, underscores instead of spaces"""
+    return "_".join((name or "").strip().lower().split())
+
+def search_keys(name, other_names=None):
+    keys = []
+    for value in [name] + list(other_names or []):
+        key = normalize_name(value)
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+def prefix_query(text):
+    """Query matching authors whose name or any alias starts with `text`"""
+    key = normalize_name(text)
+    if not key:
+        return {}
+    # Case-sensitive and anchored so MongoDB can bound the index scan
+    return {"search_keys": {"$regex": "^" + re.escape(key)}}
+
+def tags_query(tags):
+    """Query matching authors whose name or alias equals one of the given tags"""
+    keys = [normalize_name(t) for t in tags if t]
+    return {"search_keys": {"$in": [k for k in keys if k]}}
+
+def backfill_search_keys(db):
+    ops = []
+    for author in db.authors.find({"search_keys": {"$exists": False}}, {"name": 1, "other_names": 1}):
+        keys = search_keys(author.get("name"), author.get("other_names"))
+        ops.append(pymongo.UpdateOne({"_id": author["_id"]}, {"$set": {"search_keys": keys}}))
+        if len(ops) >= 1000:
+            db.authors.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        db.authors.bulk_write(ops, ordered=False)
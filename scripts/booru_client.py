@@ -0,0 +1,326 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import urlencode, urlparse
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+# Add parent directory to path to import config
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.settings import settings
+from scripts.rate_limit import AdaptiveRateLimiter, THROTTLE_STATUSES, retry_after_seconds
+from scripts.metrics import BOORU_REQUESTS, BOORU_REQUEST_SECONDS, BOORU_CACHE_REQUESTS
+
+# One HTTP client for every Danbooru/Gelbooru call: the scraper, GelbooruScraper and
+# URL imports. Connections are pooled (keep-alive), transient failures are retried
+# with jittered exponential backoff, and JSON responses can be kept in an on-disk
+# cache keyed by URL + parameters. Within BOORU_CACHE_TTL a cached body is served as
+# is; after that it is revalidated with If-None-Match/If-Modified-Since, so an
+# unchanged listing costs a 304 instead of a full response. The cache is pruned in the
+# background every PRUNE_EVERY writes: entries older than CACHE_MAX_AGE go first, then
+# the least recently stored ones until it fits in BOORU_CACHE_MAX_MB.
+# BooruClient is the blocking (requests) flavour, AsyncBooruClient the httpx one.
+
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+MAX_ATTEMPTS = 4
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 30.0
+
+PRUNE_EVERY = 500
+CACHE_MAX_AGE = 7 * 24 * 3600
+
+def backoff_delay(attempt, retry_after=None):
+    """Seconds to wait before retry `attempt` (0-based): Retry-After when the server
+    gave one, otherwise full jitter over an exponentially growing window"""
+    if retry_after is not None:
+        return retry_after
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+def cache_key(url, params=None):
+    items = sorted((str(k), str(v)) for k, v in (params or {}).items())
+    return hashlib.sha256(f"{url}?{urlencode(items)}".encode("utf-8")).hexdigest()
+
+class DiskCache:
+    """Content-addressed JSON response store: <dir>/<key[:2]>/<key>.json"""
+
+    def __init__(self, directory, ttl, max_bytes=None, max_age=CACHE_MAX_AGE):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.writes = 0
+        self.prune_lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self.path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, url, body, headers):
+        entry = {
+            "url": url,
+            "body": body,
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "stored_at": time.time()
+        }
+        self._write(key, entry)
+        self.writes += 1
+        if self.writes % PRUNE_EVERY == 0:
+            threading.Thread(target=self.prune, name="booru-cache-prune", daemon=True).start()
+        return entry
+
+    def touch(self, key, entry):
+        """A 304 confirmed the entry; restart its TTL"""
+        entry["stored_at"] = time.time()
+        self._write(key, entry)
+
+    def _write(self, key, entry):
+        path = self.path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not cache {entry['url']}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def prune(self):
+        """Drop entries past max_age, then the oldest until under max_bytes; returns the count removed"""
+        if not self.prune_lock.acquire(blocking=False):
+            return 0  # Already running
+        try:
+            files = []
+            for root, _, names in os.walk(self.directory):
+                for name in names:
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, path))
+            files.sort()
+            cutoff = time.time() - self.max_age
+            total = sum(size for _, size, _ in files)
+            removed = 0
+            for mtime, size, path in files:
+                if mtime >= cutoff and (not self.max_bytes or total <= self.max_bytes):
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+            return removed
+        finally:
+            self.prune_lock.release()
+
+    def is_fresh(self, entry):
+        return time.time() - entry.get("stored_at", 0) < self.ttl
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+def default_cache():
+    """The shared disk cache, or None when BOORU_CACHE_TTL is 0"""
+    ttl = float(settings.BOORU_CACHE_TTL or 0)
+    if ttl <= 0:
+        return None
+    return DiskCache(settings.BOORU_CACHE_DIR, ttl, max_bytes=int(float(settings.BOORU_CACHE_MAX_MB or 0) * 1024 * 1024))
+
+class HostLimiters:
+    """Adaptive limiter per endpoint class: the Danbooru API, Gelbooru, and one per CDN host"""
+
+    def __init__(self, api_rate, cdn_rate, gelbooru_rate):
+        self.api_rate = api_rate
+        self.cdn_rate = cdn_rate
+        self.gelbooru_rate = gelbooru_rate
+        self.limiters = {}
+
+    def __call__(self, url):
+        host = urlparse(url).netloc
+        if host == urlparse(settings.DANBOORU_API_URL).netloc:
+            key, rate, burst = "danbooru_api", self.api_rate, 1
+        elif host in ("gelbooru.com", "www.gelbooru.com"):
+            key, rate, burst = "gelbooru", self.gelbooru_rate, 1
+        else:
+            # CDNs (cdn.donmai.us, img*.gelbooru.com) aren't subject to the API limits
+            key, rate, burst = host, self.cdn_rate, 2
+        if key not in self.limiters:
+            self.limiters[key] = AdaptiveRateLimiter(rate, burst=burst)
+        return self.limiters[key]
+
+# --- Blocking client ---
+
+class BooruClient:
+    def __init__(self, cache=None, pool_size=8, timeout=30.0, min_interval=1.0):
+        self.cache = cache
+        self.timeout = timeout
+        # Requests to one host are spaced this far apart (cache hits don't count)
+        self.min_interval = min_interval
+        self.next_at = {}
+        self.pace_lock = threading.Lock()
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = settings.USER_AGENT
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def pace(self, host):
+        with self.pace_lock:
+            now = time.monotonic()
+            delay = self.next_at.get(host, 0.0) - now
+            self.next_at[host] = max(now, self.next_at.get(host, 0.0)) + self.min_interval
+        if delay > 0:
+            time.sleep(delay)
+
+    def get(self, url, params=None, headers=None):
+        """GET with retries on network errors, timeouts, 429 and 5xx; raises requests exceptions"""
+        host = urlparse(url).netloc
+        for attempt in range(MAX_ATTEMPTS):
+            self.pace(host)
+            try:
+                with BOORU_REQUEST_SECONDS.time(host=host):
+                    response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                BOORU_REQUESTS.inc(host=host, status="error")
+                if attempt == MAX_ATTEMPTS - 1:
+                    raise
+                time.sleep(backoff_delay(attempt))
+                continue
+            BOORU_REQUESTS.inc(host=host, status=response.status_code)
+            if response.status_code in RETRY_STATUSES and attempt < MAX_ATTEMPTS - 1:
+                time.sleep(backoff_delay(attempt, retry_after_seconds(response.headers.get("retry-after"))))
+                continue
+            return response
+
+    def get_json(self, url, params=None, cache=True):
+        cache = self.cache if cache else None
+        key = cache_key(url, params)
+        entry = cache.get(key) if cache else None
+        if entry and cache.is_fresh(entry):
+            BOORU_CACHE_REQUESTS.inc(result="fresh")
+            return json.loads(entry["body"])
+
+        response = self.get(url, params=params, headers=cache.conditional_headers(entry) if entry else None)
+        if entry and response.status_code == 304:
+            BOORU_CACHE_REQUESTS.inc(result="revalidated")
+            cache.touch(key, entry)
+            return json.loads(entry["body"])
+        response.raise_for_status()
+        data = response.json()
+        if cache:
+            BOORU_CACHE_REQUESTS.inc(result="miss")
+            cache.put(key, url, response.text, response.headers)
+        return data
+
+_client = None
+_client_lock = threading.Lock()
+
+def booru_client():
+    """Process-wide blocking client (one connection pool for all scripts)"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = BooruClient(cache=default_cache())
+        return _client
+
+# --- Async client ---
+
+class AsyncBooruClient:
+    def __init__(self, cache=None, limiter_for=None, max_connections=8, timeout=60.0):
+        self.cache = cache
+        self.limiter_for = limiter_for
+        self.client = httpx.AsyncClient(
+            headers={"User-Agent": settings.USER_AGENT},
+            timeout=httpx.Timeout(timeout, connect=10.0),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            follow_redirects=True
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def send(self, url, params=None, headers=None, stream=False):
+        """GET with rate limiting, AIMD backoff on 429/503 and retries on network
+        errors/5xx. Raises httpx.HTTPError once retries are exhausted; a streamed
+        response must be closed by the caller."""
+        host = urlparse(url).netloc
+        limiter = self.limiter_for(url) if self.limiter_for else None
+        for attempt in range(MAX_ATTEMPTS):
+            if limiter is not None:
+                await limiter.acquire()
+            request = self.client.build_request("GET", url, params=params, headers=headers)
+            try:
+                with BOORU_REQUEST_SECONDS.time(host=host):
+                    response = await self.client.send(request, stream=stream)
+            except httpx.TransportError:
+                BOORU_REQUESTS.inc(host=host, status="error")
+                if attempt == MAX_ATTEMPTS - 1:
+                    raise
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+            BOORU_REQUESTS.inc(host=host, status=response.status_code)
+            if response.status_code in RETRY_STATUSES and attempt < MAX_ATTEMPTS - 1:
+                await response.aclose()
+                retry_after = retry_after_seconds(response.headers.get("retry-after"))
+                if limiter is not None and response.status_code in THROTTLE_STATUSES:
+                    # The limiter spaces the retry (and everyone else's requests to this host)
+                    limiter.throttled(retry_after)
+                    print(f"  {host} returned {response.status_code}, backing off to {limiter.rate:.2f} req/s")
+                else:
+                    await asyncio.sleep(backoff_delay(attempt, retry_after))
+                continue
+            if limiter is not None and response.is_success:
+                limiter.success()
+            return response
+
+    async def get_json(self, url, params=None, cache=True):
+        cache = self.cache if cache else None
+        key = cache_key(url, params)
+        entry = cache.get(key) if cache else None
+        if entry and cache.is_fresh(entry):
+            BOORU_CACHE_REQUESTS.inc(result="fresh")
+            return json.loads(entry["body"])
+
+        response = await self.send(url, params=params, headers=cache.conditional_headers(entry) if entry else None)
+        if entry and response.status_code == 304:
+            BOORU_CACHE_REQUESTS.inc(result="revalidated")
+            cache.touch(key, entry)
+            return json.loads(entry["body"])
+        response.raise_for_status()
+        data = response.json()
+        if cache:
+            BOORU_CACHE_REQUESTS.inc(result="miss")
+            cache.put(key, url, response.text, response.headers)
+        return data
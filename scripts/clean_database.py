@@ -5,7 +5,11 @@ import sys
 
 # Add parent directory to path to import config
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from config import MONGO_URI, DB_NAME, DATA_DIR, IMAGES_DIR, GENERATED_DIR
+from scripts.settings import settings
+from scripts.data_version import reset_versions
+
+MONGO_URI, DB_NAME, DATA_DIR = settings.MONGO_URI, settings.DB_NAME, settings.DATA_DIR
+IMAGES_DIR, GENERATED_DIR = settings.IMAGES_DIR, settings.GENERATED_DIR
 
 def clean_database():
     """Clean the database and remove all downloaded files"""
@@ -26,6 +30,12 @@ def clean_database():
     
     print("  Dropping system_status collection...")
     db.system_status.drop()
+
+    print("  Dropping scraper_state collection...")
+    db.scraper_state.drop()
+
+    # Cached API responses and ETags must not outlive the data
+    reset_versions(db)
     
     # Clean data directories
     print("\nCleaning data directories...")
@@ -0,0 +1,120 @@
+import threading
+import time
+from pymongo.errors import PyMongoError
+
+# Pause/resume/cancel channel for pipelines run from the command line. The `control`
+# field in system_status is pushed through a change stream when the server supports it
+# (replica set) and otherwise polled every `min_interval` seconds by a background
+# thread, so checking it before every item costs nothing and a cancel fires the
+# on_cancel callbacks (e.g. SD interrupts) even while the worker is blocked in a
+# request. Pausing blocks on an event instead of spinning.
+#
+# A new channel starts the task as "running" (like the app's job runner does), so a
+# cancel left over from an earlier run doesn't interrupt SD instances or stop this one.
+
+class ControlChannel:
+    def __init__(self, db, task_id, status_writer=None, min_interval=0.5):
+        self.db = db
+        self.task_id = task_id
+        self.status_writer = status_writer
+        self.min_interval = min_interval
+        self.control = "running"
+        self.read_at = 0.0
+        self.watching = False
+        self.changed = threading.Event()
+        self.lock = threading.Lock()
+        self.cancel_callbacks = []
+        self._cancel_fired = False
+        self.db.system_status.update_one({"_id": task_id}, {"$set": {"control": "running"}}, upsert=True)
+        threading.Thread(target=self._watch, name=f"control-{task_id}", daemon=True).start()
+
+    def _watch(self):
+        pipeline = [{"$match": {"documentKey._id": self.task_id}}]
+        try:
+            with self.db.system_status.watch(pipeline, full_document="updateLookup") as stream:
+                self.watching = True
+                # Changes made before the stream opened
+                self.refresh()
+                for change in stream:
+                    doc = change.get("fullDocument") or {}
+                    self._set(doc.get("control", "running"))
+        except PyMongoError:
+            # Standalone server: fall back to polling
+            pass
+        self.watching = False
+        self._poll()
+
+    def _poll(self):
+        while True:
+            try:
+                self.refresh()
+            except PyMongoError as e:
+                print(f"Control read for {self.task_id} failed: {e}")
+            time.sleep(self.min_interval)
+
+    def _set(self, control):
+        fire = False
+        with self.lock:
+            self.read_at = time.monotonic()
+            if control != self.control:
+                self.control = control
+                self.changed.set()
+                if control == "cancel" and not self._cancel_fired:
+                    self._cancel_fired = fire = True
+        if fire:
+            for callback in self.cancel_callbacks:
+                threading.Thread(target=callback, daemon=True).start()
+
+    def refresh(self):
+        doc = self.db.system_status.find_one({"_id": self.task_id}, {"control": 1}) or {}
+        self._set(doc.get("control", "running"))
+
+    def read(self):
+        if not self.watching and time.monotonic() - self.read_at >= self.min_interval:
+            self.refresh()
+        return self.control
+
+    @property
+    def is_cancelled(self):
+        return self.read() == "cancel"
+
+    def on_cancel(self, callback):
+        """Run `callback` (in a thread) as soon as a cancel is seen"""
+        self.cancel_callbacks.append(callback)
+        if self._cancel_fired:
+            threading.Thread(target=callback, daemon=True).start()
+
+    def check(self):
+        """Same contract as check_control: blocks while paused, returns the control value"""
+        control = self.read()
+        if control != "pause":
+            return control
+
+        print(f"Task {self.task_id} paused...")
+        self._write_status("paused", "Paused")
+        while True:
+            self.changed.wait(timeout=self.min_interval)
+            self.changed.clear()
+            control = self.read()
+            if control == "cancel":
+                return "cancel"
+            if control != "pause":
+                print(f"Task {self.task_id} resumed!")
+                self._write_status("running", None)
+                return control
+
+    def _write_status(self, status, message):
+        if self.status_writer is None:
+            return
+        doc = self.db.system_status.find_one({"_id": self.task_id}) or {}
+        self.status_writer(self.db, status, doc.get("progress", 0), message or doc.get("message", "Resumed"), doc.get("current", 0), doc.get("total", 0))
+
+_channels = {}
+_channels_lock = threading.Lock()
+
+def control_channel(db, task_id, status_writer=None):
+    """One shared channel per task per process"""
+    with _channels_lock:
+        if task_id not in _channels:
+            _channels[task_id] = ControlChannel(db, task_id, status_writer)
+        return _channels[task_id]
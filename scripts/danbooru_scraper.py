@@ -1,121 +1,137 @@
+import asyncio
+import httpx
 import requests
 import time
 import os
 import pymongo
-from datetime import datetime
+from datetime import datetime, timedelta
 import argparse
+import itertools
 import sys
 
 # Add parent directory to path to import config
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from config import MONGO_URI, DB_NAME, DANBOORU_API_URL, USER_AGENT, IMAGES_DIR
-from gelbooru_scraper import GelbooruScraper
+from scripts.settings import settings
+from scripts.gelbooru_scraper import GelbooruScraper, GELBOORU_API_URL, parse_posts, search_params as gelbooru_search_params
+from scripts.booru_client import booru_client, default_cache, AsyncBooruClient, HostLimiters
+from scripts.db_schema import ensure_schema
+from scripts.data_paths import data_url
+from scripts.author_search import search_keys
+from scripts.author_counters import initial_counters
+from scripts.thumbnails import prewarm
+from scripts.write_behind import WriteBehind
+from scripts.status_reporter import status_reporter
+from scripts.control import control_channel
+from scripts.metrics import IMAGE_DOWNLOADS, IMAGE_DOWNLOAD_BYTES, IMAGE_DOWNLOAD_SECONDS, push_to_file
 
-# Rate Limiting
-DELAY = 1.0  # Seconds between requests
+SKIPPED_EXTENSIONS = ['mp4', 'webm', 'gif', 'zip', 'swf']
+
+# Authors are pulled from the selection cursor a few at a time while scraping; small
+# batches keep the cursor busy enough that the server never reaps it as idle
+AUTHOR_CURSOR_BATCH = 8
+
+# The artist scan position is kept in scraper_state between runs, so a run only fetches
+# pages past the ones already imported. Activity order (post_count) supports numbered
+# pages only, which Danbooru caps; beyond that the scan continues with keyset paging
+# (page=b<id>, newest first), which costs the same at any depth.
+ARTIST_SCAN_ID = "artist_scan"
+ARTIST_PAGE_SIZE = 100
+MAX_NUMBERED_PAGES = 1000
+# Activity ranks drift, so the scan starts again from the top this often
+ARTIST_RESCAN_DAYS = 30
 
 def get_db():
-    client = pymongo.MongoClient(MONGO_URI)
-    return client[DB_NAME]
+    client = pymongo.MongoClient(settings.MONGO_URI)
+    return client[settings.DB_NAME]
 
 def fetch_json(url, params=None):
-    headers = {"User-Agent": USER_AGENT}
+    # Pooled, retried, paced per host and served from the response cache when fresh
     try:
-        response = requests.get(url, params=params, headers=headers)
-        response.raise_for_status()
-        time.sleep(DELAY)
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        return booru_client().get_json(url, params=params)
+    except (requests.exceptions.RequestException, ValueError) as e:
         print(f"Error fetching {url}: {e}")
-        time.sleep(DELAY)
         return None
 
-def download_image(url, file_path):
-    if os.path.exists(file_path):
-        return True
-    
-    try:
-        headers = {"User-Agent": USER_AGENT}
-        response = requests.get(url, headers=headers, stream=True)
-        response.raise_for_status()
-        with open(file_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        time.sleep(DELAY)
-        return True
-    except Exception as e:
-        print(f"Error downloading {url}: {e}")
-        return False
-
 def update_status(db, status, progress=0, message="", current=0, total=0):
-    db.system_status.update_one(
-        {"_id": "scraper"},
-        {"$set": {
-            "status": status,
-            "progress": progress,
-            "current": current,
-            "total": total,
-            "message": message,
-            "updated_at": datetime.now()
-        }},
-        upsert=True
-    )
+    # Coalesced: written by a background thread at a bounded rate (state changes immediately)
+    status_reporter(db, "scraper").update(status, progress, message, current, total)
 
-def check_control(db, task_id="scraper"):
-    status = db.system_status.find_one({"_id": task_id})
-    if not status:
-        return "running"
-    
-    control = status.get("control", "running")
-    if control == "pause":
-        print(f"Task {task_id} paused...")
-        update_status(db, "paused", status.get("progress", 0), "Paused", status.get("current", 0), status.get("total", 0))
-        while True:
-            time.sleep(1)
-            status = db.system_status.find_one({"_id": task_id})
-            if status.get("control") != "pause":
-                print(f"Task {task_id} resumed!")
-                update_status(db, "running", status.get("progress", 0), status.get("message", "Resumed"), status.get("current", 0), status.get("total", 0))
-                break
-            if status.get("control") == "cancel":
-                return "cancel"
-    
-    return control
+def check_control(db, task_id="scraper", task=None):
+    if task is not None:
+        # Running inside the app's job runner: in-memory pause/cancel
+        return task.check()
+    # Cached, change-stream fed channel instead of a find_one per item
+    return control_channel(db, task_id, update_status).check()
 
-def fetch_authors(db, limit=100, min_posts=50):
+def load_artist_scan(db):
+    """Stored artist scan position; starts over when stale or when authors were wiped"""
+    scan = db["scraper_state"].find_one({"_id": ARTIST_SCAN_ID})
+    if (not scan or db["authors"].estimated_document_count() == 0
+            or datetime.now() - scan.get("started_at", datetime.min) > timedelta(days=ARTIST_RESCAN_DAYS)):
+        return {"_id": ARTIST_SCAN_ID, "page": 1, "before_id": None, "started_at": datetime.now()}
+    return scan
+
+def save_artist_scan(db, scan):
+    db["scraper_state"].update_one({"_id": ARTIST_SCAN_ID}, {"$set": {
+        "page": scan["page"],
+        "before_id": scan.get("before_id"),
+        "started_at": scan["started_at"],
+        "updated_at": datetime.now()
+    }}, upsert=True)
+
+def fetch_authors(db, limit=100, min_posts=50, task=None, writer=None):
     """Fetch top authors from Danbooru by post count
     
     Note: min_posts parameter is kept for API compatibility but not used for filtering
     because the Danbooru API doesn't return post_count in responses. However, the API
     does sort by post_count (descending), so we naturally get the most active artists first.
+    The scan resumes where the previous run stopped (see load_artist_scan).
+    New authors are queued on `writer` (a WriteBehind); one is created if not given.
     """
+    if writer is None:
+        with WriteBehind(db) as writer:
+            return fetch_authors(db, limit, min_posts, task, writer)
+
     print(f"Scanning for {limit} NEW authors (sorted by activity)...")
     update_status(db, "running", 0, f"Scanning for {limit} NEW authors...", 0, 0)
     
-    page = 1
+    scan = load_artist_scan(db)
     authors_collection = db["authors"]
     fetched_new_count = 0
     target_new_count = limit
-    max_pages = 1000 # Safety limit
     
-    while fetched_new_count < target_new_count and page <= max_pages:
-        if check_control(db) == "cancel":
+    while fetched_new_count < target_new_count:
+        if check_control(db, task=task) == "cancel":
             print("Scraper cancelled.")
             return fetched_new_count
-            
-        msg = f"Scanning page {page}... (Found {fetched_new_count}/{target_new_count} new)"
+
+        keyset = scan["page"] > MAX_NUMBERED_PAGES
+        if keyset:
+            # Sequential paging is always newest first; it ignores search[order]
+            params = {"limit": ARTIST_PAGE_SIZE}
+            if scan.get("before_id"):
+                params["page"] = f"b{scan['before_id']}"
+            position = f"below id {scan['before_id']}" if scan.get("before_id") else "from newest"
+        else:
+            params = {"search[order]": "post_count", "limit": ARTIST_PAGE_SIZE, "page": scan["page"]}
+            position = scan["page"]
+
+        msg = f"Scanning page {position}... (Found {fetched_new_count}/{target_new_count} new)"
         print(msg)
         update_status(db, "running", int((fetched_new_count / target_new_count) * 10), msg, fetched_new_count, target_new_count)
         
-        data = fetch_json(f"{DANBOORU_API_URL}/artists.json", params={
-            "search[order]": "post_count",
-            "limit": 100,
-            "page": page
-        })
+        data = fetch_json(f"{settings.DANBOORU_API_URL}/artists.json", params=params)
         
-        if not data or len(data) == 0:
-            print(f"No more artists found at page {page}")
+        if data is None or isinstance(data, dict):
+            # Request failed; the stored position is retried next run
+            break
+        if len(data) == 0:
+            if not keyset:
+                print(f"No more artists by activity at page {scan['page']}, continuing by id")
+                scan["page"] = MAX_NUMBERED_PAGES + 1
+                continue
+            print(f"No more artists found {position}")
             break
             
         # Optimize: Check which ones exist in batch
@@ -123,8 +139,9 @@ def fetch_authors(db, limit=100, min_posts=50):
         existing = authors_collection.find({"_id": {"$in": ids}}, {"_id": 1})
         existing_ids = set(doc["_id"] for doc in existing)
             
-        for artist in data:
-            if check_control(db) == "cancel":
+        page_done = True
+        for i, artist in enumerate(data):
+            if check_control(db, task=task) == "cancel":
                 print("Scraper cancelled.")
                 return fetched_new_count
             if artist["id"] in existing_ids:
@@ -135,191 +152,305 @@ def fetch_authors(db, limit=100, min_posts=50):
                 "name": artist["name"],
                 "other_names": artist.get("other_names", []),
                 "urls": artist.get("urls", []),
-                "updated_at": datetime.now()
+                "search_keys": search_keys(artist["name"], artist.get("other_names", [])),
+                "updated_at": datetime.now(),
+                **initial_counters()
             }
             
-            authors_collection.insert_one(author_data)
+            writer.insert_author(author_data)
             fetched_new_count += 1
             
             if fetched_new_count >= target_new_count:
+                # Artists left on this page are picked up by the next run
+                page_done = i == len(data) - 1
                 break
         
-        page += 1
+        if page_done:
+            if keyset:
+                scan["before_id"] = min(ids)
+            else:
+                scan["page"] += 1
+            # Authors first, so the saved position never skips unsaved ones
+            writer.flush()
+            save_artist_scan(db, scan)
     
     print(f"Added {fetched_new_count} new authors")
     return fetched_new_count
 
-def fetch_posts_for_authors(db, max_images=10, limit_authors=0):
+def authors_without_images(db, limit=0):
+    """Cursor over authors with no stored images: a single anti-join that probes
+    images.author_id (indexed) for at most one document per author"""
+    pipeline = [
+        {"$lookup": {
+            "from": "images",
+            "let": {"author_id": "$_id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$author_id", "$$author_id"]}}},
+                {"$limit": 1},
+                {"$project": {"_id": 1}}
+            ],
+            "as": "has_images"
+        }},
+        {"$match": {"has_images": {"$size": 0}}},
+        {"$project": {"has_images": 0, "search_keys": 0}}
+    ]
+    if limit > 0:
+        pipeline.append({"$limit": limit})
+    return db["authors"].aggregate(pipeline, batchSize=AUTHOR_CURSOR_BATCH)
+
+def fetch_posts_for_authors(db, max_images=10, limit_authors=0, task=None, writer=None):
     """Fetch images only for authors that don't have any images yet"""
-    # Get all authors
-    all_authors = list(db["authors"].find({}))
-    
-    # Filter to only those without images
-    authors_needing_images = []
-    for author in all_authors:
-        if check_control(db) == "cancel":
-            print("Scraper cancelled.")
-            return
-        image_count = db["images"].count_documents({"author_id": author["_id"]})
-        if image_count == 0:
-            authors_needing_images.append(author)
-            if limit_authors > 0 and len(authors_needing_images) >= limit_authors:
-                break  # Stop once we have enough
-    
-    total_authors = len(authors_needing_images)
-    
-    print(f"Processing {total_authors} authors that need images (out of {len(all_authors)} total, {len(all_authors) - len([a for a in all_authors if db['images'].count_documents({'author_id': a['_id']}) == 0])} already have images)")
-    
-    images_collection = db["images"]
-    
-    if not os.path.exists(IMAGES_DIR):
-        os.makedirs(IMAGES_DIR)
+    if writer is None:
+        with WriteBehind(db) as writer:
+            return fetch_posts_for_authors(db, max_images, limit_authors, task, writer)
+
+    # Queued authors/images must be visible to the selection below
+    writer.flush()
+    authors = authors_without_images(db, limit=limit_authors)
+    first = next(authors, None)
+    if first is None:
+        authors.close()
+        print("All authors already have images")
+        return
+
+    # Progress total from the maintained counters (index-only count); the cursor
+    # stays authoritative for which authors are actually scraped
+    expected = db["authors"].count_documents({"image_count": {"$not": {"$gt": 0}}})
+    if limit_authors > 0:
+        expected = min(expected, limit_authors)
+    expected = max(expected, 1)
+    print(f"Processing ~{expected} authors that need images (out of {db['authors'].estimated_document_count()} total)")
+
+    images_dir = settings.IMAGES_DIR
+    if not os.path.exists(images_dir):
+        os.makedirs(images_dir)
+
+    try:
+        asyncio.run(scrape_posts(db, writer, itertools.chain([first], authors), max_images, task=task, total=expected))
+    finally:
+        authors.close()
+
+# --- Async engine ---
+
+def is_skipped_ext(ext):
+    # Skip non-image files (videos, etc.)
+    return ext.lower() in SKIPPED_EXTENSIONS
 
+class ScrapeSession:
+    """Shared booru client (rate limited per endpoint class), a bound on concurrent
+    downloads and the write-behind buffer for image rows"""
+
+    def __init__(self, client, concurrency, writer):
+        self.client = client
+        self.downloads = asyncio.Semaphore(concurrency)
+        self.writer = writer
+
+async def fetch_json_async(session, url, params=None):
+    try:
+        return await session.client.get_json(url, params=params)
+    except (httpx.HTTPError, ValueError) as e:
+        print(f"Error fetching {url}: {e}")
+        return None
+
+async def download_image(session, url, file_path):
+    if os.path.exists(file_path):
+        IMAGE_DOWNLOADS.inc(status="cached")
+        return True
+
+    async with session.downloads:
+        started = time.perf_counter()
+        # Written to a temp name so an interrupted download never looks complete
+        tmp_path = f"{file_path}.part"
+        try:
+            response = await session.client.send(url, stream=True)
+            try:
+                response.raise_for_status()
+                with open(tmp_path, "wb") as f:
+                    async for chunk in response.aiter_bytes(65536):
+                        f.write(chunk)
+                        IMAGE_DOWNLOAD_BYTES.inc(len(chunk))
+            finally:
+                await response.aclose()
+            os.replace(tmp_path, file_path)
+        except (httpx.HTTPError, OSError) as e:
+            IMAGE_DOWNLOADS.inc(status="error")
+            print(f"Error downloading {url}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+        IMAGE_DOWNLOAD_SECONDS.observe(time.perf_counter() - started)
+        IMAGE_DOWNLOADS.inc(status="ok")
+        return True
+
+def danbooru_image_data(post, author_id, author_name):
+    return {
+        "_id": post.get("id"),
+        "author_id": author_id,
+        "author_name": author_name,
+        "tags": post.get("tag_string", ""),
+        "file_url": post.get("file_url"),
+        "width": post.get("image_width"),
+        "height": post.get("image_height"),
+        "created_at": post.get("created_at"),
+        "fetched_at": datetime.now(),
+        "source": "danbooru"
+    }
+
+def store_image(writer, image_data, file_path):
+    """Thumbnail + queued upsert (counters follow on flush); blocking, run off the event loop"""
+    prewarm(file_path)
+    image_data["local_path"] = file_path
+    image_data["url"] = data_url(file_path)
+    writer.upsert_image(image_data)
+
+async def fetch_and_store(session, db, image_data, artist_dir, ext):
+    filename = f"{image_data['_id']}.{ext}"
+    file_path = os.path.join(artist_dir, filename)
+    if not await download_image(session, image_data["file_url"], file_path):
+        session.writer.release(image_data["_id"])
+        return False
+    await asyncio.to_thread(store_image, session.writer, image_data, file_path)
+    print(f"  Downloaded {filename} for {image_data['author_name']}")
+    return True
+
+async def scrape_author(session, db, author, max_images, gelbooru, task=None):
+    """Page through an author's posts until max_images are stored. Returns False if cancelled."""
+    author_id = author["_id"]
+    author_name = author["name"]
+    # Sanitize artist name for folder
+    safe_artist_name = "".join(c for c in author_name if c.isalnum() or c in (' ', '.', '_')).strip().replace(" ", "_")
+    artist_dir = os.path.join(settings.IMAGES_DIR, safe_artist_name)
+    os.makedirs(artist_dir, exist_ok=True)
+
+    downloaded_count = 0
+    page = 1
+    while downloaded_count < max_images:
+        if await asyncio.to_thread(check_control, db, "scraper", task) == "cancel":
+            return False
+
+        # Calculate batch size (max 100 per request to be safe)
+        batch_size = min(max_images - downloaded_count, 100)
+        print(f"  Fetching page {page} for {author_name} (Need {max_images - downloaded_count} more)...")
+
+        # Try Danbooru first
+        source = "danbooru"
+        posts_data = await fetch_json_async(session, f"{settings.DANBOORU_API_URL}/posts.json", params={
+            "tags": author_name.replace(" ", "_"),
+            "limit": batch_size,
+            "page": page
+        })
+        if isinstance(posts_data, dict):
+            # Error object (e.g. search timeout) instead of a post list
+            posts_data = None
+
+        # If Danbooru fails/empty on first page, try Gelbooru (one batch as fallback)
+        if not posts_data and page == 1:
+            print(f"  No posts found on Danbooru for {author_name}, trying Gelbooru...")
+            posts_data = parse_posts(await fetch_json_async(session, GELBOORU_API_URL, params=gelbooru_search_params(author_name, max_images)))
+            source = "gelbooru"
+
+        if not posts_data:
+            print(f"  No more posts found for {author_name}")
+            break
+
+        candidates = []
+        for post in posts_data:
+            if source == "gelbooru":
+                image_data = gelbooru.map_post_to_image_data(post, author_id, author_name)
+                file_url = image_data["file_url"]
+                ext = file_url.split('.')[-1] if file_url else "jpg"
+            else:
+                image_data = danbooru_image_data(post, author_id, author_name)
+                file_url = image_data["file_url"]
+                ext = post.get("file_ext", "jpg")
+            if not file_url:
+                continue
+            if is_skipped_ext(ext):
+                print(f"  Skipping non-image file: {image_data['_id']}.{ext}")
+                continue
+            candidates.append((image_data, ext))
+
+        # One query for the whole page instead of one per post
+        ids = [image_data["_id"] for image_data, _ in candidates]
+        existing = await asyncio.to_thread(lambda: {doc["_id"] for doc in db["images"].find({"_id": {"$in": ids}}, {"_id": 1})})
+        # Rows still in the write-behind buffer (or being downloaded for another author)
+        # aren't in the collection yet, so the ids are claimed on the writer as well
+        claimed = set(session.writer.claim([i for i in ids if i not in existing], max_images - downloaded_count))
+        wanted = [c for c in candidates if c[0]["_id"] in claimed]
+
+        results = await asyncio.gather(*(fetch_and_store(session, db, image_data, artist_dir, ext) for image_data, ext in wanted))
+        downloaded_count += sum(results)
+
+        # Gelbooru has no pagination in this loop: one batch only
+        if source == "gelbooru":
+            break
+        page += 1
+    return True
+
+async def scrape_posts(db, writer, authors, max_images, task=None, total=None):
+    """Scrape several authors at once; API calls, CDN downloads and Gelbooru are rate
+    limited independently and downloads are bounded by SCRAPER_CONCURRENCY.
+    `authors` may be a list or a (blocking) cursor, which is consumed lazily; `total`
+    is the expected count for progress reporting and defaults to len(authors)."""
+    if total is None:
+        total = len(authors)
+    if not total:
+        return
+    concurrency = max(1, int(settings.SCRAPER_CONCURRENCY))
+    authors = iter(authors)
+    next_lock = asyncio.Lock()
+    state = {"processed": 0, "cancelled": False}
     gelbooru = GelbooruScraper()
-    processed = 0
-    for author in authors_needing_images:
-        author_id = author["_id"]
-        author_name = author["name"]
-        
-        processed += 1
-        progress = int((processed / total_authors) * 90) + 10  # 10-100%
-        msg = f"Processing {author_name} ({processed}/{total_authors})"
-        print(msg)
-        update_status(db, "running", progress, msg, processed, total_authors)
-        
-        # Fetch posts for this artist with pagination
-        downloaded_count = 0
-        page = 1
-        consecutive_empty_pages = 0
-        
-        while downloaded_count < max_images:
-            if check_control(db) == "cancel":
-                print("Scraper cancelled.")
+
+    async def next_author():
+        # Cursor getMores block, so they run off the event loop (one at a time)
+        async with next_lock:
+            return await asyncio.to_thread(next, authors, None)
+
+    async def worker(session):
+        while not state["cancelled"]:
+            author = await next_author()
+            if author is None:
                 return
+            state["processed"] += 1
+            processed = state["processed"]
+            total_authors = max(total, processed)
+            progress = int((processed / total_authors) * 90) + 10  # 10-100%
+            msg = f"Processing {author['name']} ({processed}/{total_authors})"
+            print(msg)
+            update_status(db, "running", progress, msg, processed, total_authors)
+            if not await scrape_author(session, db, author, max_images, gelbooru, task=task):
+                state["cancelled"] = True
+                print("Scraper cancelled.")
 
-            # Calculate batch size (max 100 per request to be safe)
-            batch_size = min(max_images - downloaded_count, 100)
-            
-            print(f"  Fetching page {page} for {author_name} (Need {max_images - downloaded_count} more)...")
-            
-            # Try Danbooru first
-            source = "danbooru"
-            posts_data = fetch_json(f"{DANBOORU_API_URL}/posts.json", params={
-                "tags": author_name.replace(" ", "_"),
-                "limit": batch_size,
-                "page": page
-            })
-            
-            # If Danbooru fails/empty on first page, try Gelbooru (only once for now as fallback)
-            if not posts_data and page == 1:
-                print(f"  No posts found on Danbooru for {author_name}, trying Gelbooru...")
-                # Gelbooru fallback - currently just one batch
-                posts_data = gelbooru.fetch_images_for_artist(author_name, limit=max_images)
-                source = "gelbooru"
-                
-            if not posts_data:
-                print(f"  No more posts found for {author_name}")
-                break
-                
-            posts_processed_in_batch = 0
-            for post in posts_data:
-                if downloaded_count >= max_images:
-                    break
-                    
-                if source == "gelbooru":
-                    # Map Gelbooru post to our structure
-                    image_data = gelbooru.map_post_to_image_data(post, author_id, author_name)
-                    post_id = image_data["_id"]
-                    file_url = image_data["file_url"]
-                    if file_url:
-                        ext = file_url.split('.')[-1]
-                    else:
-                        ext = "jpg"
-                else:
-                    # Danbooru post
-                    post_id = post.get("id")
-                    file_url = post.get("file_url")
-                    ext = post.get("file_ext", "jpg")
-                
-                if not file_url:
-                    continue
-                
-                # Skip non-image files (videos, etc.)
-                if ext.lower() in ['mp4', 'webm', 'gif', 'zip', 'swf']:
-                    print(f"  Skipping non-image file: {post_id}.{ext}")
-                    continue
-                    
-                # Check if we already have this image
-                if images_collection.count_documents({"_id": post_id}) > 0:
-                    # print(f"  Image {post_id} already exists, skipping")
-                    continue
-                    
-                # Download image
-                filename = f"{post_id}.{ext}"
-                
-                # Sanitize artist name for folder
-                safe_artist_name = "".join(c for c in author_name if c.isalnum() or c in (' ', '.', '_')).strip().replace(" ", "_")
-                artist_dir = os.path.join(IMAGES_DIR, safe_artist_name)
-                
-                if not os.path.exists(artist_dir):
-                    os.makedirs(artist_dir)
-                    
-                file_path = os.path.join(artist_dir, filename)
-                
-                if download_image(file_url, file_path):
-                    # Save to DB
-                    if source == "danbooru":
-                        image_data = {
-                            "_id": post_id,
-                            "author_id": author_id,
-                            "author_name": author_name,
-                            "tags": post.get("tag_string", ""),
-                            "file_url": file_url,
-                            "local_path": file_path,
-                            "width": post.get("image_width"),
-                            "height": post.get("image_height"),
-                            "created_at": post.get("created_at"),
-                            "fetched_at": datetime.now(),
-                            "source": "danbooru"
-                        }
-                    else:
-                        # Already mapped, just update local_path
-                        image_data["local_path"] = file_path
-                    
-                    images_collection.update_one(
-                        {"_id": post_id},
-                        {"$set": image_data},
-                        upsert=True
-                    )
-                    print(f"  Downloaded {filename} ({downloaded_count + 1}/{max_images})")
-                    downloaded_count += 1
-                    posts_processed_in_batch += 1
-            
-            # If we didn't process any posts in this batch (e.g. all existed or invalid), 
-            # but we still have posts, we should continue to next page.
-            # But if source is Gelbooru, we don't support pagination yet in this loop structure easily without refactoring GelbooruScraper.
-            # So for Gelbooru, we break after one batch.
-            if source == "gelbooru":
-                break
-                
-            page += 1
+    limiters = HostLimiters(settings.DANBOORU_API_RATE, settings.DANBOORU_CDN_RATE, settings.GELBOORU_RATE)
+    async with AsyncBooruClient(cache=default_cache(), limiter_for=limiters, max_connections=concurrency * 2) as client:
+        session = ScrapeSession(client, concurrency, writer)
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
 
-def main():
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(description="Danbooru Scraper")
     parser.add_argument("--limit-authors", type=int, default=10, help="Number of authors to fetch from Danbooru")
     parser.add_argument("--max-images", type=int, default=5, help="Max images per author")
     parser.add_argument("--min-posts", type=int, default=50, help="Minimum posts required for an artist")
-    args = parser.parse_args()
+    return parser.parse_args(argv)
 
-    db = get_db()
-    
+def run(db, args, task=None):
+    """Full scrape; `task` is the app job runner's Task when run in-process"""
     try:
-        # 1. Fetch Authors (only fetch new ones if needed)
-        fetch_authors(db, limit=args.limit_authors, min_posts=args.min_posts)
-        
-        # 2. Fetch Images (only for authors without images)
-        fetch_posts_for_authors(db, max_images=args.max_images, limit_authors=args.limit_authors)
-        
+        # Rows are written behind in batches; closing flushes them (also on cancel/error)
+        with WriteBehind(db) as writer:
+            # 0. Rows for files a crashed run downloaded but never recorded
+            writer.replay()
+
+            # 1. Fetch Authors (only fetch new ones if needed)
+            fetch_authors(db, limit=args.limit_authors, min_posts=args.min_posts, task=task, writer=writer)
+
+            # 2. Fetch Images (only for authors without images)
+            fetch_posts_for_authors(db, max_images=args.max_images, limit_authors=args.limit_authors, task=task, writer=writer)
+
+        if task is not None and task.is_cancelled:
+            return
         update_status(db, "idle", 100, "Scraping complete", 0, 0)
         print("Scraping complete")
         
@@ -327,5 +458,12 @@ def main():
         print(f"Scraper failed: {e}")
         update_status(db, "error", 0, f"Error: {str(e)}", 0, 0)
 
+def main():
+    args = parse_args()
+    push_to_file("scraper")
+    db = get_db()
+    ensure_schema(db)
+    run(db, args)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,33 @@
+import os
+import sys
+import pymongo
+
+# Add parent directory to path to import config
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.settings import settings
+
+def data_url(local_path, data_dir=None):
+    """Public URL (served from the /data mount) for a file stored under DATA_DIR.
+    Stored as `url` on images and generations at write time so readers don't recompute it."""
+    if not local_path:
+        return ""
+    try:
+        rel_path = os.path.relpath(local_path, data_dir or settings.DATA_DIR).replace("\\", "/")
+        return f"/data/{rel_path}"
+    except ValueError:
+        # Different drive on Windows
+        return f"/data/images/{os.path.basename(local_path)}"
+
+def backfill_urls(db, data_dir=None):
+    """Set `url` on images and generations written before it was stored"""
+    for collection in ["images", "generations"]:
+        ops = []
+        cursor = db[collection].find({"url": {"$exists": False}}, {"local_path": 1})
+        for doc in cursor:
+            ops.append(pymongo.UpdateOne({"_id": doc["_id"]}, {"$set": {"url": data_url(doc.get("local_path"), data_dir)}}))
+            if len(ops) >= 1000:
+                db[collection].bulk_write(ops, ordered=False)
+                ops = []
+        if ops:
+            db[collection].bulk_write(ops, ordered=False)
@@ -0,0 +1,29 @@
+import time
+
+# Monotonic per-scope data versions, bumped by every writer (scraper, generator, style
+# analysis, aggregation, upload, import). The API keys its response cache and ETags on
+# them, so cached reads are invalidated exactly when the underlying data changes.
+
+SCOPES = ["authors", "images", "generations", "styles"]
+
+VERSIONS_ID = "versions"
+
+def bump_update(*scopes):
+    unknown = [s for s in scopes if s not in SCOPES]
+    if unknown:
+        raise ValueError(f"Unknown data scopes: {unknown}")
+    return {"$inc": {scope: 1 for scope in scopes}}
+
+def bump(db, *scopes):
+    """Sync (pymongo) helper for scripts"""
+    db.data_versions.update_one({"_id": VERSIONS_ID}, bump_update(*scopes), upsert=True)
+
+def epoch_versions():
+    """Fresh versions for every scope after data was wiped: a millisecond timestamp is
+    far above any counter reached before, so no pre-wipe ETag can match again"""
+    epoch = int(time.time() * 1000)
+    return {scope: epoch for scope in SCOPES}
+
+def reset_versions(db):
+    """Sync (pymongo) helper for the cleanup scripts"""
+    db.data_versions.update_one({"_id": VERSIONS_ID}, {"$set": epoch_versions()}, upsert=True)
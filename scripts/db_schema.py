@@ -0,0 +1,191 @@
+import os
+import sys
+from datetime import datetime
+import pymongo
+from pymongo.errors import OperationFailure
+
+# Add parent directory to path to import config
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.author_counters import rebuild_author_counters, backfill_initial_counters, model_key
+from scripts.data_paths import backfill_urls
+from scripts.author_search import backfill_search_keys
+
+# Bump SCHEMA_VERSION and append to MIGRATIONS when a data migration is needed.
+# Indexes are declarative and re-checked on every run (create_index is idempotent).
+SCHEMA_VERSION = 5
+
+INDEXES = {
+    "authors": [
+        ([("name", 1)], {"name": "name_unique", "unique": True}),
+        ([("search_keys", 1)], {"name": "search_keys"}),
+        ([("image_count", 1), ("_id", 1)], {"name": "image_count_id"}),
+        ([("gen_count", 1), ("_id", 1)], {"name": "gen_count_id"}),
+        ([("style_category", 1), ("_id", 1)], {"name": "style_category_id"}),
+        # Keyset pages of one category in each sort order
+        ([("style_category", 1), ("name", 1)], {"name": "style_category_name"}),
+        ([("style_category", 1), ("image_count", 1), ("_id", 1)], {"name": "style_category_image_count_id"}),
+        ([("style_category", 1), ("gen_count", 1), ("_id", 1)], {"name": "style_category_gen_count_id"}),
+    ],
+    "images": [
+        ([("author_id", 1), ("_id", 1)], {"name": "author_id_id"}),
+    ],
+    "generations": [
+        ([("original_image_id", 1), ("model", 1)], {"name": "original_image_model"}),
+        ([("author_id", 1), ("model", 1)], {"name": "author_model"}),
+        # distinct("model") for the per-model sort indexes below
+        ([("model", 1)], {"name": "model"}),
+        # Existence check done by the generator before every txt2img call.
+        # Manual uploads have no sampler and may legitimately repeat, so they are excluded.
+        ([("original_image_id", 1), ("model", 1), ("steps", 1), ("cfg", 1)], {
+            "name": "generation_params_unique",
+            "unique": True,
+            "partialFilterExpression": {"sampler": {"$exists": True}}
+        }),
+        # Manual uploads are deduplicated by the sha256 of their bytes
+        ([("content_hash", 1)], {
+            "name": "content_hash_unique",
+            "unique": True,
+            "partialFilterExpression": {"content_hash": {"$exists": True}}
+        }),
+    ],
+}
+
+# Per-model sorts (/api/authors?sort_by=gen_count&model=...) order by gen_counts.<model>.
+# A wildcard index can't serve an unfiltered sort, so each model with generations gets
+# its own (gen_counts.<model>, _id) and (style_category, gen_counts.<model>, _id) pair,
+# created by ensure_indexes. MongoDB allows 64 indexes per collection; models beyond
+# MAX_MODEL_SORT_INDEXES stay unindexed (in-memory sort) and are reported as such.
+MODEL_SORT_FIELD = "gen_counts.{model}"
+MAX_MODEL_SORT_INDEXES = 16
+
+# Query shapes issued by the app and scripts: (collection, equality fields, sort fields).
+# MODEL_SORT_FIELD expands to one shape per model that has generations.
+QUERY_SHAPES = [
+    ("authors", ["name"], []),
+    ("authors", ["search_keys"], []),
+    ("authors", [], ["name"]),
+    ("authors", [], ["image_count", "_id"]),
+    ("authors", [], ["gen_count", "_id"]),
+    ("authors", [], ["style_category", "_id"]),
+    ("authors", ["style_category"], ["_id"]),
+    ("authors", ["style_category"], ["name"]),
+    ("authors", ["style_category"], ["image_count", "_id"]),
+    ("authors", ["style_category"], ["gen_count", "_id"]),
+    ("authors", [], [MODEL_SORT_FIELD, "_id"]),
+    ("authors", ["style_category"], [MODEL_SORT_FIELD, "_id"]),
+    ("images", ["author_id"], []),
+    ("images", ["author_id"], ["_id"]),
+    ("generations", ["original_image_id"], []),
+    ("generations", ["author_id", "model"], []),
+    ("generations", ["original_image_id", "model", "steps", "cfg"], []),
+    ("generations", ["content_hash"], []),
+]
+
+def _migrate_author_counters(db):
+    rebuild_author_counters(db)
+
+def _migrate_urls(db):
+    backfill_urls(db)
+
+def _migrate_search_keys(db):
+    backfill_search_keys(db)
+
+def _migrate_initial_counters(db):
+    backfill_initial_counters(db)
+
+# version -> migration, applied in order for every version above the stored one
+MIGRATIONS = {
+    2: _migrate_author_counters,
+    3: _migrate_urls,
+    4: _migrate_search_keys,
+    5: _migrate_initial_counters,
+}
+
+def model_sort_keys(db):
+    """gen_counts keys of every generated model (all of them, not only the indexed ones)"""
+    return sorted({model_key(model) for model in db.generations.distinct("model")})
+
+def model_sort_indexes(db):
+    indexes = []
+    for key in model_sort_keys(db)[:MAX_MODEL_SORT_INDEXES]:
+        field = MODEL_SORT_FIELD.format(model=key)
+        indexes.append(([(field, 1), ("_id", 1)], {"name": f"gen_counts_{key}_id"}))
+        indexes.append(([("style_category", 1), (field, 1), ("_id", 1)], {"name": f"style_category_gen_counts_{key}_id"}))
+    return indexes
+
+def ensure_indexes(db):
+    all_indexes = dict(INDEXES, authors=INDEXES["authors"] + model_sort_indexes(db))
+    for collection, indexes in all_indexes.items():
+        for keys, options in indexes:
+            try:
+                db[collection].create_index(keys, **options)
+            except OperationFailure as e:
+                # e.g. duplicates preventing a unique index; report and keep going
+                print(f"Could not create index {collection}.{options.get('name')}: {e}")
+
+def _shape_is_indexed(index_keys, equality, sort):
+    keys = [k for k, _ in index_keys]
+    if len(keys) < len(equality) + len(sort):
+        return False
+    if set(keys[:len(equality)]) != set(equality):
+        return False
+    return keys[len(equality):len(equality) + len(sort)] == sort
+
+def expanded_query_shapes(db):
+    shapes = []
+    keys = None
+    for collection, equality, sort in QUERY_SHAPES:
+        if MODEL_SORT_FIELD not in sort:
+            shapes.append((collection, equality, sort))
+            continue
+        if keys is None:
+            keys = model_sort_keys(db)
+        for key in keys:
+            shapes.append((collection, equality, [MODEL_SORT_FIELD.format(model=key) if f == MODEL_SORT_FIELD else f for f in sort]))
+    return shapes
+
+def unindexed_query_shapes(db):
+    """Return the entries of QUERY_SHAPES that no existing index can serve"""
+    index_cache = {}
+    missing = []
+    for collection, equality, sort in expanded_query_shapes(db):
+        if equality == ["_id"] or (not equality and sort == ["_id"]):
+            continue
+        if collection not in index_cache:
+            index_cache[collection] = [info["key"] for info in db[collection].index_information().values()]
+        if not any(_shape_is_indexed(keys, equality, sort) for keys in index_cache[collection]):
+            missing.append({"collection": collection, "filter": equality, "sort": sort})
+    return missing
+
+def ensure_schema(db):
+    """Create indexes and apply pending migrations. Safe to call from every entry point."""
+    ensure_indexes(db)
+
+    meta = db.schema_meta.find_one({"_id": "schema"}) or {}
+    current = meta.get("version", 0)
+
+    for version in sorted(MIGRATIONS):
+        if version <= current:
+            continue
+        print(f"Applying schema migration {version}...")
+        MIGRATIONS[version](db)
+
+    if current < SCHEMA_VERSION:
+        db.schema_meta.update_one(
+            {"_id": "schema"},
+            {"$set": {"version": SCHEMA_VERSION, "updated_at": datetime.now()}},
+            upsert=True
+        )
+
+    missing = unindexed_query_shapes(db)
+    for shape in missing:
+        print(f"Unindexed query shape: {shape['collection']} filter={shape['filter']} sort={shape['sort']}")
+
+    return {"version": SCHEMA_VERSION, "unindexed": missing}
+
+if __name__ == "__main__":
+    from scripts.settings import settings
+
+    client = pymongo.MongoClient(settings.MONGO_URI)
+    ensure_schema(client[settings.DB_NAME])
@@ -0,0 +1,246 @@
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+from bson import ObjectId
+
+# Add parent directory to path to import config
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.author_counters import model_key
+
+# Streaming export of authors/images/generations as NDJSON or Parquet. Documents are
+# read through a batched cursor and written batch by batch, so memory stays constant
+# no matter how large the collection is. Used by /api/export and from the command line:
+#   python scripts/export.py generations --format parquet --model foo --since 2024-01-01 -o gens.parquet
+
+BATCH_SIZE = 5000
+
+FORMATS = {"ndjson": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
+
+# Field each date-range filter applies to
+DATE_FIELDS = {"authors": "updated_at", "images": "fetched_at", "generations": "created_at"}
+
+# Parquet needs a fixed schema; documents are projected onto these columns
+# (NDJSON keeps every field). "json" columns hold nested values as JSON text.
+PARQUET_COLUMNS = {
+    "authors": [
+        ("_id", "int"), ("name", "str"), ("other_names", "strlist"), ("style_category", "str"),
+        ("image_count", "int"), ("gen_count", "int"), ("gen_counts", "json"), ("updated_at", "time")
+    ],
+    "images": [
+        ("_id", "int"), ("author_id", "int"), ("author_name", "str"), ("tags", "str"), ("source", "str"),
+        ("file_url", "str"), ("local_path", "str"), ("url", "str"), ("width", "int"), ("height", "int"),
+        ("style_category", "str"), ("style_score", "float"), ("created_at", "str"), ("fetched_at", "time")
+    ],
+    "generations": [
+        ("_id", "str"), ("original_image_id", "int"), ("author_id", "int"), ("model", "str"),
+        ("prompt", "str"), ("negative_prompt", "str"), ("steps", "int"), ("cfg", "float"),
+        ("sampler", "str"), ("scheduler", "str"), ("local_path", "str"), ("url", "str"),
+        ("content_hash", "str"), ("is_manual", "bool"), ("created_at", "time")
+    ]
+}
+
+class ExportError(ValueError):
+    pass
+
+def parse_date(value, name):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ExportError(f"Invalid {name} date: {value} (expected YYYY-MM-DD or ISO 8601)")
+
+def build_query(db, collection, category=None, model=None, since=None, until=None, source=None):
+    """Mongo filter for an export; raises ExportError for filters a collection doesn't have"""
+    if collection not in DATE_FIELDS:
+        raise ExportError(f"Unknown collection: {collection}")
+    query = {}
+
+    if category:
+        if collection == "generations":
+            # Category lives on the author
+            query["author_id"] = {"$in": db.authors.distinct("_id", {"style_category": category})}
+        else:
+            query["style_category"] = category
+
+    if model:
+        if collection == "generations":
+            query["model"] = model
+        elif collection == "authors":
+            query[f"gen_counts.{model_key(model)}"] = {"$gt": 0}
+        else:
+            raise ExportError("The model filter applies to authors and generations")
+
+    if source:
+        if collection == "images":
+            query["source"] = source
+        elif collection == "generations" and source in ("manual", "generated"):
+            query["is_manual"] = True if source == "manual" else {"$ne": True}
+        else:
+            raise ExportError("The source filter applies to images (danbooru/gelbooru) and generations (manual/generated)")
+
+    date_range = {}
+    since, until = parse_date(since, "since"), parse_date(until, "until")
+    if since:
+        date_range["$gte"] = since
+    if until:
+        date_range["$lt"] = until
+    if date_range:
+        query[DATE_FIELDS[collection]] = date_range
+    return query
+
+def iter_batches(db, collection, query, batch_size=BATCH_SIZE):
+    """Lists of at most batch_size documents, fetched with a batched cursor"""
+    batch = []
+    with db[collection].find(query, batch_size=batch_size) as cursor:
+        for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def ndjson_chunks(batches):
+    for batch in batches:
+        yield "".join(json.dumps(doc, default=json_default, ensure_ascii=False) + "\n" for doc in batch).encode("utf-8")
+
+# --- Parquet ---
+
+def _convert(value, kind):
+    if value is None:
+        return None
+    try:
+        if kind == "int":
+            return int(value)
+        if kind == "float":
+            return float(value)
+        if kind == "bool":
+            return bool(value)
+        if kind == "time":
+            return value if isinstance(value, datetime) else None
+        if kind == "strlist":
+            return [str(v) for v in value] if isinstance(value, list) else None
+        if kind == "json":
+            return json.dumps(value, default=json_default, ensure_ascii=False)
+        return str(value)
+    except (TypeError, ValueError):
+        return None
+
+def parquet_schema(collection):
+    import pyarrow as pa
+    types = {
+        "int": pa.int64(), "float": pa.float64(), "bool": pa.bool_(), "str": pa.string(),
+        "json": pa.string(), "time": pa.timestamp("ms"), "strlist": pa.list_(pa.string())
+    }
+    return pa.schema([(name, types[kind]) for name, kind in PARQUET_COLUMNS[collection]])
+
+class ChunkSink:
+    """Write-only file object the Parquet writer appends to; drained after each row group"""
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def parquet_chunks(batches, collection):
+    """One row group per batch, yielded as soon as it is encoded"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema(collection)
+    columns = PARQUET_COLUMNS[collection]
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        for batch in batches:
+            data = {name: [_convert(doc.get(name), kind) for doc in batch] for name, kind in columns}
+            writer.write_table(pa.Table.from_pydict(data, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+def export_chunks(db, collection, fmt="ndjson", batch_size=BATCH_SIZE, **filters):
+    """Validate the request and return an iterator of encoded byte chunks"""
+    if fmt not in FORMATS:
+        raise ExportError(f"Unsupported format: {fmt}")
+    query = build_query(db, collection, **filters)
+    if fmt == "parquet":
+        try:
+            import pyarrow.parquet # noqa: F401
+        except ImportError:
+            raise ExportError("Parquet export needs pyarrow (pip install pyarrow)")
+    batches = iter_batches(db, collection, query, batch_size)
+    return parquet_chunks(batches, collection) if fmt == "parquet" else ndjson_chunks(batches)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export a collection as NDJSON or Parquet")
+    parser.add_argument("collection", choices=list(DATE_FIELDS))
+    parser.add_argument("--format", choices=list(FORMATS), default="ndjson")
+    parser.add_argument("--category", help="Style category")
+    parser.add_argument("--model", help="SD model (authors: has generations for it)")
+    parser.add_argument("--since", help="Start date (inclusive), ISO 8601")
+    parser.add_argument("--until", help="End date (exclusive), ISO 8601")
+    parser.add_argument("--source", help="images: danbooru/gelbooru, generations: manual/generated")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("-o", "--output", help="Output file (NDJSON defaults to stdout)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    import pymongo
+    from scripts.settings import settings
+
+    args = parse_args(argv)
+    if args.format == "parquet" and not args.output:
+        sys.exit("Parquet export needs an output file (-o)")
+
+    db = pymongo.MongoClient(settings.MONGO_URI)[settings.DB_NAME]
+    try:
+        chunks = export_chunks(
+            db, args.collection, args.format, args.batch_size,
+            category=args.category, model=args.model, since=args.since, until=args.until, source=args.source
+        )
+    except ExportError as e:
+        sys.exit(str(e))
+
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,42 @@
-import requests
-import time
 import os
+import sys
 from datetime import datetime
 
+# Add parent directory to path to import config
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.booru_client import booru_client
+
 # Gelbooru API
 GELBOORU_API_URL = "https://gelbooru.com/index.php"
-USER_AGENT = "DanbooruRanker/1.0"
-DELAY = 1.0
+
+def search_params(artist_name, limit):
+    """Query parameters for an artist's posts"""
+    return {
+        "page": "dapi",
+        "s": "post",
+        "q": "index",
+        "json": 1,
+        "tags": artist_name,
+        "limit": limit
+    }
+
+def parse_posts(data):
+    """Recent Gelbooru API (0.2.5) returns {"post": [...]} or just [...] depending on
+    version/impl; a single result may come back as a bare dict."""
+    posts = []
+    if isinstance(data, list):
+        posts = data
+    elif isinstance(data, dict) and "post" in data:
+        posts = data["post"]
+    if isinstance(posts, dict):
+        posts = [posts]
+    return posts
 
 class GelbooruScraper:
-    def __init__(self):
-        self.headers = {"User-Agent": USER_AGENT}
+    def __init__(self, client=None):
+        # Blocking shared booru client (pooled, retried, cached) unless one is given
+        self.client = client or booru_client()
 
     def fetch_images_for_artist(self, artist_name, limit=5):
         """Fetch images for an artist from Gelbooru"""
@@ -24,34 +50,11 @@ class GelbooruScraper:
         # Actually Danbooru scraper didn't filter by rating explicitly in the URL params I saw earlier, 
         # but let's stick to just the artist tag to get *something*.
         
-        params = {
-            "page": "dapi",
-            "s": "post",
-            "q": "index",
-            "json": 1,
-            "tags": artist_name,
-            "limit": limit
-        }
+        params = search_params(artist_name, limit)
         
         try:
-            response = requests.get(GELBOORU_API_URL, params=params, headers=self.headers)
-            response.raise_for_status()
             # Gelbooru returns raw JSON list or empty
-            data = response.json()
-            
-            # Gelbooru sometimes returns a dict with 'post' key if XML converted? 
-            # But json=1 usually returns list of dicts or dict with 'post' key.
-            # Let's check the structure.
-            # Recent Gelbooru API (0.2.5) returns {"post": [...]} or just [...] depending on version/impl.
-            # Let's handle both.
-            
-            posts = []
-            if isinstance(data, list):
-                posts = data
-            elif isinstance(data, dict) and "post" in data:
-                posts = data["post"]
-                
-            return posts
+            return parse_posts(self.client.get_json(GELBOORU_API_URL, params))
             
         except Exception as e:
             print(f"Error fetching from Gelbooru for {artist_name}: {e}")
@@ -68,9 +71,7 @@ class GelbooruScraper:
         }
         
         try:
-            response = requests.get(GELBOORU_API_URL, params=params, headers=self.headers)
-            response.raise_for_status()
-            data = response.json()
+            data = self.client.get_json(GELBOORU_API_URL, params)
             
             if isinstance(data, list) and len(data) > 0:
                 return data[0]
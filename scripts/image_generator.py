@@ -9,19 +9,28 @@ import sys
 import concurrent.futures
 import queue
 import threading
+from pymongo.errors import DuplicateKeyError
 
 # Add parent directory to path to import config
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from config import MONGO_URI, DB_NAME, SD_API_URLS, GENERATED_DIR
+from scripts.settings import settings
+from scripts.author_counters import on_generation_added
+from scripts.db_schema import ensure_schema
+from scripts.data_paths import data_url
+from scripts.thumbnails import prewarm
+from scripts.data_version import bump
+from scripts.status_reporter import status_reporter
+from scripts.control import control_channel
+from scripts.metrics import SD_IMAGES, SD_IMAGE_SECONDS, push_to_file
 
 # Quality Prompts
 QUALITY_PROMPT = "masterpiece, best quality, very aesthetic, absurdres"
 NEGATIVE_PROMPT = "low quality, worst quality, bad anatomy, bad hands, text, error, missing fingers, extra digit, fewer digits, cropped, jpeg artifacts, signature, watermark, username, blurry"
 
 def get_db():
-    client = pymongo.MongoClient(MONGO_URI)
-    return client[DB_NAME]
+    client = pymongo.MongoClient(settings.MONGO_URI)
+    return client[settings.DB_NAME]
 
 def escape_sd_chars(text):
     if not text:
@@ -51,6 +60,18 @@ def set_sd_model(model_title, api_url):
         print(f"[{api_url}] Error setting model: {e}")
         return False
 
+def interrupt_instances(api_urls):
+    """Stop the in-flight txt2img on every instance so a cancel frees the GPUs at once"""
+    def interrupt(api_url):
+        try:
+            requests.post(f"{api_url}/sdapi/v1/interrupt", timeout=5)
+            print(f"[{api_url}] Interrupted")
+        except Exception as e:
+            print(f"[{api_url}] Error interrupting: {e}")
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(api_urls))) as executor:
+        list(executor.map(interrupt, api_urls))
+
 def generate_image(prompt, negative_prompt, steps, cfg_scale, sampler_name, scheduler, width, height, api_url, seed=-1):
     payload = {
         "prompt": prompt,
@@ -65,48 +86,27 @@ def generate_image(prompt, negative_prompt, steps, cfg_scale, sampler_name, sche
     }
     
     try:
-        response = requests.post(f"{api_url}/sdapi/v1/txt2img", json=payload, timeout=300)
-        response.raise_for_status()
-        r = response.json()
+        with SD_IMAGE_SECONDS.time(instance=api_url):
+            response = requests.post(f"{api_url}/sdapi/v1/txt2img", json=payload, timeout=300)
+            response.raise_for_status()
+            r = response.json()
+        SD_IMAGES.inc(instance=api_url, status="ok")
         return r["images"][0] # Base64 string
     except Exception as e:
+        SD_IMAGES.inc(instance=api_url, status="error")
         print(f"[{api_url}] Error generating image: {e}")
         return None
 
 def update_status(db, status, progress=0, message="", current=0, total=0):
-    db.system_status.update_one(
-        {"_id": "generator"},
-        {"$set": {
-            "status": status,
-            "progress": progress,
-            "current": current,
-            "total": total,
-            "message": message,
-            "updated_at": datetime.now()
-        }},
-        upsert=True
-    )
+    # Coalesced: written by a background thread at a bounded rate (state changes immediately)
+    status_reporter(db, "generator").update(status, progress, message, current, total)
 
-def check_control(db, task_id="generator"):
-    status = db.system_status.find_one({"_id": task_id})
-    if not status:
-        return "running"
-    
-    control = status.get("control", "running")
-    if control == "pause":
-        print(f"Task {task_id} paused...")
-        update_status(db, "paused", status.get("progress", 0), "Paused", status.get("current", 0), status.get("total", 0))
-        while True:
-            time.sleep(1)
-            status = db.system_status.find_one({"_id": task_id})
-            if status.get("control") != "pause":
-                print(f"Task {task_id} resumed!")
-                update_status(db, "running", status.get("progress", 0), status.get("message", "Resumed"), status.get("current", 0), status.get("total", 0))
-                break
-            if status.get("control") == "cancel":
-                return "cancel"
-    
-    return control
+def check_control(db, task_id="generator", task=None):
+    if task is not None:
+        # Running inside the app's job runner: in-memory pause/cancel
+        return task.check()
+    # Cached, change-stream fed channel instead of a find_one per item
+    return control_channel(db, task_id, update_status).check()
 
 def get_workload_for_model(db, model_name, args):
     """
@@ -154,7 +154,7 @@ def resolve_model_name(model_query, api_url):
             return m
     return None
 
-def process_image_task(db, image, model_full_name, args, api_url):
+def process_image_task(db, image, model_full_name, args, api_url, controller=None):
     """
     Generates a single image on the specified API URL.
     """
@@ -187,7 +187,7 @@ def process_image_task(db, image, model_full_name, args, api_url):
         # Output Path
         model_safe = "".join(c for c in model_full_name if c.isalnum() or c in (' ', '.', '_')).strip().replace(" ", "_")
         artist_safe = "".join(c for c in author_name if c.isalnum() or c in (' ', '.', '_', '-')).strip().replace(" ", "_")
-        output_dir = os.path.join(GENERATED_DIR, artist_safe, model_safe)
+        output_dir = os.path.join(settings.GENERATED_DIR, artist_safe, model_safe)
         os.makedirs(output_dir, exist_ok=True)
         
         # Resolution
@@ -201,10 +201,17 @@ def process_image_task(db, image, model_full_name, args, api_url):
         # Generate
         b64 = generate_image(full_prompt, NEGATIVE_PROMPT, args.steps, args.cfg, args.sampler, args.scheduler, w, h, api_url)
         
+        # An interrupted txt2img still returns the half-denoised image; don't keep it
+        if controller is not None and controller.is_cancelled:
+            return {"status": "cancelled", "msg": "Cancelled"}
+        
         if b64:
             filename = f"{image_id}.png"
             file_path = os.path.join(output_dir, filename)
-            with open(file_path, "wb") as f:
+            # Kept under a temp name until the row is in: a concurrent run that won the
+            # generation_params_unique slot owns file_path
+            tmp_path = f"{file_path}.{os.getpid()}.part"
+            with open(tmp_path, "wb") as f:
                 f.write(base64.b64decode(b64))
                 
             gen_data = {
@@ -218,9 +225,21 @@ def process_image_task(db, image, model_full_name, args, api_url):
                 "sampler": args.sampler,
                 "scheduler": args.scheduler,
                 "local_path": file_path,
+                "url": data_url(file_path),
                 "created_at": datetime.now()
             }
-            generations_collection.insert_one(gen_data)
+            try:
+                generations_collection.insert_one(gen_data)
+            except DuplicateKeyError:
+                os.remove(tmp_path)
+                return {"status": "skipped", "msg": "Already exists"}
+            except Exception:
+                os.remove(tmp_path)
+                raise
+            os.replace(tmp_path, file_path)
+            prewarm(file_path)
+            on_generation_added(db, image["author_id"], model_full_name)
+            bump(db, "generations", "authors")
             return {"status": "generated", "msg": f"Generated {filename}"}
         else:
             return {"status": "failed", "msg": "Generation failed"}
@@ -228,42 +247,45 @@ def process_image_task(db, image, model_full_name, args, api_url):
     except Exception as e:
         return {"status": "error", "msg": str(e)}
 
-def worker_thread(worker_id, api_url, model_queue, image_queue, db, args, status_lock, shared_status):
+def record_result(db, worker_id, res, status_lock, shared_status):
+    with status_lock:
+        shared_status['processed'] += 1
+        if res['status'] == 'generated': shared_status['generated'] += 1
+        elif res['status'] == 'skipped': shared_status['skipped'] += 1
+        processed, total = shared_status['processed'], shared_status['total']
+    
+    msg = f"[{worker_id}] {res['msg']}"
+    print(msg)
+    # In-memory only; the reporter writes a merged document at a bounded rate
+    status_reporter(db, "generator").incr(res['status'])
+    update_status(db, "running", int((processed / total) * 100) if total > 0 else 0, msg, processed, total)
+
+def worker_thread(worker_id, api_url, model_queue, image_queue, db, args, status_lock, shared_status, task=None):
     """
     Worker thread that manages a specific SD instance.
     Strategy:
     1. If image_queue is populated (Single Model Mode), process it.
     2. If model_queue is populated (Multi Model Mode), pick a model, load it, then find work for it.
     """
+    controller = task if task is not None else control_channel(db, "generator", update_status)
     print(f"[Worker {worker_id}] Started on {api_url}")
     
     while True:
         # Check Control
-        if check_control(db) == "cancel":
+        if check_control(db, task=task) == "cancel":
             break
             
         # MODE 1: Single Model (Shared Image Queue)
         # If the main thread populated image_queue, we just consume it.
         if not image_queue.empty():
             try:
-                task = image_queue.get(timeout=1)
-                # task = (image_doc, model_full_name)
-                image, model_full_name = task
+                item = image_queue.get(timeout=1)
+                # item = (image_doc, model_full_name); `task` stays the job's Task handle
+                image, model_full_name = item
                 
-                res = process_image_task(db, image, model_full_name, args, api_url)
+                res = process_image_task(db, image, model_full_name, args, api_url, controller)
                 
-                with status_lock:
-                    shared_status['processed'] += 1
-                    if res['status'] == 'generated': shared_status['generated'] += 1
-                    elif res['status'] == 'skipped': shared_status['skipped'] += 1
-                    
-                    # Update DB every 5 items or so to reduce load? Or just every time.
-                    # Let's do every time for responsiveness.
-                    msg = f"[{worker_id}] {res['msg']}"
-                    print(msg)
-                    update_status(db, "running", 
-                                int((shared_status['processed'] / shared_status['total']) * 100) if shared_status['total'] > 0 else 0,
-                                msg, shared_status['processed'], shared_status['total'])
+                record_result(db, worker_id, res, status_lock, shared_status)
                 
                 image_queue.task_done()
                 continue
@@ -336,20 +358,11 @@ def worker_thread(worker_id, api_url, model_queue, image_queue, db, args, status
                 
                 # Process these images locally on this worker
                 for img in tasks:
-                    if check_control(db) == "cancel": break
+                    if check_control(db, task=task) == "cancel": break
                     
-                    res = process_image_task(db, img, full_model_name, args, api_url)
+                    res = process_image_task(db, img, full_model_name, args, api_url, controller)
                     
-                    with status_lock:
-                        shared_status['processed'] += 1
-                        if res['status'] == 'generated': shared_status['generated'] += 1
-                        elif res['status'] == 'skipped': shared_status['skipped'] += 1
-                        
-                        msg = f"[{worker_id}] {res['msg']}"
-                        print(msg)
-                        update_status(db, "running", 
-                                    int((shared_status['processed'] / shared_status['total']) * 100) if shared_status['total'] > 0 else 0,
-                                    msg, shared_status['processed'], shared_status['total'])
+                    record_result(db, worker_id, res, status_lock, shared_status)
                 
                 model_queue.task_done()
                 
@@ -364,7 +377,7 @@ def worker_thread(worker_id, api_url, model_queue, image_queue, db, args, status
                 break
             time.sleep(1)
 
-def main():
+def parse_args(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument("--models", nargs='+', required=True)
     parser.add_argument("--steps", type=int, default=28)
@@ -375,10 +388,15 @@ def main():
     parser.add_argument("--prompt", type=str, default="")
     parser.add_argument("--authors", type=str, default="")
     parser.add_argument("--skip-existing-authors", action="store_true") # Deprecated but kept for compat
-    args = parser.parse_args()
+    return parser.parse_args(argv)
 
-    db = get_db()
+def run(db, args, task=None):
+    """Generate for every requested model; `task` is the app job runner's Task when run in-process"""
+    # Resolved per run so instances saved in the settings apply without a restart
+    SD_API_URLS = settings.SD_API_URLS
     print(f"Loaded {len(SD_API_URLS)} SD instances: {SD_API_URLS}")
+    controller = task if task is not None else control_channel(db, "generator", update_status)
+    controller.on_cancel(lambda: interrupt_instances(SD_API_URLS))
     
     # Shared State
     model_queue = queue.Queue()
@@ -401,6 +419,7 @@ def main():
         
         if not full_model_name:
             print(f"Model {target_model_query} not found!")
+            update_status(db, "error", 0, f"Model {target_model_query} not found", 0, 0)
             return
 
         # 2. Set Model on ALL instances
@@ -455,15 +474,24 @@ def main():
     # Start Workers
     threads = []
     for i, url in enumerate(SD_API_URLS):
-        t = threading.Thread(target=worker_thread, args=(i, url, model_queue, image_queue, db, args, status_lock, shared_status))
+        t = threading.Thread(target=worker_thread, args=(i, url, model_queue, image_queue, db, args, status_lock, shared_status, task))
         t.start()
         threads.append(t)
         
     for t in threads:
         t.join()
         
+    if task is not None and task.is_cancelled:
+        return
     print("All tasks complete.")
     update_status(db, "idle", 100, f"Complete. Generated: {shared_status['generated']}, Skipped: {shared_status['skipped']}", 0, 0)
 
+def main():
+    args = parse_args()
+    push_to_file("generator")
+    db = get_db()
+    ensure_schema(db)
+    run(db, args)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,238 @@
+import atexit
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from pymongo import monitoring
+
+# Add parent directory to path to import config
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.settings import settings
+
+# Shared metrics registry rendered by /metrics in the Prometheus text format.
+# Pipelines started from the app record straight into this registry; scripts run
+# from the command line call push_to_file() and their snapshots (one JSON file per
+# process under settings.METRICS_DIR) are merged into the endpoint's output.
+
+DEFAULT_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+# Snapshots of processes that stopped pushing this long ago are dropped
+FILE_RETENTION = 24 * 3600
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = list(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self.lock:
+            return [[list(key), value] for key, value in self.values.items()]
+
+    def merge(self, totals, values):
+        for key, value in values:
+            totals[tuple(key)] = totals.get(tuple(key), 0) + value
+
+    def render(self, totals):
+        for key, value in sorted(totals.items()):
+            yield f"{self.name}{_labels(self.labelnames, key)} {_number(value)}"
+
+class Histogram(Counter):
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = list(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry["buckets"][i] += 1
+                    break
+            entry["sum"] += value
+            entry["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        with self.lock:
+            return [[list(key), {"buckets": list(e["buckets"]), "sum": e["sum"], "count": e["count"]}] for key, e in self.values.items()]
+
+    def merge(self, totals, values):
+        for key, entry in values:
+            total = totals.setdefault(tuple(key), {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            if len(entry["buckets"]) != len(self.buckets):
+                continue  # Written with different buckets by an older version
+            total["buckets"] = [a + b for a, b in zip(total["buckets"], entry["buckets"])]
+            total["sum"] += entry["sum"]
+            total["count"] += entry["count"]
+
+    def render(self, totals):
+        for key, entry in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry["buckets"]):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _number(float(bound)))])} {cumulative}"
+            yield f"{self.name}_bucket{_labels(self.labelnames, key, [('le', '+Inf')])} {entry['count']}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_number(entry['sum'])}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {entry['count']}"
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def render(self, snapshots=()):
+        """Text exposition of this process plus snapshots pushed by other processes"""
+        lines = []
+        for name, metric in self.metrics.items():
+            totals = {}
+            metric.merge(totals, metric.snapshot())
+            for snapshot in snapshots:
+                metric.merge(totals, snapshot.get(name, []))
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            lines.extend(metric.render(totals))
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# --- Metrics ---
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram("http_request_duration_seconds", "API request latency", ["method", "route", "status"])
+AUTHORS_QUERY_SECONDS = REGISTRY.histogram("authors_query_duration_seconds", "Author list queries (response cache misses)", ["sort_by"])
+RESPONSE_CACHE_REQUESTS = REGISTRY.counter("response_cache_requests_total", "Cached endpoint lookups", ["result"])
+
+MONGO_COMMANDS = REGISTRY.counter("mongo_commands_total", "MongoDB commands", ["command", "status"])
+MONGO_COMMAND_SECONDS = REGISTRY.histogram("mongo_command_duration_seconds", "MongoDB command latency", ["command"])
+
+BOORU_REQUESTS = REGISTRY.counter("booru_requests_total", "Danbooru/Gelbooru API requests", ["host", "status"])
+BOORU_REQUEST_SECONDS = REGISTRY.histogram("booru_request_duration_seconds", "Danbooru/Gelbooru API request latency", ["host"])
+BOORU_CACHE_REQUESTS = REGISTRY.counter("booru_cache_requests_total", "Booru JSON response cache lookups", ["result"])
+IMAGE_DOWNLOADS = REGISTRY.counter("image_downloads_total", "Original image downloads", ["status"])
+IMAGE_DOWNLOAD_BYTES = REGISTRY.counter("image_download_bytes_total", "Bytes of downloaded originals")
+IMAGE_DOWNLOAD_SECONDS = REGISTRY.histogram("image_download_duration_seconds", "Original image download time", buckets=[0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0])
+
+SD_IMAGES = REGISTRY.counter("sd_images_total", "txt2img requests per SD instance", ["instance", "status"])
+SD_IMAGE_SECONDS = REGISTRY.histogram("sd_image_duration_seconds", "Seconds per generated image per SD instance", ["instance"], buckets=[1, 2, 5, 10, 20, 30, 60, 120, 300])
+
+CLIP_IMAGES = REGISTRY.counter("clip_images_total", "Images classified by the style analyzer", ["status"])
+CLIP_BATCH_SECONDS = REGISTRY.histogram("clip_batch_duration_seconds", "CLIP embedding + classification time per batch", buckets=[0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0])
+
+# --- MongoDB command monitoring (every client created after this import) ---
+
+class MongoCommandListener(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMANDS.inc(command=event.command_name, status="ok")
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, command=event.command_name)
+
+    def failed(self, event):
+        MONGO_COMMANDS.inc(command=event.command_name, status="error")
+        MONGO_COMMAND_SECONDS.observe(event.duration_micros / 1e6, command=event.command_name)
+
+monitoring.register(MongoCommandListener())
+
+# --- Out-of-process push ---
+
+def metrics_file(name, pid=None):
+    return os.path.join(settings.METRICS_DIR, f"{name}-{pid or os.getpid()}.json")
+
+def write_snapshot(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(REGISTRY.snapshot(), f)
+    os.replace(tmp_path, path)
+
+def push_to_file(name, interval=10.0):
+    """Command-line runs: write this process's metrics every `interval` seconds and at exit"""
+    path = metrics_file(name)
+
+    def push():
+        try:
+            write_snapshot(path)
+        except OSError as e:
+            print(f"Could not write metrics to {path}: {e}")
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            push()
+
+    threading.Thread(target=loop, name="metrics-push", daemon=True).start()
+    atexit.register(push)
+
+def read_pushed(exclude_pid=None):
+    """Snapshots written by other processes; stale files are removed"""
+    snapshots = []
+    cutoff = time.time() - FILE_RETENTION
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, "*.json")):
+        try:
+            if exclude_pid and path.endswith(f"-{exclude_pid}.json"):
+                continue
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                continue
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+def render_all():
+    return REGISTRY.render(read_pushed(exclude_pid=os.getpid()))
@@ -0,0 +1,65 @@
+import asyncio
+import time
+from email.utils import parsedate_to_datetime
+
+# Token buckets with AIMD (additive increase, multiplicative decrease) rate control.
+# Each booru endpoint class gets its own bucket: the Danbooru API, the Danbooru CDN
+# and Gelbooru have very different limits, and a 429 from one must not slow the others.
+# On 429/503 the rate is halved and any Retry-After is honored; every success nudges
+# the rate back up towards the configured ceiling.
+
+THROTTLE_STATUSES = [429, 503]
+
+def retry_after_seconds(value):
+    """Retry-After header (seconds or HTTP date) -> seconds, None if absent/invalid"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class AdaptiveRateLimiter:
+    def __init__(self, rate, burst=1, min_rate=0.1, increase=None, decrease=0.5):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min(min_rate, rate)
+        # Recover ~10% of the ceiling per success by default
+        self.increase = increase if increase is not None else rate / 10
+        self.decrease = decrease
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def success(self):
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def throttled(self, retry_after=None):
+        """Server pushed back: halve the rate and pause for Retry-After if given"""
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        self.tokens = min(self.tokens, 0.0)
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
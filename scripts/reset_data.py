@@ -6,11 +6,8 @@ import pymongo
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-try:
-    import config
-except ImportError:
-    print("Error: config.py not found. Please copy config.example.py to config.py")
-    sys.exit(1)
+from scripts.settings import settings
+from scripts.data_version import reset_versions
 
 def confirm_action(message):
     response = input(f"{message} (y/N): ").lower()
@@ -18,25 +15,27 @@ def confirm_action(message):
 
 def reset_data():
     print("!!! WARNING: THIS WILL DELETE ALL DATA !!!")
-    print(f"Database: {config.DB_NAME}")
-    print(f"Images Dir: {config.IMAGES_DIR}")
-    print(f"Generated Dir: {config.GENERATED_DIR}")
+    print(f"Database: {settings.DB_NAME}")
+    print(f"Images Dir: {settings.IMAGES_DIR}")
+    print(f"Generated Dir: {settings.GENERATED_DIR}")
     
     if not confirm_action("Are you sure you want to delete all data?"):
         print("Operation cancelled.")
         return
 
     # 1. Drop Database
-    print(f"Dropping database '{config.DB_NAME}'...")
+    print(f"Dropping database '{settings.DB_NAME}'...")
     try:
-        client = pymongo.MongoClient(config.MONGO_URI)
-        client.drop_database(config.DB_NAME)
+        client = pymongo.MongoClient(settings.MONGO_URI)
+        client.drop_database(settings.DB_NAME)
+        # Not back to 0: a running API would otherwise match pre-reset ETags again
+        reset_versions(client[settings.DB_NAME])
         print("Database dropped.")
     except Exception as e:
         print(f"Error dropping database: {e}")
 
     # 2. Delete Directories
-    for dir_path in [config.IMAGES_DIR, config.GENERATED_DIR]:
+    for dir_path in [settings.IMAGES_DIR, settings.GENERATED_DIR]:
         if os.path.exists(dir_path):
             print(f"Cleaning {dir_path}...")
             try:
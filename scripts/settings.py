@@ -0,0 +1,196 @@
+import json
+import os
+import sys
+import threading
+
+# Add parent directory to path to import config
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Settings resolved on first use and cached, in increasing priority:
+#   config.py  <  environment (DANBOORU_RANKER_<NAME>)  <  app_config "settings" in MongoDB
+# Nothing touches MongoDB at import time; the DB layer is read the first time a setting
+# it can override is needed. The connection settings themselves (BOOTSTRAP_SETTINGS)
+# come from config.py/env only, so reading them never opens a connection. Derived paths (IMAGES_DIR, ...) are computed on access so
+# they follow DATA_DIR, and components can subscribe to changes instead of restarting.
+
+ENV_PREFIX = "DANBOORU_RANKER_"
+
+DEFAULTS = {
+    "MONGO_URI": "mongodb://localhost:27017/",
+    "DB_NAME": "danbooru_ranker",
+    "DANBOORU_API_URL": "https://danbooru.donmai.us",
+    "USER_AGENT": "DanbooruRanker/1.0",
+    "SD_API_URLS": ["http://127.0.0.1:7860"],
+    "DATA_DIR": os.path.join(os.path.expanduser("~"), "danbooru_ranker_data"),
+    "STYLE_HTML_PATH": None,
+    "STYLE_SAMPLES_DIR": None,
+    "SD_LIST_CACHE_TTL": 60,
+    "SD_SCAN_HOSTS": ["127.0.0.1"],
+    "SD_SCAN_PORTS": "7860-7869",
+    "IMPORT_CONCURRENCY": 4,
+    "IMPORT_RATE_LIMIT": 2.0,
+    "SCRAPER_CONCURRENCY": 4,
+    "DANBOORU_API_RATE": 2.0,
+    "DANBOORU_CDN_RATE": 8.0,
+    "GELBOORU_RATE": 1.0,
+    "BOORU_CACHE_TTL": 3600,
+    "BOORU_CACHE_MAX_MB": 512,
+    "JOB_WORKERS": 4,
+    "DATA_OFFLOAD": None,
+    "DATA_OFFLOAD_PREFIX": "/internal-data/",
+}
+
+# app_config field -> setting
+DB_FIELDS = {
+    "data_dir": "DATA_DIR",
+    "sd_api_urls": "SD_API_URLS",
+    "style_html_path": "STYLE_HTML_PATH",
+    "style_samples_dir": "STYLE_SAMPLES_DIR",
+}
+
+# Subdirectories of DATA_DIR unless config.py points them elsewhere
+DERIVED_DIRS = {
+    "IMAGES_DIR": "images",
+    "GENERATED_DIR": "generated",
+    "MANUAL_DIR": "manual",
+    "THUMBS_DIR": "thumbs",
+    "METRICS_DIR": "metrics",
+    "BOORU_CACHE_DIR": "http_cache",
+}
+
+# Needed to reach the database, so never overridden from it: config.py/env only,
+# and changing them means a restart
+BOOTSTRAP_SETTINGS = ["MONGO_URI", "DB_NAME"]
+
+def _parse_env(value):
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+class Settings:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._file = None
+        self._db = None
+        self._listeners = []
+
+    # --- Layers ---
+
+    def _file_layer(self):
+        if self._file is None:
+            try:
+                import config
+                self._file = {name: getattr(config, name) for name in dir(config) if name.isupper()}
+            except ImportError:
+                print("config.py not found, using defaults (copy config.example.py to config.py)")
+                self._file = {}
+        return self._file
+
+    def _static(self, name):
+        """File/env value, without consulting the database"""
+        env = os.environ.get(ENV_PREFIX + name)
+        if env is not None:
+            return _parse_env(env)
+        file = self._file_layer()
+        if name in file:
+            return file[name]
+        if name in DEFAULTS:
+            return DEFAULTS[name]
+        raise AttributeError(f"Unknown setting: {name}")
+
+    def _db_layer(self):
+        with self._lock:
+            if self._db is None:
+                self._db = self._load_db()
+            return self._db
+
+    def _load_db(self):
+        try:
+            from pymongo import MongoClient
+            client = MongoClient(self._static("MONGO_URI"), serverSelectionTimeoutMS=2000)
+            try:
+                doc = client[self._static("DB_NAME")].app_config.find_one({"_id": "settings"}) or {}
+            finally:
+                client.close()
+        except Exception as e:
+            print(f"Failed to load config from DB: {e}")
+            return {}
+        return {DB_FIELDS[field]: value for field, value in doc.items() if field in DB_FIELDS and value not in (None, "", [])}
+
+    # --- Access ---
+
+    def get(self, name, default=None):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            return default
+
+    def __getattr__(self, name):
+        if name.startswith("_") or not name.isupper():
+            raise AttributeError(name)
+
+        if name == "SD_API_URL":
+            urls = self.SD_API_URLS
+            return urls[0] if urls else None
+
+        if name in DERIVED_DIRS:
+            file = self._file_layer()
+            default_path = os.path.join(file.get("DATA_DIR", ""), DERIVED_DIRS[name])
+            env = os.environ.get(ENV_PREFIX + name)
+            if env is not None:
+                return env
+            if name in file and os.path.normpath(file[name]) != os.path.normpath(default_path):
+                return file[name]
+            return os.path.join(self.DATA_DIR, DERIVED_DIRS[name])
+
+        if name in DB_FIELDS.values():
+            overrides = self._db_layer()
+            if name in overrides:
+                return overrides[name]
+        return self._static(name)
+
+    def as_dict(self):
+        names = set(DEFAULTS) | set(self._file_layer()) | set(DERIVED_DIRS) | {"SD_API_URL"}
+        return {name: self.get(name) for name in sorted(names)}
+
+    # --- Changes ---
+
+    def subscribe(self, callback):
+        """callback(changed) with {setting: new value}, called after every change made
+        in this process (update/reload). Other processes, e.g. CLI scripts, see saved
+        changes only when they call reload() or on their next start."""
+        self._listeners.append(callback)
+        return callback
+
+    def _apply(self, overrides):
+        with self._lock:
+            watched = list(DB_FIELDS.values()) + list(DERIVED_DIRS) + ["SD_API_URL"]
+            before = {name: self.get(name) for name in watched}
+            self._db = overrides
+            changed = {name: self.get(name) for name in watched if self.get(name) != before[name]}
+        for callback in list(self._listeners):
+            try:
+                callback(changed)
+            except Exception as e:
+                print(f"Settings listener failed: {e}")
+        return changed
+
+    def update(self, values):
+        """Apply app_config fields saved through the API; returns the changed settings"""
+        overrides = dict(self._db_layer())
+        for field, value in values.items():
+            if field in DB_FIELDS:
+                if value in (None, "", []):
+                    overrides.pop(DB_FIELDS[field], None)
+                else:
+                    overrides[DB_FIELDS[field]] = value
+        return self._apply(overrides)
+
+    def reload(self):
+        """Re-read the database layer (and config.py) and notify listeners"""
+        with self._lock:
+            self._file = None
+        return self._apply(self._load_db())
+
+settings = Settings()
@@ -0,0 +1,117 @@
+import atexit
+import threading
+import time
+from datetime import datetime
+
+# Coalescing writer for system_status. Pipelines update progress in memory as often as
+# they like (every image, every artist, from any number of worker threads); a background
+# thread writes the merged document at most every `interval` seconds, adding throughput
+# and ETA. State changes (paused, idle, error, ...) are written immediately.
+
+FLUSH_INTERVAL = 1.0
+
+# Weight of the newest sample in the smoothed rate
+RATE_SMOOTHING = 0.3
+
+class StatusReporter:
+    def __init__(self, db, task_id, interval=FLUSH_INTERVAL):
+        self.db = db
+        self.task_id = task_id
+        self.interval = interval
+        self.fields = {}
+        self.counters = {}
+        self.dirty = False
+        self.lock = threading.Lock()
+        # Serializes writes so an older snapshot can never land after a newer one
+        self.write_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.rate = None
+        self._rate_sample = None
+        self._thread = threading.Thread(target=self._flush_loop, name=f"status-{task_id}", daemon=True)
+        self._thread.start()
+
+    def update(self, status, progress=0, message="", current=0, total=0, **extra):
+        """Same arguments as the scripts' update_status; cheap enough to call per item"""
+        with self.lock:
+            changed_state = self.fields.get("status") != status
+            if changed_state and status in ("starting", "running"):
+                # New run: restart the throughput estimate
+                self.rate = None
+                self._rate_sample = None
+            self.fields.update(status=status, progress=progress, message=message, current=current, total=total, **extra)
+            self.dirty = True
+        if changed_state and status != "running":
+            self.flush()
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+            self.dirty = True
+
+    def _throughput(self, current, total):
+        now = time.monotonic()
+        if self._rate_sample is not None:
+            last_time, last_current = self._rate_sample
+            elapsed = now - last_time
+            if elapsed > 0 and current >= last_current:
+                sample = (current - last_current) / elapsed
+                self.rate = sample if self.rate is None else RATE_SMOOTHING * sample + (1 - RATE_SMOOTHING) * self.rate
+        self._rate_sample = (now, current)
+        eta = None
+        if self.rate and total and total > current:
+            eta = int((total - current) / self.rate)
+        return {"rate": round(self.rate, 3) if self.rate is not None else None, "eta_seconds": eta}
+
+    def flush(self):
+        with self.write_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                doc = dict(self.fields)
+                if self.counters:
+                    doc["counters"] = dict(self.counters)
+                if doc.get("status") == "running":
+                    doc.update(self._throughput(doc.get("current", 0), doc.get("total", 0)))
+                else:
+                    doc.update(rate=None, eta_seconds=None)
+                doc["updated_at"] = datetime.now()
+                self.dirty = False
+            try:
+                self.db.system_status.update_one({"_id": self.task_id}, {"$set": doc}, upsert=True)
+            except Exception as e:
+                print(f"Status write for {self.task_id} failed: {e}")
+
+    def _flush_loop(self):
+        while not self.closed:
+            self.wakeup.wait(self.interval)
+            self.flush()
+
+    def close(self):
+        """Write anything pending; the reporter is recreated on next use"""
+        self.closed = True
+        self.wakeup.set()
+        self.flush()
+
+_reporters = {}
+_reporters_lock = threading.Lock()
+
+def status_reporter(db, task_id):
+    """Shared reporter for a task in this process"""
+    with _reporters_lock:
+        reporter = _reporters.get(task_id)
+        if reporter is None or reporter.closed:
+            reporter = _reporters[task_id] = StatusReporter(db, task_id)
+        return reporter
+
+def close_reporter(task_id):
+    with _reporters_lock:
+        reporter = _reporters.pop(task_id, None)
+    if reporter is not None:
+        reporter.close()
+
+@atexit.register
+def close_all_reporters():
+    # CLI runs: don't lose the last coalesced update when the script exits
+    for task_id in list(_reporters):
+        close_reporter(task_id)
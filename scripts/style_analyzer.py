@@ -1,6 +1,7 @@
 
 import os
 import sys
+import time
 import torch
 from PIL import Image
 from transformers import CLIPProcessor, CLIPModel
@@ -12,14 +13,14 @@ import numpy as np
 from tqdm import tqdm
 
 # Add parent directory to path to import config
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-import config
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.settings import settings
+from scripts.db_schema import ensure_schema
+from scripts.data_version import bump
+from scripts.status_reporter import status_reporter
+from scripts.metrics import CLIP_IMAGES, CLIP_BATCH_SECONDS, push_to_file
 
 # Configuration
-MONGO_URI = config.MONGO_URI
-DB_NAME = config.DB_NAME
-HTML_FILE = config.STYLE_HTML_PATH
-SAMPLES_DIR = config.STYLE_SAMPLES_DIR
 MODEL_ID = "openai/clip-vit-base-patch32"
 BATCH_SIZE = 32
 
@@ -28,24 +29,14 @@ def get_device():
         return "cuda"
     return "cpu"
 
-from datetime import datetime
-
 def update_status(db, status, progress=0, message="", current=0, total=0):
-    db.system_status.update_one(
-        {"_id": "style_analyzer"},
-        {"$set": {
-            "status": status,
-            "progress": progress,
-            "current": current,
-            "total": total,
-            "message": message,
-            "updated_at": datetime.now()
-        }},
-        upsert=True
-    )
+    # Coalesced: written by a background thread at a bounded rate (state changes immediately)
+    status_reporter(db, "style_analyzer").update(status, progress, message, current, total)
 
 def parse_ground_truth(db):
     """Parses the HTML file to get Artist -> (Category, ImagePath) mapping."""
+    HTML_FILE = settings.STYLE_HTML_PATH
+    SAMPLES_DIR = settings.STYLE_SAMPLES_DIR
     print(f"Parsing {HTML_FILE}...")
     update_status(db, "running", 0, "Parsing ground truth HTML...", 0, 0)
     
@@ -101,11 +92,17 @@ def parse_ground_truth(db):
     print(f"Found {total_images} sample images across {len(category_images)} categories.")
     return category_images
 
+# Loaded once per process; the app's job runner reuses it across runs
+_loaded_models = {}
+
 def load_model(device, db):
+    if (MODEL_ID, device) in _loaded_models:
+        return _loaded_models[(MODEL_ID, device)]
     print(f"Loading CLIP model ({MODEL_ID}) on {device}...")
     update_status(db, "running", 5, "Loading CLIP model...", 0, 0)
     model = CLIPModel.from_pretrained(MODEL_ID).to(device)
     processor = CLIPProcessor.from_pretrained(MODEL_ID)
+    _loaded_models[(MODEL_ID, device)] = (model, processor)
     return model, processor
 
 def compute_centroids(db, category_images, model, processor, device):
@@ -149,7 +146,7 @@ def compute_centroids(db, category_images, model, processor, device):
             
     return category_embeddings
 
-def classify_images(db, centroids, model, processor, device):
+def classify_images(db, centroids, model, processor, device, task=None):
     print("Classifying all images in database...")
     
     # Get all images that don't have a style_category yet (or update all if needed)
@@ -164,6 +161,9 @@ def classify_images(db, centroids, model, processor, device):
     update_status(db, "running", 30, "Starting classification...", 0, total_images)
     
     for doc in tqdm(cursor, total=total_images):
+        if task is not None and task.check() == "cancel":
+            print("Style analysis cancelled.")
+            return
         path = doc.get('local_path')
         if not path or not os.path.exists(path):
             processed_count += 1
@@ -197,6 +197,7 @@ def classify_images(db, centroids, model, processor, device):
         update_status(db, "running", 100, "Classification complete", processed_count, total_images)
 
 def process_batch(db, images, ids, centroids, model, processor, device):
+    started = time.perf_counter()
     try:
         inputs = processor(images=images, return_tensors="pt", padding=True).to(device)
         with torch.no_grad():
@@ -224,14 +225,19 @@ def process_batch(db, images, ids, centroids, model, processor, device):
                 {'_id': img_id},
                 {'$set': {'style_category': best_cat, 'style_score': float(best_score)}}
             )
+        
+        bump(db, "styles")
+        CLIP_IMAGES.inc(len(ids), status="ok")
             
     except Exception as e:
+        CLIP_IMAGES.inc(len(ids), status="error")
         print(f"Batch processing error: {e}")
+    finally:
+        CLIP_BATCH_SECONDS.observe(time.perf_counter() - started)
 
-def main():
+def run(db, task=None):
+    """Full analysis; `task` is the app job runner's Task when run in-process"""
     device = get_device()
-    client = MongoClient(MONGO_URI)
-    db = client[DB_NAME]
     
     try:
         # 1. Parse Ground Truth
@@ -253,7 +259,9 @@ def main():
             return
             
         # 4. Classify Images
-        classify_images(db, centroids, model, processor, device)
+        classify_images(db, centroids, model, processor, device, task=task)
+        if task is not None and task.is_cancelled:
+            return
         
         print("Style analysis complete!")
         update_status(db, "idle", 100, "Style analysis complete!", 0, 0)
@@ -262,5 +270,12 @@ def main():
         print(f"Style analysis failed: {e}")
         update_status(db, "error", 0, f"Error: {str(e)}", 0, 0)
 
+def main():
+    push_to_file("style_analyzer")
+    client = MongoClient(settings.MONGO_URI)
+    db = client[settings.DB_NAME]
+    ensure_schema(db)
+    run(db)
+
 if __name__ == "__main__":
     main()
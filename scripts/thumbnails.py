@@ -0,0 +1,73 @@
+import hashlib
+import os
+import sys
+import threading
+
+# Add parent directory to path to import config
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.settings import settings
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Derivatives are cached under settings.THUMBS_DIR (DATA_DIR/thumbs), keyed by source
+# path + mtime, so a rewritten source automatically gets a fresh thumbnail.
+THUMB_WIDTHS = [160, 320, 640]
+PREWARM_WIDTH = 320
+FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+QUALITY = 80
+
+def snap_width(width):
+    """Round a requested width up to the nearest supported size"""
+    for w in THUMB_WIDTHS:
+        if width <= w:
+            return w
+    return THUMB_WIDTHS[-1]
+
+def thumbnail_path(source_path, width, fmt="webp", thumbs_dir=None):
+    stat = os.stat(source_path)
+    key = f"{os.path.abspath(source_path)}|{stat.st_mtime_ns}|{width}|{fmt}"
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return os.path.join(thumbs_dir or settings.THUMBS_DIR, digest[:2], f"{digest}.{fmt}")
+
+def render_thumbnail(source_path, width, fmt="webp", thumbs_dir=None):
+    """Create (or reuse) the cached derivative and return its path.
+    Top-level function so it can run in a ProcessPoolExecutor (pass thumbs_dir so the
+    worker process doesn't have to resolve settings itself)."""
+    if Image is None:
+        raise RuntimeError("Pillow is not installed")
+
+    out_path = thumbnail_path(source_path, width, fmt, thumbs_dir)
+    if os.path.exists(out_path):
+        return out_path
+
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    pil_format = FORMATS[fmt][0]
+
+    with Image.open(source_path) as image:
+        if image.width > width:
+            size = (width, max(1, image.height * width // image.width))
+            image.draft("RGB", size)  # JPEG: decode at a reduced scale
+            image.thumbnail(size)
+        if image.mode not in ("RGB", "RGBA") or (pil_format == "JPEG" and image.mode != "RGB"):
+            image = image.convert("RGB")
+
+        # Write to a temp file and rename so concurrent readers never see a partial file
+        tmp_path = f"{out_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        image.save(tmp_path, pil_format, quality=QUALITY)
+        os.replace(tmp_path, out_path)
+
+    return out_path
+
+def prewarm(source_path, widths=None, fmt="webp"):
+    """Generate the browse-grid thumbnail right after a file is written. Never raises."""
+    if Image is None:
+        return
+    for width in widths or [PREWARM_WIDTH]:
+        try:
+            render_thumbnail(source_path, width, fmt)
+        except Exception as e:
+            print(f"Thumbnail failed for {source_path}: {e}")
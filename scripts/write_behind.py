@@ -0,0 +1,208 @@
+import os
+import sys
+import threading
+
+import pymongo
+from bson import json_util
+from pymongo.errors import BulkWriteError, PyMongoError
+
+# Add parent directory to path to import config
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.settings import settings
+from scripts.author_counters import image_added_update
+from scripts.data_version import bump
+
+# Write-behind buffer for the scraper. New authors and downloaded images are queued in
+# memory and written as unordered bulk_writes once FLUSH_OPS are pending, every
+# FLUSH_INTERVAL seconds from a background thread, and on close (cancel, completion,
+# exit). Author counters and data versions are bumped once per flush, not per row.
+#
+# Image rows are appended to a journal (DATA_DIR/scraper_journal.jsonl) before they are
+# queued. The journal is removed only after a clean close, so after a crash the next
+# run replays it: every journaled file still on disk that has no images row gets one.
+
+FLUSH_OPS = 500
+FLUSH_INTERVAL = 2.0
+JOURNAL_NAME = "scraper_journal.jsonl"
+
+DUPLICATE_KEY = 11000
+
+def journal_path():
+    return os.path.join(settings.DATA_DIR, JOURNAL_NAME)
+
+def write_errors(result):
+    """Failed ops other than duplicate keys (an author inserted by a concurrent run)"""
+    return [err for err in result.get("writeErrors", []) if err.get("code") != DUPLICATE_KEY]
+
+def bulk_write(db, collection, ops):
+    """Unordered bulk_write -> raw result (nInserted, upserted, writeErrors, ...), also
+    when some ops failed"""
+    try:
+        return db[collection].bulk_write(ops, ordered=False).bulk_api_result
+    except BulkWriteError as e:
+        for err in write_errors(e.details)[:5]:
+            print(f"Write to {collection} failed: {err.get('errmsg')}")
+        return e.details
+
+class WriteBehind:
+    def __init__(self, db, journal=None, max_ops=FLUSH_OPS, interval=FLUSH_INTERVAL):
+        self.db = db
+        self.journal = journal or journal_path()
+        self.max_ops = max_ops
+        self.interval = interval
+        self.authors = []
+        self.images = []
+        # Image ids being downloaded or queued by this run; the images collection only
+        # sees them after the next flush
+        self.claimed = set()
+        self.lock = threading.Lock()
+        # Serializes flushes so counters and versions are applied in order
+        self.write_lock = threading.Lock()
+        self.journal_lock = threading.Lock()
+        self.journal_file = None
+        # Set when any write failed; the journal is then kept for the next run
+        self.failed = False
+        self.wakeup = threading.Event()
+        self.closed = False
+        self._thread = threading.Thread(target=self._flush_loop, name="write-behind", daemon=True)
+        self._thread.start()
+
+    # --- Queueing ---
+
+    def insert_author(self, author_data):
+        with self.lock:
+            self.authors.append(pymongo.InsertOne(author_data))
+            full = len(self.authors) + len(self.images) >= self.max_ops
+        if full:
+            self.flush()
+
+    def claim(self, image_ids, limit=None):
+        """Reserve image ids for download. Returns the ids (in order, at most `limit`)
+        not already claimed, so concurrent authors sharing a post fetch it once."""
+        claimed = []
+        with self.lock:
+            for image_id in image_ids:
+                if limit is not None and len(claimed) >= limit:
+                    break
+                if image_id not in self.claimed:
+                    self.claimed.add(image_id)
+                    claimed.append(image_id)
+        return claimed
+
+    def release(self, image_id):
+        """Give up a claim (download failed) so a later page or author may retry it"""
+        with self.lock:
+            self.claimed.discard(image_id)
+
+    def upsert_image(self, image_data, journaled=False):
+        if not journaled:
+            self._append_journal(image_data)
+        with self.lock:
+            self.claimed.add(image_data["_id"])
+            self.images.append((
+                pymongo.UpdateOne({"_id": image_data["_id"]}, {"$set": image_data}, upsert=True),
+                image_data["author_id"]
+            ))
+            full = len(self.authors) + len(self.images) >= self.max_ops
+        if full:
+            self.flush()
+
+    def _append_journal(self, image_data):
+        with self.journal_lock:
+            if self.journal_file is None:
+                os.makedirs(os.path.dirname(self.journal), exist_ok=True)
+                self.journal_file = open(self.journal, "a", encoding="utf-8")
+            self.journal_file.write(json_util.dumps(image_data) + "\n")
+            self.journal_file.flush()
+
+    # --- Flushing ---
+
+    def flush(self):
+        with self.write_lock:
+            with self.lock:
+                authors, self.authors = self.authors, []
+                images, self.images = self.images, []
+            if not authors and not images:
+                return
+            try:
+                scopes = set()
+                # Authors first: image counters are $inc'ed on author documents
+                if authors:
+                    result = bulk_write(self.db, "authors", authors)
+                    if write_errors(result):
+                        self.failed = True
+                    if result.get("nInserted"):
+                        scopes.add("authors")
+                if images:
+                    result = bulk_write(self.db, "images", [op for op, _ in images])
+                    if write_errors(result):
+                        # Keep the journal so the next run replays the rows that failed
+                        self.failed = True
+                    added = {}
+                    for upserted in result.get("upserted", []):
+                        author_id = images[upserted["index"]][1]
+                        added[author_id] = added.get(author_id, 0) + 1
+                    if added:
+                        self.db.authors.bulk_write(
+                            [pymongo.UpdateOne({"_id": author_id}, image_added_update(count)) for author_id, count in added.items()],
+                            ordered=False
+                        )
+                        scopes.update(("images", "authors"))
+                if scopes:
+                    bump(self.db, *sorted(scopes))
+            except PyMongoError as e:
+                self.failed = True
+                print(f"Write-behind flush failed ({len(authors)} authors, {len(images)} images): {e}")
+
+    def _flush_loop(self):
+        while not self.closed:
+            self.wakeup.wait(self.interval)
+            self.flush()
+
+    def close(self):
+        """Write everything pending; the journal is dropped once it's all in the DB"""
+        self.closed = True
+        self.wakeup.set()
+        self.flush()
+        with self.journal_lock:
+            if self.journal_file is not None:
+                self.journal_file.close()
+                self.journal_file = None
+            if not self.failed and os.path.exists(self.journal):
+                os.remove(self.journal)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- Crash recovery ---
+
+    def replay(self):
+        """Queue journaled images whose file exists but whose row never made it.
+        Returns the number of rows recovered."""
+        if not os.path.exists(self.journal):
+            return 0
+        entries = {}
+        with open(self.journal, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    image_data = json_util.loads(line)
+                except ValueError:
+                    continue  # Torn last line from the crash
+                if os.path.exists(image_data.get("local_path", "")):
+                    entries[image_data["_id"]] = image_data
+
+        ids = list(entries)
+        existing = set()
+        for i in range(0, len(ids), 1000):
+            existing.update(doc["_id"] for doc in self.db.images.find({"_id": {"$in": ids[i:i + 1000]}}, {"_id": 1}))
+        missing = [image_data for image_id, image_data in entries.items() if image_id not in existing]
+        for image_data in missing:
+            # Still in the journal file, which is kept until the next clean close
+            self.upsert_image(image_data, journaled=True)
+        if missing:
+            print(f"Recovering {len(missing)} downloaded images without database rows")
+        return len(missing)